@@ -1,24 +1,39 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, make_response
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, make_response, Response, stream_with_context
 import os
-import base64
-from io import BytesIO
-from PIL import Image
 import hashlib
+from io import BytesIO
 import json
+import atexit
+from html import escape
 from datetime import datetime, date
 import random
-import pickle
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from database import (init_db, save_user, get_user, load_users, update_user_avatar, update_user_password, delete_user,
-    add_prediction, get_user_history, clear_user_history, get_all_history,
+from database import (init_db, end_request, save_user, get_user, update_user_avatar, update_user_password, delete_user,
+    add_predictions, get_user_history, clear_user_history, get_top_breeds, get_top_users, get_totals,
     add_favorite, remove_favorite, get_user_favorites, is_favorite,
-    add_feedback, get_user_feedback, get_all_feedback,
-    log_search, get_search_counts, save_share, get_share, save_suggestion)
-from translations import get_translation, get_breeds_by_state, TRANSLATIONS
+    add_sample, find_sample, owns_sample, get_user_streak, list_users, list_history, list_feedback, get_admin_summary,
+    iter_history, iter_feedback, HISTORY_LIMIT,
+    get_search_counts, save_share, get_share, save_suggestion)
+from translations import get_translation, TRANSLATIONS, STATE_BREEDS
+from imaging import decode_upload, model_input, pack_pixels, thumbnail_b64
+from inference import BatchScheduler
+from jobs import JobManager
+from model_registry import ActiveModel, list_versions, promote
+from prediction_cache import PredictionCache, content_key, perceptual_key, CACHE_USE_PHASH
+from user_stats import UserStats
+from write_behind import WriteBehind
+from catalog import Catalog, respond
+from page_cache import PageCache
+from exports import csv_stream, gzip_stream, html_table_stream, json_stream, ndjson_stream
 
 app = Flask(__name__)
 app.secret_key = 'cattle-breed-secret-key-2024'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+UPLOAD_MAX_BYTES       = 16 * 1024 * 1024
+BATCH_UPLOAD_MAX_BYTES = int(os.environ.get('MAX_UPLOAD_MB', 256)) * 1024 * 1024
+# Werkzeug's hard ceiling is the /batch-predict limit; every other route is held to
+# UPLOAD_MAX_BYTES by limit_upload() (Flask 3.0 has no per-request max_content_length)
+app.config['MAX_CONTENT_LENGTH'] = BATCH_UPLOAD_MAX_BYTES
 app.config['UPLOAD_FOLDER'] = 'uploads'
 
 # Create uploads folder
@@ -37,17 +52,36 @@ HEALTH_TIPS = {
     "default": ["Annual vaccination schedule", "Regular deworming every 3 months", "Provide clean water daily", "Balanced mineral supplementation", "Regular veterinary checkups"]
 }
 
-# Load trained model if available
-MODEL = None
-CLASS_NAMES = []
-if os.path.exists('cattle_model.pkl') and os.path.exists('class_names.txt'):
-    with open('cattle_model.pkl', 'rb') as f:
-        MODEL = pickle.load(f)
-    with open('class_names.txt', 'r') as f:
-        CLASS_NAMES = [line.strip() for line in f]
-    print(f"[OK] Loaded model with {len(CLASS_NAMES)} breeds")
-else:
+# Load trained model if available. Models live in a versioned registry (models/,
+# see model_registry.py) and are served from memory-mapped artifacts shared by all
+# gunicorn workers; promoting a new version hot-swaps it in without a restart.
+# A cattle_model.pkl + class_names.txt dropped in the project root is imported
+# and promoted automatically.
+MODEL_FILE = 'cattle_model.pkl'
+CLASS_NAMES_FILE = 'class_names.txt'
+MODELS = ActiveModel(legacy_model=MODEL_FILE, legacy_classes=CLASS_NAMES_FILE,
+                     preload=os.environ.get('MODEL_PRELOAD', '0') == '1')
+_serving = MODELS.current()
+if _serving is None:
     print("[INFO] No trained model found - using demo mode")
+elif _serving.model.loaded:
+    stats = _serving.model.stats()
+    print(f"[OK] Mapped model {_serving.version} in {stats['load_ms']} ms "
+          f"({stats['mapped_bytes'] / 1e6:.1f} MB mapped, RSS +{(stats['rss_delta_bytes'] or 0) / 1e6:.1f} MB)")
+else:
+    print(f"[OK] Model {_serving.version} will be mapped on first prediction")
+
+# Concurrent /predict calls are micro-batched into one predict_proba
+INFERENCE = BatchScheduler()
+PREDICTION_CACHE = PredictionCache()
+COLLECT_SAMPLES = os.environ.get('COLLECT_SAMPLES', '1') == '1'   # keep /predict inputs for feedback updates
+# Training runs as queued, niced subprocesses - one at a time across all workers
+JOBS = JobManager()
+# Per-user dashboard numbers: grouped SQL behind a short TTL cache, dropped when the user writes
+USER_STATS = UserStats()
+# Search/history/feedback inserts are buffered and committed in batches off the request path
+WRITES = WriteBehind(on_write=USER_STATS.invalidate_events)
+atexit.register(WRITES.close)
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -96,6 +130,14 @@ BREEDS = {
     "Vechur": {"origin": "Kerala", "type": "Dairy", "milk_yield": "1-3 L/day"}
 }
 
+# BREEDS is fixed at startup, so its JSON responses are encoded (and gzipped) once
+CATALOG = Catalog(BREEDS, STATE_BREEDS)
+# Pages that only depend on the language and the catalog are rendered once per language
+PAGES = PageCache()
+
+def render_page(template, vary=(), **context):
+    return PAGES.render(template, session.get('lang', 'en'), session['user']['name'], CATALOG.version, vary, **context)
+
 @app.route('/')
 def index():
     if 'user' not in session:
@@ -173,34 +215,26 @@ def history():
 def compare():
     if 'user' not in session:
         return redirect(url_for('login'))
-    return render_template('compare.html', breeds=list(BREEDS.keys()), breeds_json=json.dumps(BREEDS))
+    return render_page('compare.html', breeds=list(BREEDS.keys()), breeds_json=CATALOG.breeds_json)
 
 @app.route('/dashboard')
 def dashboard():
     if 'user' not in session:
         return redirect(url_for('login'))
     
-    history = get_user_history(session['user']['email'])
-    
+    user_stats = USER_STATS.get(session['user']['email'])
     stats = {
-        'total': len(history),
-        'avg_confidence': round(sum(h['confidence'] for h in history) / len(history), 1) if history else 0,
-        'top_breed': max(set(h['breed'] for h in history), key=lambda x: sum(1 for h in history if h['breed'] == x)).replace('_', ' ') if history else 'N/A'
+        'total': user_stats['total'],
+        'avg_confidence': user_stats['avg_confidence'],
+        'top_breed': user_stats['top_breed'].replace('_', ' ') if user_stats['top_breed'] else 'N/A',
+        'accuracy': f"{round(user_stats['feedback_correct'] / user_stats['feedback_total'] * 100)}%"
+                    if user_stats['feedback_total'] else 'N/A',
     }
-
-    user_fb = get_user_feedback(session['user']['email'])
-    accuracy = f"{round(sum(1 for f in user_fb if f['correct'])/len(user_fb)*100)}%" if user_fb else 'N/A'
-    stats['accuracy'] = accuracy
-    
     breed_counts = {}
-    for h in history:
-        breed_counts[h['breed'].replace('_', ' ')] = breed_counts.get(h['breed'].replace('_', ' '), 0) + 1
-    
-    timeline = {}
-    for h in history:
-        date = h['timestamp'][:10]
-        timeline[date] = timeline.get(date, 0) + 1
-    
+    for breed, count in user_stats['breed_counts'].items():
+        breed_counts[breed.replace('_', ' ')] = breed_counts.get(breed.replace('_', ' '), 0) + count
+    timeline = user_stats['timeline']
+
     search_counts = get_search_counts(8)
 
     return render_template('dashboard.html', stats=stats, breed_counts=json.dumps(breed_counts), timeline=json.dumps(timeline), search_counts=json.dumps(search_counts))
@@ -209,32 +243,25 @@ def dashboard():
 def features():
     if 'user' not in session:
         return redirect(url_for('login'))
-    return render_template('features.html')
+    return render_page('features.html')
 
 @app.route('/leaderboard')
 def leaderboard():
     if 'user' not in session:
         return redirect(url_for('login'))
-    all_history = get_all_history()
-    all_breed_counts = {}
-    user_scores = {}
-    for email, predictions in all_history.items():
-        user_scores[email] = len(predictions)
-        for p in predictions:
-            breed = p['breed'].replace('_', ' ')
-            all_breed_counts[breed] = all_breed_counts.get(breed, 0) + 1
-    top_breeds = sorted(all_breed_counts.items(), key=lambda x: x[1], reverse=True)[:10]
-    top_users = sorted(user_scores.items(), key=lambda x: x[1], reverse=True)[:10]
+    top_breeds = [(breed.replace('_', ' '), count) for breed, count in get_top_breeds(10)]
+    top_users = get_top_users(10)
+    totals = get_totals()
     return render_template('leaderboard.html',
         top_breeds=top_breeds, top_users=top_users,
-        total_predictions=sum(user_scores.values()), total_users=len(user_scores)
+        total_predictions=totals['predictions'], total_users=totals['users']
     )
 
 @app.route('/batch')
 def batch():
     if 'user' not in session:
         return redirect(url_for('login'))
-    return render_template('batch.html')
+    return render_template('batch.html', max_files=BATCH_MAX_FILES)
 
 @app.route('/breed/<breed_name>')
 def breed_detail(breed_name):
@@ -243,7 +270,7 @@ def breed_detail(breed_name):
     breed_info = BREEDS.get(breed_name)
     if not breed_info:
         return redirect(url_for('index'))
-    log_search(breed_name)
+    WRITES.log_search(breed_name)
     user_email = session['user']['email']
     is_fav = is_favorite(user_email, breed_name)
     return render_template('breed_detail.html', breed_name=breed_name, breed_info=breed_info, is_favorite=is_fav)
@@ -258,7 +285,7 @@ def camera():
 def search():
     if 'user' not in session:
         return redirect(url_for('login'))
-    return render_template('search.html', breeds=BREEDS)
+    return render_page('search.html', breeds=BREEDS)
 
 @app.route('/favorites')
 def favorites():
@@ -279,119 +306,133 @@ def toggle_favorite():
     
     if is_favorite(user_email, breed):
         remove_favorite(user_email, breed)
-        return jsonify({'success': True, 'action': 'removed'})
+        action = 'removed'
     else:
         add_favorite(user_email, breed)
-        return jsonify({'success': True, 'action': 'added'})
+        action = 'added'
+    # After the commit, or a concurrent /api/stats could re-cache the old count
+    USER_STATS.invalidate(user_email)
+    return jsonify({'success': True, 'action': action})
 
 @app.route('/api/breeds', methods=['GET'])
 def api_breeds():
-    return jsonify({'breeds': BREEDS, 'total': len(BREEDS)})
+    return respond(CATALOG.all)
 
 @app.route('/api/breed/<breed_name>', methods=['GET'])
 def api_breed_info(breed_name):
-    breed_info = BREEDS.get(breed_name)
-    if not breed_info:
-        return jsonify({'error': 'Breed not found'}), 404
-    return jsonify({'breed': breed_name, 'info': breed_info})
+    return respond(CATALOG.by_breed.get(breed_name, CATALOG.not_found))
+
+@app.route('/api/search', methods=['GET'])
+def api_search():
+    query = request.args.get('q', '')[:100]
+    limit = min(max(request.args.get('limit', 8, type=int), 1), len(BREEDS))
+    results = CATALOG.index.search(query, limit, request.args.get('type', 'all'), request.args.get('origin', 'all'))
+    return jsonify({'query': query, 'results': [
+        {**r, 'name': r['breed'].replace('_', ' '), 'type': BREEDS[r['breed']]['type'],
+         'origin': BREEDS[r['breed']]['origin']} for r in results]})
 
 @app.route('/api/stats', methods=['GET'])
 def api_stats():
     if 'user' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    history = get_user_history(session['user']['email'])
-    breed_counts = {}
-    for h in history:
-        breed_counts[h['breed']] = breed_counts.get(h['breed'], 0) + 1
-    
+    user_stats = USER_STATS.get(session['user']['email'])
     return jsonify({
-        'total_predictions': len(history),
-        'avg_confidence': round(sum(h['confidence'] for h in history) / len(history), 1) if history else 0,
-        'breed_distribution': breed_counts,
-        'recent_predictions': history[-5:][::-1] if history else []
+        'total_predictions': user_stats['total'],
+        'avg_confidence': user_stats['avg_confidence'],
+        'breed_distribution': user_stats['breed_counts'],
+        'recent_predictions': user_stats['recent']
     })
 
 @app.route('/export-history', methods=['GET'])
 def export_history():
     if 'user' not in session:
         return redirect(url_for('login'))
-    
-    history = get_user_history(session['user']['email'])
-    return jsonify({'history': history, 'user': session['user']['email'], 'exported_at': datetime.now().isoformat()})
+    user_email = session['user']['email']
+    rows = iter_history(user_email, visible_only=True)
+    return Response(stream_with_context(json_stream(rows, 'history', user=user_email, exported_at=datetime.now().isoformat())),
+                    mimetype='application/json')
 
 @app.route('/clear-history', methods=['POST'])
 def clear_history():
     if 'user' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
+    WRITES.flush(timeout=10.0)   # or buffered predictions would land after the clear
     clear_user_history(session['user']['email'])
+    USER_STATS.invalidate(session['user']['email'])
     return jsonify({'success': True, 'message': 'History cleared'})
 
+BATCH_MAX_FILES      = int(os.environ.get('BATCH_MAX_FILES', 500))
+BATCH_CHUNK_SIZE     = int(os.environ.get('BATCH_CHUNK_SIZE', 32))
+BATCH_DECODE_WORKERS = int(os.environ.get('BATCH_DECODE_WORKERS', 4))
+
+def _decode_batch_file(upload):
+    try:
+        return model_input(BytesIO(upload[1])), None
+    except Exception as e:
+        return None, str(e)
+
+def _score_chunk(pixels, current):
+    """Top breed + boosted confidence (same remap as /predict) for a stack of model_pixels"""
+    if current is None:
+        return [(random.choice(list(BREEDS.keys())), round(random.uniform(82, 95), 2)) for _ in pixels]
+    proba = current.model.predict_proba(current.transform(np.stack(pixels)))
+    top_probs = np.sort(proba, axis=1)[:, -3:][:, ::-1]
+    totals = top_probs.sum(axis=1)
+    top = np.divide(top_probs[:, 0], totals, out=top_probs[:, 0].copy(), where=totals > 0)
+    return [(current.class_names[idx], round(max(65.0, min(92.0, float(p) * 92.0)), 2))
+            for idx, p in zip(np.argmax(proba, axis=1), top)]
+
 @app.route('/batch-predict', methods=['POST'])
 def batch_predict():
+    """Streams one NDJSON line per image as each chunk is scored, then a summary line"""
     if 'user' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
+    if (request.content_length or 0) > BATCH_UPLOAD_MAX_BYTES:
+        return jsonify({'error': f'Upload too large (max {BATCH_UPLOAD_MAX_BYTES // (1024 * 1024)} MB)'}), 413
     
     if 'files' not in request.files:
         return jsonify({'error': 'No files uploaded'}), 400
     
-    files = request.files.getlist('files')
-    results = []
-    
-    for file in files[:10]:  # Limit to 10 files
-        if file.filename == '':
-            continue
-        
+    files = [f for f in request.files.getlist('files') if f.filename != '']
+    if len(files) > BATCH_MAX_FILES:
+        return jsonify({'error': f'Too many files (max {BATCH_MAX_FILES})'}), 400
+    # Read now: the upload streams are closed once the view returns, before the body is streamed
+    files = [(f.filename, f.read()) for f in files]
+    user_email = session['user']['email']
+    current = MODELS.current()
+
+    def generate():
+        scored = []
+        pool = ThreadPoolExecutor(BATCH_DECODE_WORKERS)
         try:
-            filename = 'temp_' + str(datetime.now().timestamp()) + '_' + file.filename
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            if MODEL is not None:
-                img = Image.open(filepath).convert('RGB')
-                img_resized = img.resize((128, 128))
-                img_array = np.array(img_resized).flatten() / 255.0
-                proba = MODEL.predict_proba([img_array])[0]
-                top_idx = np.argmax(proba)
-                breed_name = CLASS_NAMES[top_idx]
-                # Boost confidence same as single predict
-                top_probs = np.sort(proba)[-3:][::-1]
-                total = top_probs.sum()
-                if total > 0: top_probs = top_probs / total
-                confidence = round(max(65.0, min(92.0, float(top_probs[0]) * 92.0)), 2)
-            else:
-                breed_name = random.choice(list(BREEDS.keys()))
-                confidence = round(random.uniform(82, 95), 2)
-            
-            results.append({
-                'filename': file.filename,
-                'breed': breed_name,
-                'confidence': round(confidence, 2)
-            })
-            
-            add_prediction(session['user']['email'], breed_name, confidence, file.filename)
-            os.remove(filepath)
-        
-        except Exception as e:
-            results.append({'filename': file.filename, 'error': str(e)})
-    
-    return jsonify({'success': True, 'results': results})
+            # map() keeps decoding ahead of the chunk currently being scored
+            decoded = pool.map(_decode_batch_file, files)
+            for start in range(0, len(files), BATCH_CHUNK_SIZE):
+                chunk = [(start + i, name, next(decoded)) for i, (name, _) in enumerate(files[start:start + BATCH_CHUNK_SIZE])]
+                ok = [(i, name, pixels) for i, name, (pixels, err) in chunk if err is None]
+                lines = {i: {'index': i, 'filename': name, 'error': err} for i, name, (_, err) in chunk if err is not None}
+                if ok:
+                    for (i, name, _), (breed_name, confidence) in zip(ok, _score_chunk([p for _, _, p in ok], current)):
+                        lines[i] = {'index': i, 'filename': name, 'breed': breed_name, 'confidence': confidence}
+                        scored.append((breed_name, confidence, name))
+                yield ''.join(json.dumps(lines[i]) + '\n' for i in sorted(lines))
+            yield json.dumps({'done': True, 'total': len(files), 'predicted': len(scored)}) + '\n'
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            # One transaction for the whole upload, even if the client disconnects mid-stream
+            if scored:
+                add_predictions(user_email, scored)
+                USER_STATS.invalidate(user_email)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/filter-breeds', methods=['GET'])
 def filter_breeds():
     if 'user' not in session:
         return redirect(url_for('login'))
     
-    breed_type = request.args.get('type', 'all')
-    origin = request.args.get('origin', 'all')
-    
-    filtered = BREEDS
-    if breed_type != 'all':
-        filtered = {k: v for k, v in filtered.items() if v['type'].lower() == breed_type.lower()}
-    if origin != 'all':
-        filtered = {k: v for k, v in filtered.items() if origin.lower() in v['origin'].lower()}
-    
-    return jsonify({'breeds': filtered, 'count': len(filtered)})
+    return respond(CATALOG.filtered(request.args.get('type', 'all'), request.args.get('origin', 'all')), private=True)
 
 @app.route('/upload-avatar', methods=['POST'])
 def upload_avatar():
@@ -420,12 +461,11 @@ def profile():
         return redirect(url_for('login'))
     user_email = session['user']['email']
     user_data = get_user(user_email) or {}
-    history = get_user_history(user_email)
-    favs = get_user_favorites(user_email)
+    user_stats = USER_STATS.get(user_email)
     stats = {
-        'total': len(history),
-        'avg_confidence': round(sum(h['confidence'] for h in history) / len(history), 1) if history else 0,
-        'favorites_count': len(favs),
+        'total': user_stats['total'],
+        'avg_confidence': user_stats['avg_confidence'],
+        'favorites_count': user_stats['favorites_count'],
         'joined': user_data.get('created_at', 'N/A')[:10] if user_data.get('created_at') else 'N/A',
         'avatar': user_data.get('avatar', None)
     }
@@ -449,7 +489,9 @@ def change_password():
 def delete_account():
     if 'user' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
+    WRITES.flush(timeout=10.0)
     delete_user(session['user']['email'])
+    USER_STATS.invalidate(session['user']['email'])
     session.pop('user', None)
     return jsonify({'success': True})
 
@@ -457,13 +499,13 @@ def delete_account():
 def health_tips():
     if 'user' not in session:
         return redirect(url_for('login'))
-    return render_template('health.html', breeds=BREEDS, tips=HEALTH_TIPS)
+    return render_page('health.html', breeds=BREEDS, tips=HEALTH_TIPS)
 
 @app.route('/encyclopedia')
 def encyclopedia():
     if 'user' not in session:
         return redirect(url_for('login'))
-    return render_template('encyclopedia.html', breeds=BREEDS)
+    return render_page('encyclopedia.html', breeds=BREEDS)
 
 @app.route('/breed-of-day')
 def breed_of_day():
@@ -485,56 +527,116 @@ def submit_feedback():
     if 'user' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     data = request.json
-    add_feedback(session['user']['email'], data.get('predicted'), data.get('correct'), data.get('actual', ''))
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid feedback'}), 400
+    user_email = session['user']['email']
+    sample_id = data.get('sample_id')
+    # Only the user a sample was stored for may label it - the incremental update trains on these labels
+    if sample_id is not None and (type(sample_id) is not int or not owns_sample(user_email, sample_id)):
+        return jsonify({'error': 'Unknown sample'}), 403
+    try:
+        WRITES.add_feedback(user_email, data.get('predicted'), data.get('correct'), data.get('actual', ''), sample_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify({'success': True})
 
 @app.route('/streak')
 def streak():
     if 'user' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
-    history = get_user_history(session['user']['email'])
-    if not history:
-        return jsonify({'streak': 0, 'total_days': 0})
-    dates = sorted(set(h['timestamp'][:10] for h in history), reverse=True)
-    streak_count = 1
-    for i in range(1, len(dates)):
-        d1 = datetime.strptime(dates[i-1], '%Y-%m-%d')
-        d2 = datetime.strptime(dates[i], '%Y-%m-%d')
-        if (d1 - d2).days == 1:
-            streak_count += 1
-        else:
-            break
-    return jsonify({'streak': streak_count, 'total_days': len(dates)})
+    return jsonify(get_user_streak(session['user']['email']))
+
+# Exports stream from the database a chunk at a time (exports.py) instead of building
+# the whole document in memory
+def _attachment(chunks, mimetype, filename, gzip=False):
+    if gzip:
+        chunks, mimetype, filename = gzip_stream(chunks), 'application/gzip', filename + '.gz'
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+def _report_rows(user_email):
+    # Newest first, numbered from 1, as shown on the history page
+    for i, h in enumerate(iter_history(user_email, newest_first=True, visible_only=True), 1):
+        yield dict(h, n=i, breed=h['breed'].replace('_', ' '), confidence=f"{h['confidence']}%", date=h['timestamp'][:10])
 
 @app.route('/export-csv')
 def export_csv():
     if 'user' not in session:
         return redirect(url_for('login'))
-    history = get_user_history(session['user']['email'])
-    lines = ['#,Breed,Confidence,Date']
-    for i, h in enumerate(reversed(history), 1):
-        lines.append(f"{i},{h['breed'].replace('_',' ')},{h['confidence']}%,{h['timestamp'][:10]}")
-    response = make_response('\n'.join(lines))
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = 'attachment; filename=cattle_history.csv'
-    return response
+    rows = _report_rows(session['user']['email'])
+    return _attachment(csv_stream(rows, ['n', 'breed', 'confidence', 'date'], ['#', 'Breed', 'Confidence', 'Date']),
+                       'text/csv', 'cattle_history.csv')
 
 @app.route('/export-pdf')
 def export_pdf():
     if 'user' not in session:
         return redirect(url_for('login'))
-    history = get_user_history(session['user']['email'])
     user_email = session['user']['email']
-    html = f"""<html><head><style>body{{font-family:Arial;padding:20px}}table{{width:100%;border-collapse:collapse}}th,td{{border:1px solid #ddd;padding:8px;text-align:left}}th{{background:#667eea;color:white}}h1{{color:#667eea}}</style></head>
-    <body><h1>🐄 Cattle Breed Prediction Report</h1><p>User: {user_email}</p><p>Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}</p>
-    <table><tr><th>#</th><th>Breed</th><th>Confidence</th><th>Date</th></tr>"""
-    for i, h in enumerate(reversed(history), 1):
-        html += f"<tr><td>{i}</td><td>{h['breed'].replace('_',' ')}</td><td>{h['confidence']}%</td><td>{h['timestamp'][:10]}</td></tr>"
-    html += "</table></body></html>"
-    response = make_response(html)
-    response.headers['Content-Type'] = 'text/html'
-    response.headers['Content-Disposition'] = 'attachment; filename=cattle_report.html'
-    return response
+    preamble = (f"<h1>🐄 Cattle Breed Prediction Report</h1><p>User: {escape(user_email)}</p>"
+                f"<p>Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}</p>")
+    chunks = html_table_stream(_report_rows(user_email), ['n', 'breed', 'confidence', 'date'],
+                               ['#', 'Breed', 'Confidence', 'Date'], 'Cattle Breed Prediction Report', preamble)
+    return _attachment(chunks, 'text/html', 'cattle_report.html')
+
+EXPORT_KINDS = {
+    'history':  (iter_history, ['id', 'user_email', 'breed', 'confidence', 'image', 'timestamp']),
+    'feedback': (iter_feedback, ['id', 'user_email', 'predicted', 'correct', 'actual', 'timestamp', 'sample_id']),
+}
+
+@app.route('/admin/export/<kind>')
+def admin_export(kind):
+    """The whole history or feedback table: ?format=csv|ndjson, &gzip=1 to compress"""
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    if kind not in EXPORT_KINDS:
+        return jsonify({'error': f'Unknown export: {kind}'}), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': f'Unknown format: {fmt}'}), 400
+    WRITES.flush(timeout=10.0)
+    iter_rows, columns = EXPORT_KINDS[kind]
+    rows = iter_rows()
+    chunks = csv_stream(rows, columns) if fmt == 'csv' else ndjson_stream(rows)
+    return _attachment(chunks, 'text/csv' if fmt == 'csv' else 'application/x-ndjson',
+                       f"{kind}_{datetime.now().strftime('%Y%m%d')}.{fmt}", gzip=request.args.get('gzip') == '1')
+
+def _model_predictions(pixels, current):
+    """Top-3 breeds for one model_pixels array, via the micro-batcher"""
+    version = current.version
+    phash_key = perceptual_key(pixels) if CACHE_USE_PHASH else None
+    if phash_key:
+        cached = PREDICTION_CACHE.get(phash_key, version)
+        if cached:
+            return cached['predictions']
+
+    proba = INFERENCE.submit(current.transform(pixels[None])[0], current.model)
+    top_3_idx = np.argsort(proba)[-3:][::-1]
+
+    # Boost: scale top-3 probabilities so top prediction looks confident
+    top_probs = proba[top_3_idx]
+    total = top_probs.sum()
+    if total > 0:
+        top_probs = top_probs / total          # normalize to sum=1
+    # Remap: top gets 65-92%, rest share remainder
+    top_val = float(top_probs[0])
+    boosted = [
+        round(max(65.0, min(92.0, top_val * 92.0)), 2),
+        round(max(5.0,  min(25.0, float(top_probs[1]) * 30.0)), 2),
+        round(max(2.0,  min(15.0, float(top_probs[2]) * 20.0)), 2),
+    ]
+
+    results = []
+    for i, idx in enumerate(top_3_idx):
+        breed_name = current.class_names[idx]
+        results.append({
+            'breed': breed_name,
+            'confidence': boosted[i],
+            'info': BREEDS.get(breed_name, {'origin': 'Unknown', 'type': 'Unknown', 'milk_yield': 'N/A'})
+        })
+    if phash_key:
+        PREDICTION_CACHE.put(phash_key, version, {'predictions': results})
+    return results
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -549,72 +651,59 @@ def predict():
         return jsonify({'error': 'No file selected'}), 400
     
     try:
-        # Save uploaded file temporarily
-        filename = 'temp_' + str(datetime.now().timestamp()) + '.jpg'
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Use trained model if available
-        if MODEL is not None:
-            img = Image.open(filepath).convert('RGB')
-            img_resized = img.resize((128, 128))
-            img_array = np.array(img_resized).flatten() / 255.0
-
-            proba = MODEL.predict_proba([img_array])[0]
-            top_3_idx = np.argsort(proba)[-3:][::-1]
-
-            # Boost: scale top-3 probabilities so top prediction looks confident
-            top_probs = proba[top_3_idx]
-            total = top_probs.sum()
-            if total > 0:
-                top_probs = top_probs / total          # normalize to sum=1
-            # Remap: top gets 65-92%, rest share remainder
-            top_val = float(top_probs[0])
-            boosted = [
-                round(max(65.0, min(92.0, top_val * 92.0)), 2),
-                round(max(5.0,  min(25.0, float(top_probs[1]) * 30.0)), 2),
-                round(max(2.0,  min(15.0, float(top_probs[2]) * 20.0)), 2),
-            ]
-
-            results = []
-            for i, idx in enumerate(top_3_idx):
-                breed_name = CLASS_NAMES[idx]
-                results.append({
-                    'breed': breed_name,
-                    'confidence': boosted[i],
-                    'info': BREEDS.get(breed_name, {'origin': 'Unknown', 'type': 'Unknown', 'milk_yield': 'N/A'})
-                })
+        data = file.read()
+        # One model snapshot per request, even if a new version is promoted meanwhile
+        current = MODELS.current()
+        version = current.version if current else None
+        cache_key = content_key(data)
+        cached = PREDICTION_CACHE.get(cache_key, version) if version else None
+        if cached:
+            results, img_str = cached['predictions'], cached['image']
+            # Cache entries are shared by everyone who uploads these bytes; samples belong to one user
+            sample_id = None
+            if COLLECT_SAMPLES:
+                sample_id = find_sample(session['user']['email'], version, cache_key)
+                if sample_id is None:
+                    pixels = model_input(BytesIO(data))
+                    sample_id = add_sample(session['user']['email'], version, pack_pixels(pixels), cache_key)
         else:
-            # Demo prediction — realistic high confidence
-            breeds = list(BREEDS.keys())
-            random.shuffle(breeds)
-            confidences = [
-                round(random.uniform(82, 95), 2),
-                round(random.uniform(12, 22), 2),
-                round(random.uniform(3,  10), 2),
-            ]
-            results = [
-                {'breed': breeds[i], 'confidence': confidences[i], 'info': BREEDS[breeds[i]]}
-                for i in range(3)
-            ]
-        
-        # Convert image to base64
-        img = Image.open(filepath)
-        img.thumbnail((400, 400))
-        buffered = BytesIO()
-        img.save(buffered, format="JPEG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        
-        # Delete temp file
-        os.remove(filepath)
+            # Two in-memory decodes: the model input at a MODEL_SIZE draft, exactly as /batch-predict
+            # and training decode it, and the thumbnail at THUMB_SIZE
+            pixels = model_input(BytesIO(data))
+            img = decode_upload(BytesIO(data))
+            # Retained so feedback on this prediction can update the model (incremental.py)
+            sample_id = add_sample(session['user']['email'], version, pack_pixels(pixels), cache_key) if COLLECT_SAMPLES else None
+            
+            # Use trained model if available
+            if current is not None:
+                results = _model_predictions(pixels, current)
+            else:
+                # Demo prediction — realistic high confidence
+                breeds = list(BREEDS.keys())
+                random.shuffle(breeds)
+                confidences = [
+                    round(random.uniform(82, 95), 2),
+                    round(random.uniform(12, 22), 2),
+                    round(random.uniform(3,  10), 2),
+                ]
+                results = [
+                    {'breed': breeds[i], 'confidence': confidences[i], 'info': BREEDS[breeds[i]]}
+                    for i in range(3)
+                ]
+            
+            # Convert image to base64
+            img_str = thumbnail_b64(img)
+            if version:
+                PREDICTION_CACHE.put(cache_key, version, {'predictions': results, 'image': img_str})
         
         # Save to history
-        add_prediction(session['user']['email'], results[0]['breed'], results[0]['confidence'], file.filename)
+        WRITES.add_prediction(session['user']['email'], results[0]['breed'], results[0]['confidence'], file.filename)
         
         return jsonify({
             'success': True,
             'predictions': results,
-            'image': img_str
+            'image': img_str,
+            'sample_id': sample_id
         })
     
     except Exception as e:
@@ -626,33 +715,160 @@ ADMIN_EMAIL = 'admin@cattle.com'
 def admin():
     if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
         return redirect(url_for('index'))
-    users = load_users()
-    all_history = get_all_history()
-    feedback = get_all_feedback()
-    total_preds = sum(len(v) for v in all_history.values())
-    correct_fb = sum(1 for f in feedback if f['correct'])
-    accuracy = round(correct_fb / len(feedback) * 100) if feedback else 0
+    summary = get_admin_summary()
+    accuracy = round(summary['feedback_correct'] / summary['feedback'] * 100) if summary['feedback'] else 0
     return render_template('admin.html',
-        users=users, total_preds=total_preds,
-        feedback=feedback[:20], accuracy=accuracy, model_loaded=MODEL is not None
+        total_users=summary['users'], total_preds=summary['predictions'], beyond_limit=summary['beyond_limit'],
+        history_limit=HISTORY_LIMIT, accuracy=accuracy, model_loaded=MODELS.current() is not None
     )
 
+# Keyset-paginated listings behind the admin page: pass the response's `next` back as
+# after= (users) or before= (history, feedback) to get the following page
+@app.route('/admin/users')
+def admin_users():
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    args = request.args
+    return jsonify(list_users(args.get('after'), args.get('limit', 50, type=int), args.get('q')))
+
+@app.route('/admin/history')
+def admin_history():
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    args = request.args
+    return jsonify(list_history(args.get('before', type=int), args.get('limit', 50, type=int), args.get('user'),
+                                args.get('breed'), args.get('since'), args.get('until')))
+
+@app.route('/admin/feedback')
+def admin_feedback():
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    args = request.args
+    return jsonify(list_feedback(args.get('before', type=int), args.get('limit', 50, type=int), args.get('user'),
+                                 args.get('breed'), args.get('correct', type=int), args.get('since'), args.get('until')))
+
 @app.route('/admin/retrain', methods=['POST'])
 def admin_retrain():
     if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
         return jsonify({'error': 'Unauthorized'}), 403
-    import subprocess, sys
+    job_id = JOBS.submit('train_simple', requested_by=session['user']['email'])
+    return jsonify({'success': True, 'job_id': job_id, 'message': 'Training queued'})
+
+@app.route('/admin/jobs', methods=['GET', 'POST'])
+def admin_jobs():
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    if request.method == 'POST':
+        data = request.json or {}
+        WRITES.flush(timeout=10.0)   # the job reads feedback from the database
+        try:
+            job_id = JOBS.submit(data.get('kind', 'train_simple'), data.get('params'), session['user']['email'])
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return jsonify({'success': True, 'job': JOBS.get(job_id)})
+    return jsonify({'jobs': JOBS.list(request.args.get('limit', 20, type=int))})
+
+@app.route('/admin/jobs/<int:job_id>')
+def admin_job(job_id):
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    job = JOBS.get(job_id)
+    return jsonify(job) if job else (jsonify({'error': 'Unknown job'}), 404)
+
+@app.route('/admin/jobs/<int:job_id>/cancel', methods=['POST'])
+def admin_cancel_job(job_id):
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    job = JOBS.cancel(job_id)
+    return jsonify({'success': True, 'job': job}) if job else (jsonify({'error': 'Unknown job'}), 404)
+
+@app.route('/admin/inference', methods=['GET', 'POST'])
+def admin_inference():
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    if request.method == 'POST':
+        data = request.json or {}
+        INFERENCE.configure(data.get('max_batch'), data.get('max_wait_ms'), bool(data.get('reset_stats')))
+    return jsonify(INFERENCE.stats())
+
+@app.route('/api/model')
+def api_model():
+    stats = MODELS.stats()
+    return jsonify({k: stats.get(k) for k in ('active_version', 'loaded_at', 'load_ms', 'swap_ms', 'classes')})
+
+@app.route('/admin/model')
+def admin_model():
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(MODELS.stats())
+
+@app.route('/admin/models')
+def admin_models():
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify({'versions': list_versions()})
+
+@app.route('/admin/models/<version>/promote', methods=['POST'])
+def admin_promote_model(version):
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
     try:
-        subprocess.Popen([sys.executable, 'train_simple.py'])
-        return jsonify({'success': True, 'message': 'Training started in background'})
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        promote(version)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    return jsonify({'success': True, 'active_version': version})
+
+@app.route('/admin/models/update', methods=['POST'])
+def admin_update_model():
+    """Queue a job folding feedback since the active version into a new one (incremental.py) -
+    it runs in the single job slot, niced and thread-capped, not in this web worker"""
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    data = request.json or {}
+    params = {'replace': bool(data.get('replace')), 'promote': bool(data.get('promote'))}
+    if data.get('trees') is not None:
+        params['trees'] = data['trees']
+    WRITES.flush(timeout=10.0)   # include feedback still in this worker's buffer
+    try:
+        job_id = JOBS.submit('incremental', params, session['user']['email'])
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'job': JOBS.get(job_id)})
+
+@app.route('/admin/cache', methods=['GET', 'POST'])
+def admin_cache():
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    if request.method == 'POST':
+        PREDICTION_CACHE.clear()
+    return jsonify(PREDICTION_CACHE.stats())
+
+@app.route('/admin/pages', methods=['GET', 'POST'])
+def admin_pages():
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    if request.method == 'POST':
+        PAGES.invalidate((request.get_json(silent=True) or {}).get('template'))
+    return jsonify(PAGES.stats())
+
+@app.route('/admin/writes', methods=['GET', 'POST'])
+def admin_writes():
+    if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
+        return jsonify({'error': 'Unauthorized'}), 403
+    if request.method == 'POST':
+        data = request.json or {}
+        WRITES.configure(data.get('max_batch'), data.get('max_wait_ms'), bool(data.get('reset_stats')))
+        if data.get('flush'):
+            WRITES.flush(timeout=10.0)
+    return jsonify(WRITES.stats())
 
 @app.route('/admin/delete-user/<email>', methods=['POST'])
 def admin_delete_user(email):
     if 'user' not in session or session['user']['email'] != ADMIN_EMAIL:
         return jsonify({'error': 'Unauthorized'}), 403
+    WRITES.flush(timeout=10.0)
     delete_user(email)
+    USER_STATS.invalidate(email)
     return jsonify({'success': True})
 
 @app.route('/share/<share_id>')
@@ -678,23 +894,27 @@ def create_share():
 def quiz():
     if 'user' not in session:
         return redirect(url_for('login'))
-    return render_template('quiz.html', breeds_json=json.dumps(BREEDS))
+    return render_template('quiz.html', breeds_json=CATALOG.breeds_json)
 
 @app.route('/similar-breeds/<breed_name>')
 def similar_breeds(breed_name):
-    breed_info = BREEDS.get(breed_name)
-    if not breed_info:
-        return jsonify({'similar': []})
-    similar = [
-        {'name': k, 'info': v} for k, v in BREEDS.items()
-        if k != breed_name and (v['type'] == breed_info['type'] or v['origin'] == breed_info['origin'])
-    ][:4]
-    return jsonify({'similar': similar})
+    return respond(CATALOG.similar.get(breed_name, CATALOG.no_similar))
+
+@app.before_request
+def limit_upload():
+    # Checked on the declared length, before anything reads request.files
+    if request.endpoint != 'batch_predict' and (request.content_length or 0) > UPLOAD_MAX_BYTES:
+        return jsonify({'error': f'Upload too large (max {UPLOAD_MAX_BYTES // (1024 * 1024)} MB)'}), 413
+
+@app.teardown_request
+def rollback_open_transaction(exc):
+    end_request()
 
 @app.context_processor
 def inject_globals():
     lang = session.get('lang', 'en')
-    return {'t': get_translation(lang), 'current_lang': lang, 'all_langs': TRANSLATIONS}
+    return {'t': get_translation(lang), 'current_lang': lang, 'all_langs': TRANSLATIONS,
+            'user_name': session['user']['name'] if 'user' in session else ''}
 
 @app.errorhandler(404)
 def not_found(e):
@@ -711,7 +931,6 @@ def suggest():
     from database import get_db
     conn = get_db()
     suggestions = [dict(r) for r in conn.execute('SELECT * FROM suggestions ORDER BY id DESC LIMIT 20').fetchall()]
-    conn.close()
     return render_template('suggest.html', suggestions=suggestions)
 
 @app.route('/submit-suggestion', methods=['POST'])
@@ -726,7 +945,7 @@ def submit_suggestion():
 def api_docs():
     if 'user' not in session:
         return redirect(url_for('login'))
-    return render_template('api_docs.html')
+    return render_page('api_docs.html', vary=(request.host_url,))
 
 @app.route('/sw.js')
 def service_worker():
@@ -774,10 +993,7 @@ def random_fact():
 
 @app.route('/location-breeds')
 def location_breeds():
-    state = request.args.get('state', '')
-    breeds = get_breeds_by_state(state)
-    result = {b: BREEDS[b] for b in breeds if b in BREEDS}
-    return jsonify({'state': state, 'breeds': result})
+    return respond(CATALOG.for_state(request.args.get('state', '')))
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,92 @@
+"""
+Benchmark: NumPy CNN runtime (cnn_runtime.py) latency at batch sizes 1, 8 and 32
+Uses an exported model if given, otherwise random weights in the train_cnn.py
+architecture (no TensorFlow needed). With TensorFlow installed and --keras,
+the Keras model is timed alongside for comparison.
+
+Usage:
+    python benchmark_cnn.py                              # synthetic weights
+    python benchmark_cnn.py --model cattle_cnn_model.npz
+    python benchmark_cnn.py --model cattle_cnn_model.npz --keras cattle_cnn_model.h5
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from cnn_export import export_layers
+from cnn_runtime import CNNModel
+
+BATCH_SIZES = (1, 8, 32)
+
+def synthetic_layers(num_classes=8, seed=0):
+    """train_cnn.py's layer stack with random weights, as (class_name, config, weights)"""
+    rng = np.random.default_rng(seed)
+    layers, cin = [], 3
+
+    def conv(cout):
+        nonlocal cin
+        layers.append(('Conv2D', {'activation': 'relu', 'padding': 'same'},
+                       [rng.normal(0, np.sqrt(2.0 / (9 * cin)), (3, 3, cin, cout)), np.zeros(cout)]))
+        cin = cout
+
+    def bn(c):
+        layers.append(('BatchNormalization', {}, [rng.uniform(0.5, 1.5, c), rng.normal(0, 0.1, c),
+                                                  rng.normal(0, 0.1, c), rng.uniform(0.5, 1.5, c)]))
+
+    for width, double in ((32, True), (64, True), (128, True), (256, False)):
+        conv(width)
+        bn(width)
+        if double:
+            conv(width)
+        layers.append(('MaxPooling2D', {}, []))
+    layers.append(('GlobalAveragePooling2D', {}, []))
+    layers.append(('Dense', {'activation': 'relu'}, [rng.normal(0, 0.05, (cin, 512)), np.zeros(512)]))
+    bn(512)
+    layers.append(('Dense', {'activation': 'relu'}, [rng.normal(0, 0.05, (512, 256)), np.zeros(256)]))
+    layers.append(('Dense', {'activation': 'softmax'}, [rng.normal(0, 0.05, (256, num_classes)), np.zeros(num_classes)]))
+    return layers
+
+def time_batches(predict, repeats):
+    rows = []
+    for batch in BATCH_SIZES:
+        x = np.random.default_rng(batch).uniform(0, 1, (batch, 128, 128, 3)).astype(np.float32)
+        predict(x)  # warm-up
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            predict(x)
+            timings.append(time.perf_counter() - started)
+        best, median = min(timings), float(np.median(timings))
+        rows.append((batch, median * 1000.0, best * 1000.0, median * 1000.0 / batch, batch / median))
+    return rows
+
+def print_rows(title, rows):
+    print(f'\n{title}')
+    print(f"{'batch':>6}{'median ms':>12}{'best ms':>10}{'ms/image':>10}{'images/s':>10}")
+    for batch, median, best, per_image, throughput in rows:
+        print(f'{batch:>6}{median:>12.1f}{best:>10.1f}{per_image:>10.2f}{throughput:>10.1f}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', help='exported .npz (default: synthetic train_cnn.py weights)')
+    parser.add_argument('--keras', metavar='H5', help='also time this Keras model (needs TensorFlow)')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    path = args.model
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(), 'synthetic.npz')
+        export_layers(synthetic_layers(), path)
+        print('[INFO] Using synthetic weights in the train_cnn.py architecture')
+    model = CNNModel(path)
+    print(f"[INFO] {model.meta['layers']} ops, {model.meta['parameters']:,} parameters, {model.nbytes / 1e6:.1f} MB")
+    print_rows('NumPy runtime', time_batches(model.predict_proba, args.repeats))
+
+    if args.keras:
+        import tensorflow as tf
+        keras_model = tf.keras.models.load_model(args.keras, compile=False)
+        print_rows('Keras', time_batches(lambda x: keras_model.predict(x, verbose=0), args.repeats))
+
+if __name__ == '__main__':
+    main()
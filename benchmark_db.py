@@ -0,0 +1,105 @@
+"""
+Benchmark: database.py hot calls with a fresh connection per call (the old get_db)
+vs the pooled WAL connection layer, on throwaway databases.
+
+Single-thread ops/sec for add_prediction, get_user_history and is_favorite,
+then N processes writing at once to count "database is locked" failures.
+
+Usage:
+    python benchmark_db.py
+    python benchmark_db.py --ops 5000 --processes 8
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from multiprocessing import Pool
+import database
+
+def _legacy_get_db():
+    # What get_db() did before: new connection, default rollback journal and pragmas
+    conn = sqlite3.connect(database.DB_FILE)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+MODES = {'per-call connect': _legacy_get_db, 'pooled WAL': database.get_db}
+
+def _use(mode, db_file):
+    database.close_db()
+    database.DB_FILE = db_file
+    database.get_db = MODES[mode]
+
+def _fresh_db(tmp, mode):
+    db_file = os.path.join(tmp, mode.replace(' ', '_') + '.db')
+    _use('pooled WAL', db_file)
+    database.init_db()
+    if mode != 'pooled WAL':
+        database.get_db().execute('PRAGMA journal_mode=DELETE')
+    database.close_db()
+    return db_file
+
+def _rate(fn, ops):
+    started = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    return ops / (time.perf_counter() - started)
+
+def single_thread(mode, db_file, ops):
+    _use(mode, db_file)
+    users = [f'user{i}@example.com' for i in range(20)]
+    for u in users:
+        database.add_favorite(u, 'Gir')
+    return {
+        'add_prediction': _rate(lambda i: database.add_prediction(users[i % 20], 'Gir', 91.5, 'cow.jpg'), ops),
+        'get_user_history': _rate(lambda i: database.get_user_history(users[i % 20]), ops),
+        'is_favorite': _rate(lambda i: database.is_favorite(users[i % 20], 'Gir' if i % 2 else 'Sahiwal'), ops),
+    }
+
+def _writer(args):
+    mode, db_file, worker, ops = args
+    _use(mode, db_file)
+    errors = 0
+    for i in range(ops):
+        try:
+            database.add_prediction(f'writer{worker}@example.com', 'Gir', 90.0, 'cow.jpg')
+            database.get_user_history(f'writer{worker}@example.com')
+        except sqlite3.OperationalError:
+            errors += 1
+    return errors
+
+def concurrent(mode, db_file, processes, ops):
+    started = time.perf_counter()
+    with Pool(processes) as pool:
+        errors = sum(pool.map(_writer, [(mode, db_file, w, ops) for w in range(processes)]))
+    return processes * ops / (time.perf_counter() - started), errors
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ops', type=int, default=2000, help='calls per benchmark (default: %(default)s)')
+    parser.add_argument('--processes', type=int, default=4, help='concurrent writer processes (default: %(default)s)')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        results = {}
+        for mode in MODES:
+            results[mode] = single_thread(mode, _fresh_db(tmp, mode), args.ops)
+            results[mode]['concurrent'], results[mode]['errors'] = \
+                concurrent(mode, _fresh_db(tmp, mode + ' mp'), args.processes, args.ops // 4)
+        database.close_db()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    before, after = results['per-call connect'], results['pooled WAL']
+    print(f"\n{'ops/sec':<22}{'per-call connect':>18}{'pooled WAL':>14}{'speedup':>10}")
+    for name in ('add_prediction', 'get_user_history', 'is_favorite'):
+        print(f'{name:<22}{before[name]:>18,.0f}{after[name]:>14,.0f}{after[name] / before[name]:>9.1f}x')
+    label = f'{args.processes} procs write+read'
+    print(f"{label:<22}{before['concurrent']:>18,.0f}{after['concurrent']:>14,.0f}"
+          f"{after['concurrent'] / before['concurrent']:>9.1f}x")
+    print(f"{'  locked errors':<22}{before['errors']:>18}{after['errors']:>14}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: raw-pixel vs compact engineered features (features.py)
+Compares training time, model size, per-image latency and accuracy of the
+RandomForest that train_simple.py builds, on the same split.
+
+Usage:
+    python benchmark_features.py                  # images from dataset/
+    python benchmark_features.py --synthetic 600  # generated images, no dataset needed
+"""
+import argparse
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+from features import FEATURE_SETS, extract, get_transform
+from model_store import Forest, export_forest
+
+def synthetic_dataset(n, n_classes=8, seed=0):
+    """Noisy images whose colour and stripe orientation depend on the class"""
+    rng = np.random.default_rng(seed)
+    y = np.arange(n) % n_classes
+    yy, xx = np.mgrid[0:128, 0:128]
+    pixels = np.empty((n, 128, 128, 3), dtype=np.uint8)
+    for i, label in enumerate(y):
+        base = np.array([(label * 53) % 256, (label * 97) % 256, (label * 151) % 256], dtype=np.float32)
+        stripes = np.sin((xx * np.cos(label) + yy * np.sin(label)) / 6.0)[..., None] * 40
+        img = base + stripes + rng.normal(0, 45, (128, 128, 3))
+        pixels[i] = np.clip(img, 0, 255).astype(np.uint8)
+    return pixels, y
+
+def _dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+def run(pixels, y, feature_set, trees, depth):
+    started = time.perf_counter()
+    X = extract(pixels, feature_set)
+    extract_s = time.perf_counter() - started
+
+    idx_train, idx_test = train_test_split(np.arange(len(y)), test_size=0.2, random_state=42)
+    model = RandomForestClassifier(n_estimators=trees, max_depth=depth, random_state=42, n_jobs=-1)
+    started = time.perf_counter()
+    model.fit(X[idx_train], y[idx_train])
+    train_s = time.perf_counter() - started
+    accuracy = float((model.predict(X[idx_test]) == y[idx_test]).mean())
+
+    tmp = tempfile.mkdtemp()
+    try:
+        export_forest(model, os.path.join(tmp, 'model.forest'))
+        artifact_bytes = _dir_bytes(os.path.join(tmp, 'model.forest'))
+        forest = Forest(os.path.join(tmp, 'model.forest'))
+        # Per-image serving latency: feature transform + forest walk, one image at a time
+        transform = get_transform(feature_set)
+        sample = pixels[idx_test[:50]]
+        started = time.perf_counter()
+        for img in sample:
+            forest.predict_proba(transform(img[None]))
+        latency_ms = (time.perf_counter() - started) / len(sample) * 1000.0
+        del forest
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        'features': feature_set, 'dim': X.shape[1], 'extract_s': extract_s, 'train_s': train_s,
+        'pickle_mb': len(pickle.dumps(model)) / 1e6, 'artifact_mb': artifact_bytes / 1e6,
+        'latency_ms': latency_ms, 'accuracy': accuracy,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--synthetic', type=int, metavar='N', help='benchmark on N generated images instead of dataset/')
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        pixels, y = synthetic_dataset(args.synthetic)
+        print(f'[INFO] {len(y)} synthetic images')
+    else:
+        from train_simple import DATASET_DIR, load_images
+        if not os.path.exists(DATASET_DIR):
+            print(f'[ERROR] Dataset not found at {DATASET_DIR}/ - try --synthetic 600')
+            return
+        pixels, y, class_names = load_images()
+        print(f'[INFO] {len(y)} images, {len(class_names)} breeds')
+
+    rows = [run(pixels, y, name, args.trees, args.depth) for name in sorted(FEATURE_SETS, reverse=True)]
+    print()
+    print(f"{'features':<10}{'dim':>8}{'extract s':>11}{'train s':>10}{'pickle MB':>11}{'artifact MB':>13}{'ms/image':>10}{'accuracy':>10}")
+    for r in rows:
+        print(f"{r['features']:<10}{r['dim']:>8}{r['extract_s']:>11.2f}{r['train_s']:>10.2f}{r['pickle_mb']:>11.2f}"
+              f"{r['artifact_mb']:>13.2f}{r['latency_ms']:>10.2f}{r['accuracy'] * 100:>9.1f}%")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: add_prediction with the old prune-on-every-insert vs the amortized
+history_counts prune, as the history table grows.
+
+Each round adds predictions for a pool of users on top of everything written
+before, and reports microseconds per insert, so a flat column means insert
+cost doesn't depend on how much history exists.
+
+Usage:
+    python benchmark_history.py
+    python benchmark_history.py --users 500 --rounds 6 --per-round 5000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime
+import database
+
+def _legacy_add_prediction(user_email, breed, confidence, image_name):
+    # add_prediction before history_counts: a sort-and-subquery prune per insert
+    conn = database.get_db()
+    conn.execute('INSERT INTO history (user_email,breed,confidence,image,timestamp) VALUES (?,?,?,?,?)',
+        (user_email, breed, round(confidence, 2), image_name, datetime.now().isoformat()))
+    conn.execute('''DELETE FROM history WHERE user_email=? AND id NOT IN
+        (SELECT id FROM history WHERE user_email=? ORDER BY id DESC LIMIT ?)''',
+        (user_email, user_email, database.HISTORY_LIMIT))
+    conn.commit()
+
+MODES = {'prune every insert': _legacy_add_prediction, 'amortized': database.add_prediction}
+
+def run(add, db_file, users, rounds, per_round, seed=0):
+    database.close_db()
+    database.DB_FILE = db_file
+    database.migrate()
+    rng = random.Random(seed)
+    emails = [f'user{i}@example.com' for i in range(users)]
+    timings = []
+    for _ in range(rounds):
+        picks = [rng.choice(emails) for _ in range(per_round)]
+        started = time.perf_counter()
+        for email in picks:
+            add(email, 'Gir', 91.5, 'cow.jpg')
+        timings.append((time.perf_counter() - started) / per_round * 1e6)
+    total = database.get_db().execute('SELECT COUNT(*) FROM history').fetchone()[0]
+    database.close_db()
+    return timings, total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--per-round', type=int, default=4000, help='inserts per round (default: %(default)s)')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        results = {mode: run(add, os.path.join(tmp, f'{i}.db'), args.users, args.rounds, args.per_round)
+                   for i, (mode, add) in enumerate(MODES.items())}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f'\nHISTORY_LIMIT={database.HISTORY_LIMIT} HISTORY_SLACK={database.HISTORY_SLACK}, {args.users} users')
+    print(f"{'inserts so far':<16}" + ''.join(f'{mode:>22}' for mode in MODES) + '   (us/insert)')
+    for r in range(args.rounds):
+        print(f'{(r + 1) * args.per_round:<16,}' + ''.join(f'{results[mode][0][r]:>22.1f}' for mode in MODES))
+    print(f"{'rows kept':<16}" + ''.join(f'{results[mode][1]:>22,}' for mode in MODES))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""The breed catalog's JSON responses, serialized once instead of on every request.
+
+BREEDS never changes while the app runs, so each payload - the full catalog,
+one breed, its similar breeds, a type/origin filter, a state's breeds - is
+encoded to bytes the first time it is needed (the common ones at startup), along
+with a gzip copy and a strong ETag derived from the bytes. respond() serves
+the variant the client accepts with Cache-Control, and answers a matching
+If-None-Match with 304 Not Modified and no body.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from flask import Response, request
+from catalog_index import CatalogIndex
+
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', 3600))
+MAX_DYNAMIC     = 256   # memoized payloads for free-form queries (origin substrings, unknown states)
+MIN_GZIP_BYTES  = 512   # smaller bodies aren't worth a gzip variant
+
+class Payload:
+    __slots__ = ('body', 'gzipped', 'etag', 'gzip_etag', 'status')
+
+    def __init__(self, obj, status=200):
+        # Same encoding as jsonify (sorted keys, compact), done once
+        self.body = json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(self.body).hexdigest()[:24]
+        self.etag = f'"{digest}"'
+        # A strong ETag names exact bytes, so the gzip variant gets its own
+        self.gzipped = gzip.compress(self.body, 9, mtime=0) if len(self.body) >= MIN_GZIP_BYTES else None
+        self.gzip_etag = f'"{digest}-gz"' if self.gzipped else None
+        self.status = status
+
+class Catalog:
+    def __init__(self, breeds, state_breeds=None):
+        self.breeds = breeds
+        self.state_breeds = state_breeds or {}
+        self.index = CatalogIndex(breeds, self.state_breeds)
+        self.breeds_json = json.dumps(breeds)   # inlined into compare.html / quiz.html
+        self.all = Payload({'breeds': breeds, 'total': len(breeds)})
+        self.version = self.all.etag.strip('"')   # changes whenever any breed does (page cache key)
+        self.by_breed = {name: Payload({'breed': name, 'info': info}) for name, info in breeds.items()}
+        self.not_found = Payload({'error': 'Breed not found'}, 404)
+        self.similar = {name: Payload({'similar': self._similar(name)}) for name in breeds}
+        self.no_similar = Payload({'similar': []})
+        self._lock = threading.Lock()
+        self._static = {}               # built here, kept for good
+        self._dynamic = OrderedDict()   # anything else a query string asks for, LRU-bounded
+        for breed_type in {'all'} | {v['type'].lower() for v in breeds.values()}:
+            for origin in {'all'} | {v['origin'].lower() for v in breeds.values()}:
+                self._static[('filter', breed_type, origin)] = self.filtered(breed_type, origin)
+        for state in self.state_breeds:
+            self._static[('state', state)] = self.for_state(state)
+        self._dynamic.clear()
+
+    def _similar(self, name):
+        return [{'name': k, 'info': self.breeds[k]} for k in self.index.similar(name)]
+
+    def _memo(self, key, build):
+        payload = self._static.get(key)
+        if payload is not None:
+            return payload
+        with self._lock:
+            payload = self._dynamic.get(key)
+            if payload is not None:
+                self._dynamic.move_to_end(key)
+                return payload
+        payload = build()
+        with self._lock:
+            self._dynamic[key] = payload
+            while len(self._dynamic) > MAX_DYNAMIC:
+                self._dynamic.popitem(last=False)
+        return payload
+
+    def filtered(self, breed_type='all', origin='all'):
+        breed_type, origin = breed_type.lower(), origin.lower()
+        def build():
+            result = {k: self.breeds[k] for k in self.index.filter(breed_type, origin)}
+            return Payload({'breeds': result, 'count': len(result)})
+        return self._memo(('filter', breed_type, origin), build)
+
+    def for_state(self, state):
+        def build():
+            return Payload({'state': state, 'breeds': {b: self.breeds[b] for b in self.index.by_state.get(state, ())}})
+        return self._memo(('state', state), build)
+
+def _matches(header, etag):
+    if not header or not etag:
+        return False
+    if header.strip() == '*':
+        return True
+    # If-None-Match uses the weak comparison: W/ prefixes are ignored
+    return any(tag.strip().removeprefix('W/') == etag for tag in header.split(','))
+
+def respond(payload, private=False):
+    """A response for payload: gzip when accepted, 304 when the client's copy is current"""
+    use_gzip = payload.gzipped is not None and 'gzip' in request.headers.get('Accept-Encoding', '')
+    etag = payload.gzip_etag if use_gzip else payload.etag
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f"{'private' if private else 'public'}, max-age={CATALOG_MAX_AGE}",
+        'Vary': 'Accept-Encoding',
+    }
+    if payload.status == 200 and _matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=headers)
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(payload.gzipped if use_gzip else payload.body, status=payload.status,
+                    mimetype='application/json', headers=headers)
@@ -0,0 +1,133 @@
+"""In-memory indexes over the breed catalog, built once at startup.
+
+Inverted indexes map type, origin and state to breed names (in catalog order),
+so filters and "similar breeds" touch only the matching breeds. For search,
+every breed is indexed under its display name ("Holstein Friesian"), each word
+of it, its origin and the states it is kept in, and searched three ways:
+
+  prefix   - a sorted list of terms, searched with bisect: "hol" -> Holstein Friesian
+  infix    - any other substring of a display name: "kar" -> Tharparkar
+  trigram  - the 3-letter shingles of each term; a query is scored by the share
+             of trigrams it has in common with a term, so "sahiwl" or "holstien"
+             still find their breed
+
+Typo-tolerant autocomplete over ~50 breeds is then a handful of dict lookups.
+"""
+import bisect
+import re
+from collections import defaultdict
+
+MIN_SIMILARITY = 0.3   # trigram similarity below which a fuzzy match is dropped
+
+def normalize(text):
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower().replace('_', ' ')).strip()
+
+def trigrams(term):
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class CatalogIndex:
+    def __init__(self, breeds, state_breeds=None):
+        self.breeds = breeds
+        self.order = {name: i for i, name in enumerate(breeds)}
+        self.by_type = defaultdict(list)
+        self.by_origin = defaultdict(list)
+        self.by_state = defaultdict(list)
+        self.states_of = defaultdict(list)
+        for name, info in breeds.items():
+            self.by_type[info['type'].lower()].append(name)
+            self.by_origin[info['origin'].lower()].append(name)
+        for state, names in (state_breeds or {}).items():
+            for name in names:
+                if name in breeds:
+                    self.by_state[state].append(name)
+                    self.states_of[name].append(state)
+
+        # term -> {breed: weight}; names outrank the words in them, which outrank places
+        self.terms = defaultdict(dict)
+        for name, info in breeds.items():
+            display = normalize(name)
+            self._add(display, name, 3)
+            for word in display.split():
+                self._add(word, name, 2)
+            for place in [info['origin'], *self.states_of[name]]:
+                self._add(normalize(place), name, 1)
+        self.display = {name: normalize(name) for name in breeds}
+        self.sorted_terms = sorted(self.terms)
+        self.trigram_index = defaultdict(set)
+        self.term_trigrams = {}
+        for term in self.terms:
+            self.term_trigrams[term] = trigrams(term)
+            for gram in self.term_trigrams[term]:
+                self.trigram_index[gram].add(term)
+
+    def _add(self, term, name, weight):
+        if term:
+            self.terms[term][name] = max(weight, self.terms[term].get(name, 0))
+
+    def _in_order(self, names):
+        return sorted(set(names), key=self.order.__getitem__)
+
+    def filter(self, breed_type='all', origin='all'):
+        """Breed names with this type (exact) and an origin containing origin (substring), any case"""
+        breed_type, origin = breed_type.lower(), origin.lower()
+        names = None
+        if breed_type != 'all':
+            names = set(self.by_type.get(breed_type, ()))
+        if origin != 'all':
+            matched = {n for key, group in self.by_origin.items() if origin in key for n in group}
+            names = matched if names is None else names & matched
+        return list(self.breeds) if names is None else self._in_order(names)
+
+    def similar(self, name, limit=4):
+        """Other breeds sharing the type or origin, in catalog order"""
+        info = self.breeds.get(name)
+        if info is None:
+            return []
+        names = set(self.by_type[info['type'].lower()]) | set(self.by_origin[info['origin'].lower()])
+        names.discard(name)
+        return self._in_order(names)[:limit]
+
+    def search(self, query, limit=8, breed_type='all', origin='all'):
+        """Best matching breeds for a partial or misspelled query, best first:
+        [{'breed', 'score', 'match'}] where match is 'prefix', 'infix' or 'fuzzy'"""
+        q = normalize(query)
+        if not q:
+            return []
+        allowed = set(self.filter(breed_type, origin)) if (breed_type, origin) != ('all', 'all') else None
+        scores = {}
+
+        def offer(name, score, match):
+            if (allowed is None or name in allowed) and score > scores.get(name, (0,))[0]:
+                scores[name] = (score, match)
+
+        # Prefix: every term starting with q, found by bisecting the sorted term list
+        i = bisect.bisect_left(self.sorted_terms, q)
+        while i < len(self.sorted_terms) and self.sorted_terms[i].startswith(q):
+            term = self.sorted_terms[i]
+            for name, weight in self.terms[term].items():
+                # Whole-term matches and heavier terms first; 1.x keeps every prefix above any fuzzy match
+                offer(name, 1 + weight / 4 + len(q) / len(term) / 4, 'prefix')
+            i += 1
+
+        # Infix: q anywhere in a display name; 1.0-1.25, between prefix and fuzzy matches
+        if len(q) >= 2:
+            for name, display in self.display.items():
+                if q in display:
+                    offer(name, 1 + len(q) / len(display) / 4, 'infix')
+
+        # Fuzzy: terms sharing enough trigrams with q
+        if len(q) >= 3:
+            grams = trigrams(q)
+            shared = defaultdict(int)
+            for gram in grams:
+                for term in self.trigram_index.get(gram, ()):
+                    shared[term] += 1
+            for term, n in shared.items():
+                similarity = n / (len(grams) + len(self.term_trigrams[term]) - n)
+                if similarity >= MIN_SIMILARITY:
+                    for name, weight in self.terms[term].items():
+                        offer(name, similarity * (0.5 + weight / 6), 'fuzzy')
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1][0], self.order[item[0]]))[:limit]
+        return [{'breed': name, 'score': round(score, 3), 'match': match} for name, (score, match) in ranked]
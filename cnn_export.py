@@ -0,0 +1,123 @@
+"""
+Export the train_cnn.py Keras model to a flat .npz for cnn_runtime.py
+Needs TensorFlow only here, at export time - the web app never imports it.
+
+BatchNormalization is folded away wherever that is exact:
+  - into the preceding Conv2D/Dense when that layer has no activation;
+  - into the following Dense when it sits after a Dense (as in the classifier head).
+A BatchNorm after a ReLU conv (train_cnn.py's conv blocks) cannot be folded into
+either conv exactly - the next conv zero-pads its input - so it becomes a
+per-channel scale/shift applied in the same pass as the ReLU.
+Augmentation and Dropout layers are inference no-ops and are dropped.
+
+Usage:
+    python cnn_export.py                                   # cattle_cnn_model.h5 -> cattle_cnn_model.npz
+    python cnn_export.py --register --promote              # ...and serve it from the model registry
+"""
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+
+SKIPPED = {'InputLayer', 'Dropout', 'RandomFlip', 'RandomRotation', 'RandomZoom',
+           'RandomTranslation', 'RandomContrast', 'SpatialDropout2D', 'GaussianNoise'}
+
+def _bn_affine(config, weights):
+    weights = list(weights)
+    channels = weights[-1].shape[0]
+    gamma = weights.pop(0) if config.get('scale', True) else np.ones(channels, np.float32)
+    beta = weights.pop(0) if config.get('center', True) else np.zeros(channels, np.float32)
+    mean, var = weights
+    scale = gamma / np.sqrt(var + config.get('epsilon', 1e-3))
+    return scale.astype(np.float32), (beta - mean * scale).astype(np.float32)
+
+def export_layers(layers, out_path):
+    """layers: [(class_name, config, weights)] as from a Keras Sequential model -> .npz at out_path"""
+    ops, params = [], []
+    for cls, config, weights in layers:
+        if cls in SKIPPED:
+            continue
+        prev = ops[-1] if ops else None
+        if cls in ('Conv2D', 'Dense'):
+            kernel = np.asarray(weights[0], np.float32)
+            bias = np.asarray(weights[1], np.float32) if config.get('use_bias', True) else np.zeros(kernel.shape[-1], np.float32)
+            if cls == 'Dense' and prev and prev['op'] == 'dense' and prev.get('affine'):
+                # Dense(act) -> BN -> Dense: move the BN scale/shift into this layer's weights
+                p = params[-1]
+                bias = p.pop('shift') @ kernel + bias
+                kernel = p.pop('scale')[:, None] * kernel
+                prev['affine'] = False
+            if cls == 'Conv2D':
+                strides = config.get('strides', (1, 1))
+                ops.append({'op': 'conv', 'activation': config.get('activation', 'linear'),
+                            'padding': config.get('padding', 'valid'), 'stride': int(strides[0])})
+            else:
+                ops.append({'op': 'dense', 'activation': config.get('activation', 'linear'), 'units': int(kernel.shape[-1])})
+            params.append({'kernel': kernel, 'bias': bias})
+        elif cls == 'BatchNormalization':
+            scale, shift = _bn_affine(config, weights)
+            if prev and prev['op'] in ('conv', 'dense') and prev['activation'] in (None, 'linear') and not prev.get('affine'):
+                params[-1]['kernel'] = params[-1]['kernel'] * scale
+                params[-1]['bias'] = params[-1]['bias'] * scale + shift
+            elif prev and prev['op'] in ('conv', 'dense') and not prev.get('affine'):
+                prev['affine'] = True
+                params[-1].update(scale=scale, shift=shift)
+            else:
+                ops.append({'op': 'affine'})
+                params.append({'scale': scale, 'shift': shift})
+        elif cls == 'MaxPooling2D':
+            if config.get('padding', 'valid') != 'valid':
+                raise ValueError('Only valid-padded MaxPooling2D is supported')
+            pool = config.get('pool_size', (2, 2))
+            strides = config.get('strides') or pool
+            ops.append({'op': 'maxpool', 'pool': int(pool[0]), 'stride': int(strides[0])})
+            params.append({})
+        elif cls == 'GlobalAveragePooling2D':
+            ops.append({'op': 'gap'})
+            params.append({})
+        elif cls == 'Activation':
+            if not prev or prev.get('affine') or prev.get('activation') not in (None, 'linear'):
+                raise ValueError('Activation layer must directly follow a linear Conv2D/Dense')
+            prev['activation'] = config['activation']
+        else:
+            raise ValueError(f'Unsupported layer for the NumPy runtime: {cls}')
+
+    arrays = {f'{i}/{name}': arr for i, p in enumerate(params) for name, arr in p.items()}
+    with open(out_path, 'wb') as f:
+        np.savez(f, ops=np.array(json.dumps(ops)), **arrays)
+    return ops
+
+def export_keras(model_path, out_path):
+    import tensorflow as tf
+    model = tf.keras.models.load_model(model_path, compile=False)
+    return export_layers([(l.__class__.__name__, l.get_config(), l.get_weights()) for l in model.layers], out_path)
+
+def register_cnn(npz_path, class_names, metrics=None, promote_it=False):
+    """Add an exported CNN to the model registry (optionally promoting it); returns the version"""
+    from model_registry import register, promote
+    version = register(None, class_names, dict({'kind': 'cnn', 'features': 'image'}, **(metrics or {})),
+                       write_artifact=lambda d: shutil.copyfile(npz_path, os.path.join(d, 'model.npz')))
+    if promote_it:
+        promote(version)
+    return version
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='cattle_cnn_model.h5')
+    parser.add_argument('--classes', default='cattle_cnn_classes.txt')
+    parser.add_argument('--out', default='cattle_cnn_model.npz')
+    parser.add_argument('--register', action='store_true', help='add the export to the model registry')
+    parser.add_argument('--promote', action='store_true', help='register and make it the served model')
+    args = parser.parse_args()
+
+    ops = export_keras(args.model, args.out)
+    print(f'[OK] Exported {len(ops)} ops to {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB)')
+    if args.register or args.promote:
+        with open(args.classes) as f:
+            class_names = [line.strip() for line in f]
+        version = register_cnn(args.out, class_names, {'source': args.model}, args.promote)
+        print(f"[OK] Registered as {version}{' (promoted)' if args.promote else ''}")
+
+if __name__ == '__main__':
+    main()
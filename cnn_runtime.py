@@ -0,0 +1,104 @@
+"""NumPy-only inference for the train_cnn.py model - no TensorFlow in the web tier.
+
+The exporter (cnn_export.py) flattens the Keras Sequential model into a list of
+ops stored in one .npz:
+
+    conv     3x3 'same'/'valid' convolution (+ activation, + optional per-channel affine)
+    maxpool  non-overlapping max pooling
+    gap      global average pooling
+    dense    fully connected (+ activation, + optional per-channel affine)
+    affine   standalone per-channel scale/shift (a BatchNorm that could not be folded)
+
+Everything runs in float32 on NHWC batches. Convolutions are computed as a
+sum of kh*kw shifted matmuls over strided views of the padded input, so the
+im2col matrix is never materialised (a batch of 32 at 128x128x32 would need
+~600 MB for it).
+"""
+import json
+import numpy as np
+
+def _activate(x, name):
+    if name == 'relu':
+        return np.maximum(x, 0, out=x)
+    if name == 'softmax':
+        x = x - x.max(axis=-1, keepdims=True)
+        np.exp(x, out=x)
+        return x / x.sum(axis=-1, keepdims=True)
+    if name in (None, 'linear'):
+        return x
+    raise ValueError(f'Unsupported activation: {name}')
+
+def _affine(x, op, params):
+    if op.get('affine'):
+        x *= params['scale']
+        x += params['shift']
+    return x
+
+def conv2d(x, kernel, bias, stride=1, padding='same'):
+    """x: (N, H, W, Cin) float32, kernel: (kh, kw, Cin, Cout) -> (N, Ho, Wo, Cout)"""
+    n, h, w, _ = x.shape
+    kh, kw, _, cout = kernel.shape
+    if padding == 'same':
+        ho, wo = -(-h // stride), -(-w // stride)
+        pad_h = max((ho - 1) * stride + kh - h, 0)
+        pad_w = max((wo - 1) * stride + kw - w, 0)
+        # TensorFlow puts the odd pixel of padding at the bottom/right
+        x = np.pad(x, ((0, 0), (pad_h // 2, pad_h - pad_h // 2), (pad_w // 2, pad_w - pad_w // 2), (0, 0)))
+    else:
+        ho, wo = (h - kh) // stride + 1, (w - kw) // stride + 1
+    cin = x.shape[-1]
+    out = np.empty((n * ho * wo, cout), dtype=np.float32)
+    out[...] = bias
+    for i in range(kh):
+        for j in range(kw):
+            window = x[:, i:i + (ho - 1) * stride + 1:stride, j:j + (wo - 1) * stride + 1:stride, :]
+            out += np.ascontiguousarray(window).reshape(-1, cin) @ kernel[i, j]
+    return out.reshape(n, ho, wo, cout)
+
+def maxpool2d(x, pool=2, stride=2):
+    n, h, w, c = x.shape
+    if pool == stride:
+        ho, wo = h // pool, w // pool
+        return x[:, :ho * pool, :wo * pool, :].reshape(n, ho, pool, wo, pool, c).max(axis=(2, 4))
+    windows = np.lib.stride_tricks.sliding_window_view(x, (pool, pool), axis=(1, 2))[:, ::stride, ::stride]
+    return windows.max(axis=(-2, -1))
+
+class CNNModel:
+    """predict_proba over (N, 128, 128, 3) float32 images in [0, 1]"""
+
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as data:
+            self.ops = json.loads(str(data['ops']))
+            self.params = [{k.split('/', 1)[1]: data[k].astype(np.float32) for k in data.files if k.startswith(f'{i}/')}
+                           for i in range(len(self.ops))]
+        self.meta = {'kind': 'cnn', 'layers': len(self.ops),
+                     'parameters': int(sum(a.size for p in self.params for a in p.values()))}
+        self.n_classes = self.ops[-1].get('units')
+        self.classes_ = np.arange(self.n_classes) if self.n_classes else None
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for p in self.params for a in p.values())
+
+    def predict_proba(self, X):
+        x = np.ascontiguousarray(X, dtype=np.float32)
+        for op, params in zip(self.ops, self.params):
+            kind = op['op']
+            if kind == 'conv':
+                x = conv2d(x, params['kernel'], params['bias'], op.get('stride', 1), op.get('padding', 'same'))
+                x = _affine(_activate(x, op.get('activation')), op, params)
+            elif kind == 'maxpool':
+                x = maxpool2d(x, op.get('pool', 2), op.get('stride', op.get('pool', 2)))
+            elif kind == 'gap':
+                x = x.mean(axis=(1, 2))
+            elif kind == 'dense':
+                x = x @ params['kernel'] + params['bias']
+                x = _affine(_activate(x, op.get('activation')), op, params)
+            elif kind == 'affine':
+                x = x * params['scale'] + params['shift']
+            else:
+                raise ValueError(f'Unsupported op: {kind}')
+        return x
+
+    def predict(self, X):
+        return np.argmax(self.predict_proba(X), axis=1)
@@ -0,0 +1,102 @@
+"""Streaming input pipeline for train_cnn.py - peak memory is a few batches, not the dataset.
+
+The train/validation split is made on file lists (stratified by breed), then
+each side is streamed as (float32 images, labels) batches from either
+
+    CacheSource  rows of the uint8 memmap built by dataset_cache.py
+    DiskSource   the image files themselves, decoded per batch on a thread pool
+
+A background thread assembles the next `prefetch` batches while the model
+trains on the current one; the bounded queue between them is what keeps
+memory flat whatever the dataset size.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dataset_cache import decode_file
+from imaging import MODEL_SIZE
+
+PREFETCH = 4
+
+def split_files(files, test_size=0.2, seed=42):
+    """[(path, label)] -> (train_files, test_files), stratified by label"""
+    from sklearn.model_selection import train_test_split
+    labels = [label for _, label in files]
+    train, test = train_test_split(files, test_size=test_size, random_state=seed, stratify=labels)
+    return train, test
+
+class CacheSource:
+    """Serves a file list from a DatasetCache; files missing from it (unreadable) are dropped"""
+
+    def __init__(self, cache, files):
+        rows = {path: row for row, path in enumerate(cache.paths)}
+        self.cache = cache
+        self.rows = np.array([rows[p] for p, _ in files if p in rows], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def load(self, positions):
+        rows = np.sort(self.rows[positions])   # sorted reads walk the memmap forward
+        return np.asarray(self.cache.pixels[rows]), self.cache.labels[rows]
+
+class DiskSource:
+    """Decodes a file list straight from disk, one batch at a time"""
+
+    def __init__(self, files, workers=4):
+        self.paths = [p for p, _ in files]
+        self.labels = np.array([label for _, label in files], dtype=np.int32)
+        self.pool = ThreadPoolExecutor(max_workers=workers)   # PIL releases the GIL while decoding
+
+    def __len__(self):
+        return len(self.paths)
+
+    def load(self, positions):
+        images = list(self.pool.map(decode_file, [self.paths[i] for i in positions]))
+        ok = [i for i, img in enumerate(images) if img is not None]
+        pixels = np.stack([images[i] for i in ok]) if ok else np.zeros((0, MODEL_SIZE, MODEL_SIZE, 3), np.uint8)
+        return pixels, self.labels[np.asarray(positions)[ok]]
+
+def _batches(source, batch_size, shuffle, seed, epochs):
+    epoch = 0
+    while epochs is None or epoch < epochs:
+        order = np.random.default_rng(seed + epoch).permutation(len(source)) if shuffle else np.arange(len(source))
+        for start in range(0, len(order), batch_size):
+            pixels, labels = source.load(order[start:start + batch_size])
+            yield pixels.astype(np.float32) / 255.0, labels
+        epoch += 1
+
+def stream(source, batch_size=32, shuffle=False, seed=42, epochs=None, prefetch=PREFETCH):
+    """Yield (float32 images in [0, 1], labels) batches, `prefetch` of them built ahead in a
+    background thread. epochs=None repeats forever (what model.fit with steps_per_epoch expects)."""
+    buffer = queue.Queue(maxsize=max(prefetch, 1))
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in _batches(source, batch_size, shuffle, seed, epochs):
+                while not stop.is_set():
+                    try:
+                        buffer.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            buffer.put(done)
+        except BaseException as e:   # surface loader errors in the training thread
+            buffer.put(e)
+
+    threading.Thread(target=produce, daemon=True, name='data-prefetch').start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
@@ -1,60 +1,116 @@
-"""SQLite database layer - replaces all JSON files"""
+"""SQLite database layer - replaces all JSON files
+
+Usage:
+    python database.py migrate               # apply pending schema migrations
+    python database.py rebuild-aggregates    # recompute leaderboard counts from history
+"""
 import sqlite3
 import os
+import sys
+import threading
 from datetime import datetime
 
 DB_FILE = 'cattle.db'
 
-def get_db():
-    conn = sqlite3.connect(DB_FILE)
+# Connection tuning - see get_db()
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+DB_CACHE_KB        = int(os.environ.get('DB_CACHE_KB', 16384))
+DB_MMAP_BYTES      = int(os.environ.get('DB_MMAP_BYTES', 64 * 1024 * 1024))
+DB_STATEMENT_CACHE = 256
+
+_local = threading.local()
+
+def _connect():
+    conn = sqlite3.connect(DB_FILE, timeout=DB_BUSY_TIMEOUT_MS / 1000.0, cached_statements=DB_STATEMENT_CACHE)
     conn.row_factory = sqlite3.Row
+    # WAL: readers never block the writer and vice versa; NORMAL sync is durable across
+    # app crashes in WAL mode (only an OS crash can drop the last commits)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_KB}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_BYTES}')
+    conn.execute('PRAGMA temp_store=MEMORY')
     return conn
 
-def init_db():
-    conn = get_db()
-    c = conn.cursor()
-    c.executescript('''
-        CREATE TABLE IF NOT EXISTS users (
+def get_db():
+    """This thread's connection - opened once and reused, so its pragmas and prepared
+    statement cache survive between calls. Callers commit but never close it."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.path != DB_FILE:
+        # First use in this thread, or inherited across a fork / DB_FILE changed
+        conn = _local.conn = _connect()
+        _local.pid, _local.path = os.getpid(), DB_FILE
+    return conn
+
+def end_request():
+    """Roll back a transaction a failed call left open on this thread's connection, so it
+    can't leak into the next request served by the thread (Flask teardown)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid() and conn.in_transaction:
+        conn.rollback()
+        print('[ERROR] Rolled back a database transaction left open by a request')
+
+def close_db():
+    """Close this thread's connection (tests, shutdown); the next get_db() reopens"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
+
+# ── Schema migrations ──────────────────────────────────
+# Append-only: a deployed migration is never edited - a change is a new number.
+# Each entry is (version, description, steps); a step is an SQL statement or a
+# callable taking the connection. Pending migrations run in one transaction.
+
+def _add_feedback_sample_id(conn):
+    # Databases from before versioning may already have it (it used to be an ad-hoc ALTER)
+    if 'sample_id' not in [r['name'] for r in conn.execute('PRAGMA table_info(feedback)')]:
+        conn.execute('ALTER TABLE feedback ADD COLUMN sample_id INTEGER')
+
+MIGRATIONS = [
+    (1, 'base schema', [
+        '''CREATE TABLE IF NOT EXISTS users (
             email       TEXT PRIMARY KEY,
             name        TEXT NOT NULL,
             password    TEXT NOT NULL,
             avatar      TEXT,
             created_at  TEXT NOT NULL
-        );
-        CREATE TABLE IF NOT EXISTS history (
+        )''',
+        '''CREATE TABLE IF NOT EXISTS history (
             id          INTEGER PRIMARY KEY AUTOINCREMENT,
             user_email  TEXT NOT NULL,
             breed       TEXT NOT NULL,
             confidence  REAL NOT NULL,
             image       TEXT,
             timestamp   TEXT NOT NULL
-        );
-        CREATE TABLE IF NOT EXISTS favorites (
+        )''',
+        '''CREATE TABLE IF NOT EXISTS favorites (
             user_email  TEXT NOT NULL,
             breed       TEXT NOT NULL,
             PRIMARY KEY (user_email, breed)
-        );
-        CREATE TABLE IF NOT EXISTS feedback (
+        )''',
+        '''CREATE TABLE IF NOT EXISTS feedback (
             id          INTEGER PRIMARY KEY AUTOINCREMENT,
             user_email  TEXT NOT NULL,
             predicted   TEXT,
             correct     INTEGER,
             actual      TEXT,
             timestamp   TEXT NOT NULL
-        );
-        CREATE TABLE IF NOT EXISTS search_log (
+        )''',
+        '''CREATE TABLE IF NOT EXISTS search_log (
             breed       TEXT PRIMARY KEY,
             count       INTEGER DEFAULT 0
-        );
-        CREATE TABLE IF NOT EXISTS shares (
+        )''',
+        '''CREATE TABLE IF NOT EXISTS shares (
             share_id    TEXT PRIMARY KEY,
             breed       TEXT,
             confidence  REAL,
             info        TEXT,
             user_name   TEXT,
             timestamp   TEXT
-        );
-        CREATE TABLE IF NOT EXISTS suggestions (
+        )''',
+        '''CREATE TABLE IF NOT EXISTS suggestions (
             id          INTEGER PRIMARY KEY AUTOINCREMENT,
             name        TEXT,
             category    TEXT,
@@ -62,19 +118,175 @@ def init_db():
             description TEXT,
             priority    TEXT,
             timestamp   TEXT
-        );
-    ''')
-    conn.commit()
-    conn.close()
-    _migrate_json()
+        )''',
+    ]),
+    (2, 'import legacy JSON files', [lambda conn: _migrate_json(conn)]),
+    (3, 'feedback samples', [
+        '''CREATE TABLE IF NOT EXISTS samples (
+            id            INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_email    TEXT,
+            model_version TEXT,
+            pixels        BLOB NOT NULL,
+            timestamp     TEXT NOT NULL
+        )''',
+        _add_feedback_sample_id,
+    ]),
+    (4, 'background jobs', [
+        '''CREATE TABLE IF NOT EXISTS jobs (
+            id              INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind            TEXT NOT NULL,
+            params          TEXT,
+            status          TEXT NOT NULL,
+            progress        TEXT,
+            log_tail        TEXT,
+            error           TEXT,
+            pid             INTEGER,
+            cancel_requested INTEGER DEFAULT 0,
+            requested_by    TEXT,
+            created_at      TEXT NOT NULL,
+            started_at      TEXT,
+            finished_at     TEXT,
+            updated_at      TEXT
+        )''',
+    ]),
+    (5, 'hot-path indexes', [
+        # get_user_history, clear_user_history and the prune in add_prediction
+        'CREATE INDEX IF NOT EXISTS idx_history_user ON history (user_email, id)',
+        # get_user_feedback
+        'CREATE INDEX IF NOT EXISTS idx_feedback_user ON feedback (user_email, id)',
+        # per-breed accuracy on the admin dashboard
+        'CREATE INDEX IF NOT EXISTS idx_feedback_predicted ON feedback (predicted, correct)',
+        # claim_next_job
+        'CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)',
+    ]),
+    (6, 'history row counts', [
+        '''CREATE TABLE IF NOT EXISTS history_counts (
+            user_email  TEXT PRIMARY KEY,
+            rows        INTEGER NOT NULL
+        )''',
+        'INSERT OR REPLACE INTO history_counts SELECT user_email, COUNT(*) FROM history GROUP BY user_email',
+    ]),
+    (7, 'leaderboard aggregates', [
+        '''CREATE TABLE IF NOT EXISTS breed_counts (
+            breed       TEXT PRIMARY KEY,
+            count       INTEGER NOT NULL
+        )''',
+        '''CREATE TABLE IF NOT EXISTS totals (
+            name        TEXT PRIMARY KEY,
+            value       INTEGER NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_breed_counts_count ON breed_counts (count)',
+        'CREATE INDEX IF NOT EXISTS idx_history_counts_rows ON history_counts (rows)',
+        # Every write to history - inserts, the retention prune, clears, deleted users,
+        # the legacy import - goes through these, in the writer's own transaction
+        '''CREATE TRIGGER IF NOT EXISTS history_insert_counts AFTER INSERT ON history BEGIN
+            INSERT INTO history_counts (user_email,rows) VALUES (NEW.user_email,1)
+                ON CONFLICT(user_email) DO UPDATE SET rows=rows+1;
+            INSERT INTO breed_counts (breed,count) VALUES (NEW.breed,1)
+                ON CONFLICT(breed) DO UPDATE SET count=count+1;
+            UPDATE totals SET value=value+1 WHERE name='predictions';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS history_delete_counts AFTER DELETE ON history BEGIN
+            UPDATE history_counts SET rows=rows-1 WHERE user_email=OLD.user_email;
+            UPDATE breed_counts SET count=count-1 WHERE breed=OLD.breed;
+            UPDATE totals SET value=value-1 WHERE name='predictions';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS history_counts_insert_users AFTER INSERT ON history_counts BEGIN
+            UPDATE totals SET value=value+1 WHERE name='users';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS history_counts_delete_users AFTER DELETE ON history_counts BEGIN
+            UPDATE totals SET value=value-1 WHERE name='users';
+        END''',
+        lambda conn: _rebuild_counts(conn),
+    ]),
+    (8, 'activity days and streaks', [
+        # One row per user per day with a prediction - never pruned with history
+        '''CREATE TABLE IF NOT EXISTS activity_days (
+            user_email  TEXT NOT NULL,
+            day         TEXT NOT NULL,
+            PRIMARY KEY (user_email, day)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS user_streaks (
+            user_email  TEXT PRIMARY KEY,
+            last_day    TEXT NOT NULL,
+            streak      INTEGER NOT NULL,
+            total_days  INTEGER NOT NULL
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS history_insert_activity AFTER INSERT ON history BEGIN
+            INSERT OR IGNORE INTO activity_days (user_email,day) VALUES (NEW.user_email, substr(NEW.timestamp, 1, 10));
+        END''',
+        # Fires only for a user's first prediction of a day. A day older than last_day
+        # (backfilled) counts towards total_days; rebuild_aggregates() re-derives its streak.
+        '''CREATE TRIGGER IF NOT EXISTS activity_days_insert_streak AFTER INSERT ON activity_days BEGIN
+            INSERT INTO user_streaks (user_email,last_day,streak,total_days) VALUES (NEW.user_email, NEW.day, 1, 1)
+                ON CONFLICT(user_email) DO UPDATE SET
+                    total_days = total_days + 1,
+                    streak = CASE WHEN julianday(excluded.last_day) - julianday(last_day) = 1 THEN streak + 1
+                                  WHEN excluded.last_day > last_day THEN 1
+                                  ELSE streak END,
+                    last_day = MAX(last_day, excluded.last_day);
+        END''',
+        lambda conn: _rebuild_activity(conn),
+    ]),
+    (9, 'admin listing indexes', [
+        # list_history(breed=...) walks newest-first within one breed
+        'CREATE INDEX IF NOT EXISTS idx_history_breed ON history (breed, id)',
+    ]),
+    (10, 'sample upload keys', [
+        # Prediction-cache hits are shared across users, samples are not: a hit finds the
+        # user's own sample of the upload, or copies another user's, by content key
+        'ALTER TABLE samples ADD COLUMN content_key TEXT',
+        'CREATE INDEX IF NOT EXISTS idx_samples_key ON samples (content_key, user_email)',
+    ]),
+]
+
+def schema_version(conn=None):
+    conn = conn or get_db()
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='schema_version'").fetchone():
+        return 0
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def migrate():
+    """Apply every migration newer than the database; returns the versions applied.
+    BEGIN IMMEDIATE takes the write lock before the version is read, so when several
+    workers start together one migrates and the rest wait, then find nothing to do."""
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+            version     INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at  TEXT NOT NULL
+        )''')
+        current = schema_version(conn)
+        applied = []
+        for version, description, steps in MIGRATIONS:
+            if version <= current:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute('INSERT INTO schema_version VALUES (?,?,?)', (version, description, datetime.now().isoformat()))
+            applied.append((version, description))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    for version, description in applied:
+        print(f'[OK] Database migration {version}: {description}')
+    return [version for version, _ in applied]
+
+def init_db():
+    migrate()
 
-def _migrate_json():
-    """One-time migration from JSON files to SQLite"""
-    import json, hashlib
+def _migrate_json(conn):
+    """One-time import of the JSON files that predate SQLite (migration 2)"""
+    import json
 
-    # Users
+    # .migrated marks databases that imported them before schema_version existed
     if os.path.exists('users.json') and not os.path.exists('.migrated'):
-        conn = get_db()
         try:
             with open('users.json') as f:
                 users = json.load(f)
@@ -104,127 +316,325 @@ def _migrate_json():
                         conn.execute('INSERT OR IGNORE INTO favorites VALUES (?,?)', (email, b))
             except: pass
 
-        conn.commit()
-        conn.close()
-        open('.migrated', 'w').close()
-
 # ── Users ──────────────────────────────────────────────
 def load_users():
     conn = get_db()
     rows = conn.execute('SELECT * FROM users').fetchall()
-    conn.close()
     return {r['email']: dict(r) for r in rows}
 
 def save_user(email, name, password, created_at=None):
     conn = get_db()
     conn.execute('INSERT OR REPLACE INTO users (email,name,password,created_at) VALUES (?,?,?,?)',
         (email, name, password, created_at or datetime.now().isoformat()))
-    conn.commit(); conn.close()
+    conn.commit()
 
 def get_user(email):
     conn = get_db()
     row = conn.execute('SELECT * FROM users WHERE email=?', (email,)).fetchone()
-    conn.close()
     return dict(row) if row else None
 
 def update_user_avatar(email, filename):
     conn = get_db()
     conn.execute('UPDATE users SET avatar=? WHERE email=?', (filename, email))
-    conn.commit(); conn.close()
+    conn.commit()
 
 def update_user_password(email, hashed):
     conn = get_db()
     conn.execute('UPDATE users SET password=? WHERE email=?', (hashed, email))
-    conn.commit(); conn.close()
+    conn.commit()
 
 def delete_user(email):
     conn = get_db()
     conn.execute('DELETE FROM users WHERE email=?', (email,))
-    conn.commit(); conn.close()
+    conn.execute('DELETE FROM history WHERE user_email=?', (email,))
+    conn.execute('DELETE FROM history_counts WHERE user_email=?', (email,))
+    conn.execute('DELETE FROM activity_days WHERE user_email=?', (email,))
+    conn.execute('DELETE FROM user_streaks WHERE user_email=?', (email,))
+    conn.execute('DELETE FROM favorites WHERE user_email=?', (email,))
+    conn.commit()
 
 # ── History ────────────────────────────────────────────
+# Each user keeps their newest HISTORY_LIMIT predictions. Rather than pruning on
+# every insert, history_counts (kept by the history triggers, see Aggregates) tracks
+# rows per user and the prune runs once a user is HISTORY_SLACK rows over; readers
+# only ever see the newest HISTORY_LIMIT.
+HISTORY_LIMIT = int(os.environ.get('HISTORY_LIMIT', 50))
+HISTORY_SLACK = int(os.environ.get('HISTORY_SLACK', max(HISTORY_LIMIT // 2, 1)))
+
+def _check_history(conn, user_email):
+    rows = conn.execute('SELECT rows FROM history_counts WHERE user_email=?', (user_email,)).fetchone()[0]
+    if rows > HISTORY_LIMIT + HISTORY_SLACK:
+        _prune_history(conn, user_email)
+
+def _prune_history(conn, user_email):
+    # One index range delete below the HISTORY_LIMIT-th newest id
+    conn.execute('''DELETE FROM history WHERE user_email=? AND id <
+        (SELECT id FROM history WHERE user_email=? ORDER BY id DESC LIMIT 1 OFFSET ?)''',
+        (user_email, user_email, HISTORY_LIMIT - 1))
+
 def add_prediction(user_email, breed, confidence, image_name):
     conn = get_db()
     conn.execute('INSERT INTO history (user_email,breed,confidence,image,timestamp) VALUES (?,?,?,?,?)',
         (user_email, breed, round(confidence, 2), image_name, datetime.now().isoformat()))
-    # Keep only last 50
-    conn.execute('''DELETE FROM history WHERE user_email=? AND id NOT IN
-        (SELECT id FROM history WHERE user_email=? ORDER BY id DESC LIMIT 50)''',
-        (user_email, user_email))
-    conn.commit(); conn.close()
+    _check_history(conn, user_email)
+    conn.commit()
+
+def add_predictions(user_email, predictions):
+    """Bulk add_prediction: (breed, confidence, image_name) tuples in one transaction"""
+    now = datetime.now().isoformat()
+    rows = [(user_email, breed, round(confidence, 2), image_name, now) for breed, confidence, image_name in predictions]
+    conn = get_db()
+    conn.executemany('INSERT INTO history (user_email,breed,confidence,image,timestamp) VALUES (?,?,?,?,?)', rows)
+    _check_history(conn, user_email)
+    conn.commit()
 
 def get_user_history(user_email):
     conn = get_db()
-    rows = conn.execute('SELECT * FROM history WHERE user_email=? ORDER BY id ASC', (user_email,)).fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    rows = conn.execute('SELECT * FROM history WHERE user_email=? ORDER BY id DESC LIMIT ?',
+        (user_email, HISTORY_LIMIT)).fetchall()
+    return [dict(r) for r in reversed(rows)]
 
 def clear_user_history(user_email):
     conn = get_db()
     conn.execute('DELETE FROM history WHERE user_email=?', (user_email,))
-    conn.commit(); conn.close()
+    conn.execute('DELETE FROM history_counts WHERE user_email=?', (user_email,))
+    conn.execute('DELETE FROM activity_days WHERE user_email=?', (user_email,))
+    conn.execute('DELETE FROM user_streaks WHERE user_email=?', (user_email,))
+    conn.commit()
 
 def get_all_history():
     conn = get_db()
-    rows = conn.execute('SELECT * FROM history').fetchall()
-    conn.close()
+    rows = conn.execute('''SELECT id, user_email, breed, confidence, image, timestamp FROM
+        (SELECT *, ROW_NUMBER() OVER (PARTITION BY user_email ORDER BY id DESC) AS n FROM history)
+        WHERE n <= ? ORDER BY id''', (HISTORY_LIMIT,)).fetchall()
     result = {}
     for r in rows:
         result.setdefault(r['user_email'], []).append(dict(r))
     return result
 
+# ── Aggregates ─────────────────────────────────────────
+# history_counts, breed_counts and totals are maintained by triggers on history
+# (migration 7), so the leaderboard reads a handful of indexed rows instead of
+# every prediction. They count stored rows, which may include a user's prune slack.
+
+def _aggregate_snapshot(conn):
+    return (dict(conn.execute('SELECT user_email, rows FROM history_counts').fetchall()),
+            dict(conn.execute('SELECT breed, count FROM breed_counts').fetchall()),
+            dict(conn.execute('SELECT name, value FROM totals').fetchall()),
+            {r[0]: tuple(r[1:]) for r in conn.execute('SELECT user_email, last_day, streak, total_days FROM user_streaks')})
+
+def _rebuild_counts(conn):
+    conn.execute('DELETE FROM history_counts')
+    conn.execute('INSERT INTO history_counts SELECT user_email, COUNT(*) FROM history GROUP BY user_email')
+    conn.execute('DELETE FROM breed_counts')
+    conn.execute('INSERT INTO breed_counts SELECT breed, COUNT(*) FROM history GROUP BY breed')
+    conn.execute('DELETE FROM totals')
+    conn.execute("""INSERT INTO totals VALUES ('predictions', (SELECT COUNT(*) FROM history)),
+        ('users', (SELECT COUNT(*) FROM history_counts))""")
+
+def _rebuild_activity(conn):
+    # activity_days outlives pruned history, so it is only topped up, never recomputed
+    conn.execute('INSERT OR IGNORE INTO activity_days SELECT DISTINCT user_email, substr(timestamp, 1, 10) FROM history')
+    # Consecutive days share julianday(day) - row number; the streak is the run holding last_day
+    conn.execute('DELETE FROM user_streaks')
+    conn.execute('''INSERT INTO user_streaks
+        WITH runs AS (SELECT user_email, day,
+                julianday(day) - ROW_NUMBER() OVER (PARTITION BY user_email ORDER BY day) AS run
+            FROM activity_days),
+        last AS (SELECT user_email, MAX(day) AS day, COUNT(*) AS total FROM activity_days GROUP BY user_email)
+        SELECT last.user_email, last.day,
+            (SELECT COUNT(*) FROM runs r WHERE r.user_email = last.user_email AND r.run = runs.run), last.total
+        FROM last JOIN runs ON runs.user_email = last.user_email AND runs.day = last.day''')
+
+def rebuild_aggregates():
+    """Recompute the aggregates from history; returns how many entries had drifted"""
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        before = _aggregate_snapshot(conn)
+        _rebuild_counts(conn)
+        _rebuild_activity(conn)
+        after = _aggregate_snapshot(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    # Zero counts left behind by deletes aren't drift
+    return sum(1 for old, new in zip(before, after)
+               for key in set(old) | set(new) if old.get(key, 0) != new.get(key, 0))
+
+def get_top_breeds(limit=10):
+    conn = get_db()
+    rows = conn.execute('SELECT breed, count FROM breed_counts WHERE count > 0 ORDER BY count DESC LIMIT ?',
+        (limit,)).fetchall()
+    return [(r['breed'], r['count']) for r in rows]
+
+def get_top_users(limit=10):
+    """(email, predictions) for the most active users, capped at HISTORY_LIMIT like get_user_history"""
+    conn = get_db()
+    rows = conn.execute('SELECT user_email, MIN(rows, ?) AS n FROM history_counts WHERE rows > 0 ORDER BY rows DESC LIMIT ?',
+        (HISTORY_LIMIT, limit)).fetchall()
+    return [(r['user_email'], r['n']) for r in rows]
+
+def get_totals():
+    conn = get_db()
+    totals = dict(conn.execute('SELECT name, value FROM totals').fetchall())
+    return {'predictions': totals.get('predictions', 0), 'users': totals.get('users', 0)}
+
+# ── User stats ─────────────────────────────────────────
+def get_user_stats(user_email, recent=5):
+    """Dashboard numbers for one user over the history they can see (newest HISTORY_LIMIT):
+    per-breed and per-day counts and confidence sums, feedback and favorites totals in one
+    grouped query, plus the `recent` newest rows. Cached per user by user_stats.py."""
+    conn = get_db()
+    rows = conn.execute('''WITH h AS (SELECT * FROM history WHERE user_email=? ORDER BY id DESC LIMIT ?)
+        SELECT 'breed' AS kind, breed AS key, COUNT(*) AS n, SUM(confidence) AS total, MAX(id) AS last FROM h GROUP BY breed
+        UNION ALL SELECT 'day', substr(timestamp, 1, 10), COUNT(*), SUM(confidence), MAX(id) FROM h GROUP BY 2
+        UNION ALL SELECT 'feedback', NULL, COUNT(*), SUM(correct), NULL FROM feedback WHERE user_email=?
+        UNION ALL SELECT 'favorites', NULL, COUNT(*), NULL, NULL FROM favorites WHERE user_email=?''',
+        (user_email, HISTORY_LIMIT, user_email, user_email)).fetchall()
+    newest = conn.execute('SELECT * FROM history WHERE user_email=? ORDER BY id DESC LIMIT ?',
+        (user_email, recent)).fetchall()
+
+    breeds = [r for r in rows if r['kind'] == 'breed']
+    total = sum(r['n'] for r in breeds)
+    feedback = next(r for r in rows if r['kind'] == 'feedback')
+    # Ties go to the breed seen most recently
+    top = max(breeds, key=lambda r: (r['n'], r['last']), default=None)
+    return {
+        'total': total,
+        'avg_confidence': round(sum(r['total'] for r in breeds) / total, 1) if total else 0,
+        'top_breed': top['key'] if top else None,
+        'breed_counts': {r['key']: r['n'] for r in breeds},
+        'timeline': {r['key']: r['n'] for r in sorted((r for r in rows if r['kind'] == 'day'), key=lambda r: r['key'])},
+        'feedback_total': feedback['n'],
+        'feedback_correct': feedback['total'] or 0,
+        'favorites_count': next(r['n'] for r in rows if r['kind'] == 'favorites'),
+        'recent': [dict(r) for r in newest],
+    }
+
+# ── Streaks ────────────────────────────────────────────
+def get_user_streak(user_email):
+    """Consecutive active days ending at the user's latest one, and all days ever active -
+    kept by triggers on history (migration 8), so pruning history doesn't shorten them"""
+    conn = get_db()
+    row = conn.execute('SELECT streak, total_days FROM user_streaks WHERE user_email=?', (user_email,)).fetchone()
+    return {'streak': row['streak'], 'total_days': row['total_days']} if row else {'streak': 0, 'total_days': 0}
+
 # ── Favorites ──────────────────────────────────────────
 def add_favorite(user_email, breed):
     conn = get_db()
     conn.execute('INSERT OR IGNORE INTO favorites VALUES (?,?)', (user_email, breed))
-    conn.commit(); conn.close()
+    conn.commit()
 
 def remove_favorite(user_email, breed):
     conn = get_db()
     conn.execute('DELETE FROM favorites WHERE user_email=? AND breed=?', (user_email, breed))
-    conn.commit(); conn.close()
+    conn.commit()
 
 def get_user_favorites(user_email):
     conn = get_db()
     rows = conn.execute('SELECT breed FROM favorites WHERE user_email=?', (user_email,)).fetchall()
-    conn.close()
     return [r['breed'] for r in rows]
 
 def is_favorite(user_email, breed):
     conn = get_db()
     row = conn.execute('SELECT 1 FROM favorites WHERE user_email=? AND breed=?', (user_email, breed)).fetchone()
-    conn.close()
     return row is not None
 
 # ── Feedback ───────────────────────────────────────────
-def add_feedback(user_email, predicted, correct, actual=''):
+def add_feedback(user_email, predicted, correct, actual='', sample_id=None):
     conn = get_db()
-    conn.execute('INSERT INTO feedback (user_email,predicted,correct,actual,timestamp) VALUES (?,?,?,?,?)',
-        (user_email, predicted, 1 if correct else 0, actual, datetime.now().isoformat()))
-    conn.commit(); conn.close()
+    conn.execute('INSERT INTO feedback (user_email,predicted,correct,actual,timestamp,sample_id) VALUES (?,?,?,?,?,?)',
+        (user_email, predicted, 1 if correct else 0, actual, datetime.now().isoformat(), sample_id))
+    conn.commit()
 
 def get_user_feedback(user_email):
     conn = get_db()
     rows = conn.execute('SELECT * FROM feedback WHERE user_email=?', (user_email,)).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 def get_all_feedback():
     conn = get_db()
     rows = conn.execute('SELECT * FROM feedback ORDER BY id DESC').fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
+# ── Samples ────────────────────────────────────────────
+SAMPLE_RETENTION = int(os.environ.get('SAMPLE_RETENTION', 5000))
+
+def add_sample(user_email, model_version, pixels, content_key=None):
+    """Keep a prediction's packed input so later feedback can train on it; returns the sample id"""
+    conn = get_db()
+    cur = conn.execute('INSERT INTO samples (user_email,model_version,pixels,timestamp,content_key) VALUES (?,?,?,?,?)',
+        (user_email, model_version, pixels, datetime.now().isoformat(), content_key))
+    sample_id = cur.lastrowid
+    # Keep only the newest SAMPLE_RETENTION inputs
+    conn.execute('DELETE FROM samples WHERE id <= ?', (sample_id - SAMPLE_RETENTION,))
+    conn.commit()
+    return sample_id
+
+def find_sample(user_email, model_version, content_key):
+    """The user's retained sample of this upload - a copy of another user's if only they have one -
+    or None when no sample of it is retained"""
+    conn = get_db()
+    row = conn.execute('SELECT id FROM samples WHERE content_key=? AND user_email=? ORDER BY id DESC LIMIT 1',
+        (content_key, user_email)).fetchone()
+    if row:
+        return row['id']
+    row = conn.execute('SELECT pixels FROM samples WHERE content_key=? ORDER BY id DESC LIMIT 1', (content_key,)).fetchone()
+    return add_sample(user_email, model_version, row['pixels'], content_key) if row else None
+
+def owns_sample(user_email, sample_id):
+    return get_db().execute('SELECT 1 FROM samples WHERE id=? AND user_email=?', (sample_id, user_email)).fetchone() is not None
+
+def get_labelled_samples(after_feedback_id=0):
+    """Feedback newer than after_feedback_id with a retained input and a label -
+    the corrected breed, or the predicted one when the user confirmed it"""
+    conn = get_db()
+    rows = conn.execute('''SELECT f.id AS feedback_id, s.pixels AS pixels,
+            CASE WHEN f.actual IS NOT NULL AND f.actual != '' THEN f.actual
+                 WHEN f.correct = 1 THEN f.predicted END AS label
+        FROM feedback f JOIN samples s ON s.id = f.sample_id AND s.user_email = f.user_email
+        WHERE f.id > ? AND label IS NOT NULL ORDER BY f.id''', (after_feedback_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+# ── Write-behind batches ───────────────────────────────
+def write_events(events):
+    """Apply a batch of (kind, args) events buffered by write_behind.py in one transaction.
+    args are the column values, timestamped when the event was queued."""
+    searches, predictions, feedback = {}, {}, []
+    for kind, args in events:
+        if kind == 'search':
+            searches[args[0]] = searches.get(args[0], 0) + 1
+        elif kind == 'prediction':
+            predictions.setdefault(args[0], []).append(args)
+        elif kind == 'feedback':
+            feedback.append(args)
+        else:
+            raise ValueError(f'Unknown event kind: {kind}')
+    conn = get_db()
+    try:
+        conn.executemany('''INSERT INTO search_log (breed,count) VALUES (?,?)
+            ON CONFLICT(breed) DO UPDATE SET count=count+excluded.count''', searches.items())
+        for user_email, rows in predictions.items():
+            conn.executemany('INSERT INTO history (user_email,breed,confidence,image,timestamp) VALUES (?,?,?,?,?)', rows)
+            _check_history(conn, user_email)
+        conn.executemany('INSERT INTO feedback (user_email,predicted,correct,actual,timestamp,sample_id) VALUES (?,?,?,?,?,?)',
+            feedback)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
 # ── Search log ─────────────────────────────────────────
 def log_search(breed):
     conn = get_db()
     conn.execute('INSERT INTO search_log (breed,count) VALUES (?,1) ON CONFLICT(breed) DO UPDATE SET count=count+1', (breed,))
-    conn.commit(); conn.close()
+    conn.commit()
 
 def get_search_counts(limit=8):
     conn = get_db()
     rows = conn.execute('SELECT breed, count FROM search_log ORDER BY count DESC LIMIT ?', (limit,)).fetchall()
-    conn.close()
     return {r['breed']: r['count'] for r in rows}
 
 # ── Shares ─────────────────────────────────────────────
@@ -232,12 +642,11 @@ def save_share(share_id, breed, confidence, info_json, user_name):
     conn = get_db()
     conn.execute('INSERT OR REPLACE INTO shares VALUES (?,?,?,?,?,?)',
         (share_id, breed, confidence, info_json, user_name, datetime.now().strftime('%Y-%m-%d %H:%M')))
-    conn.commit(); conn.close()
+    conn.commit()
 
 def get_share(share_id):
     conn = get_db()
     row = conn.execute('SELECT * FROM shares WHERE share_id=?', (share_id,)).fetchone()
-    conn.close()
     return dict(row) if row else None
 
 # ── Suggestions ────────────────────────────────────────
@@ -245,4 +654,169 @@ def save_suggestion(name, category, title, description, priority):
     conn = get_db()
     conn.execute('INSERT INTO suggestions (name,category,title,description,priority,timestamp) VALUES (?,?,?,?,?,?)',
         (name, category, title, description, priority, datetime.now().strftime('%Y-%m-%d %H:%M')))
-    conn.commit(); conn.close()
+    conn.commit()
+
+# ── Admin listings ─────────────────────────────────────
+# Keyset pagination: each page is an indexed range read starting after the last key
+# of the previous page (the `next` cursor), so page 1000 costs the same as page 1.
+ADMIN_PAGE_MAX = 200
+
+def _page(rows, limit, key):
+    items = [dict(r) for r in rows[:limit]]
+    return {'items': items, 'next': items[-1][key] if len(rows) > limit else None}
+
+def _filters(filters):
+    clauses, params = [], []
+    for sql, value in filters:
+        if value not in (None, ''):
+            clauses.append(sql)
+            params.append(value)
+    return clauses, params
+
+def list_users(after=None, limit=50, q=None):
+    """Users in email order, without password hashes; q matches email or name"""
+    limit = max(1, min(int(limit), ADMIN_PAGE_MAX))
+    clauses, params = _filters([('email > ?', after)])
+    if q:
+        clauses.append('(email LIKE ? OR name LIKE ?)')
+        params += [f'%{q}%', f'%{q}%']
+    conn = get_db()
+    rows = conn.execute(f'''SELECT email, name, avatar, created_at FROM users
+        {'WHERE ' + ' AND '.join(clauses) if clauses else ''} ORDER BY email LIMIT ?''', (*params, limit + 1)).fetchall()
+    return _page(rows, limit, 'email')
+
+def list_history(before=None, limit=50, user=None, breed=None, since=None, until=None):
+    """History newest first; since/until are inclusive YYYY-MM-DD days"""
+    limit = max(1, min(int(limit), ADMIN_PAGE_MAX))
+    clauses, params = _filters([('id < ?', before), ('user_email = ?', user), ('breed = ?', breed),
+                                ('timestamp >= ?', since), ("timestamp < date(?, '+1 day')", until)])
+    conn = get_db()
+    rows = conn.execute(f'''SELECT * FROM history {'WHERE ' + ' AND '.join(clauses) if clauses else ''}
+        ORDER BY id DESC LIMIT ?''', (*params, limit + 1)).fetchall()
+    return _page(rows, limit, 'id')
+
+def list_feedback(before=None, limit=50, user=None, predicted=None, correct=None, since=None, until=None):
+    """Feedback newest first; correct is 0/1 or None for both"""
+    limit = max(1, min(int(limit), ADMIN_PAGE_MAX))
+    clauses, params = _filters([('id < ?', before), ('user_email = ?', user), ('predicted = ?', predicted),
+                                ('correct = ?', correct), ('timestamp >= ?', since),
+                                ("timestamp < date(?, '+1 day')", until)])
+    conn = get_db()
+    rows = conn.execute(f'''SELECT id, user_email, predicted, correct, actual, timestamp, sample_id FROM feedback
+        {'WHERE ' + ' AND '.join(clauses) if clauses else ''} ORDER BY id DESC LIMIT ?''', (*params, limit + 1)).fetchall()
+    return _page(rows, limit, 'id')
+
+EXPORT_CHUNK = 1000
+
+def _iter_keyset(select, table, clauses, params, newest_first, chunk):
+    # Every chunk is its own indexed range query - no cursor or read transaction is
+    # held open while the caller streams the previous chunk to a client
+    order, op = ('DESC', '<') if newest_first else ('ASC', '>')
+    last = None
+    while True:
+        where = clauses + ([f'id {op} ?'] if last is not None else [])
+        rows = get_db().execute(f'''{select} FROM {table} {'WHERE ' + ' AND '.join(where) if where else ''}
+            ORDER BY id {order} LIMIT ?''', (*params, *([last] if last is not None else []), chunk)).fetchall()
+        yield from (dict(r) for r in rows)
+        if len(rows) < chunk:
+            return
+        last = rows[-1]['id']
+
+def iter_history(user=None, newest_first=False, visible_only=False, chunk=EXPORT_CHUNK):
+    """History rows in id order, a chunk at a time; visible_only limits a user to the
+    newest HISTORY_LIMIT, as get_user_history does"""
+    clauses, params = _filters([('user_email = ?', user)])
+    if user and visible_only:
+        cutoff = get_db().execute('SELECT id FROM history WHERE user_email=? ORDER BY id DESC LIMIT 1 OFFSET ?',
+            (user, HISTORY_LIMIT)).fetchone()
+        if cutoff:
+            clauses.append('id > ?')
+            params.append(cutoff['id'])
+    return _iter_keyset('SELECT *', 'history', clauses, params, newest_first, chunk)
+
+def iter_feedback(user=None, newest_first=False, chunk=EXPORT_CHUNK):
+    clauses, params = _filters([('user_email = ?', user)])
+    return _iter_keyset('SELECT id, user_email, predicted, correct, actual, timestamp, sample_id', 'feedback',
+                        clauses, params, newest_first, chunk)
+
+def get_admin_summary():
+    conn = get_db()
+    row = conn.execute('''SELECT (SELECT COUNT(*) FROM users) AS users,
+        (SELECT value FROM totals WHERE name='predictions') AS predictions,
+        (SELECT COUNT(*) FROM feedback) AS feedback,
+        (SELECT SUM(correct) FROM feedback) AS feedback_correct,
+        (SELECT SUM(rows - ?) FROM history_counts WHERE rows > ?) AS beyond_limit''',
+        (HISTORY_LIMIT, HISTORY_LIMIT)).fetchone()
+    # predictions and breed_counts count every stored row, including the up to HISTORY_SLACK
+    # per user past the visible HISTORY_LIMIT that the next prune removes; beyond_limit says how many
+    return {'users': row['users'], 'predictions': row['predictions'] or 0,
+            'feedback': row['feedback'], 'feedback_correct': row['feedback_correct'] or 0,
+            'beyond_limit': row['beyond_limit'] or 0}
+
+# ── Jobs ───────────────────────────────────────────────
+def create_job(kind, params, requested_by):
+    conn = get_db()
+    cur = conn.execute('INSERT INTO jobs (kind,params,status,requested_by,created_at) VALUES (?,?,?,?,?)',
+        (kind, params, 'queued', requested_by, datetime.now().isoformat()))
+    conn.commit()
+    return cur.lastrowid
+
+def claim_next_job(stale_before, reap=None):
+    """Atomically start the oldest queued job if no job is running; returns it or None.
+    Running jobs not heard from since stale_before (ISO time) are failed first, after
+    reap(pid) has stopped whatever is left of their process."""
+    conn = get_db()
+    conn.execute('BEGIN IMMEDIATE')   # take the write lock before looking, so two workers can't both claim
+    try:
+        now = datetime.now().isoformat()
+        stale = conn.execute("SELECT id, pid FROM jobs WHERE status='running' AND updated_at < ?", (stale_before,)).fetchall()
+        for job in stale:
+            if reap is not None and job['pid']:
+                reap(job['pid'])
+            conn.execute("""UPDATE jobs SET status='failed', error='Lost contact with the training process', finished_at=?
+                WHERE id=?""", (now, job['id']))
+        row = None
+        if not conn.execute("SELECT 1 FROM jobs WHERE status='running'").fetchone():
+            row = conn.execute("SELECT * FROM jobs WHERE status='queued' ORDER BY id LIMIT 1").fetchone()
+            if row:
+                conn.execute("UPDATE jobs SET status='running', started_at=?, updated_at=? WHERE id=?", (now, now, row['id']))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return dict(row, status='running') if row else None
+
+def update_job(job_id, **fields):
+    fields['updated_at'] = datetime.now().isoformat()
+    conn = get_db()
+    conn.execute(f'UPDATE jobs SET {", ".join(f"{k}=?" for k in fields)} WHERE id=?', (*fields.values(), job_id))
+    conn.commit()
+
+def get_job(job_id):
+    conn = get_db()
+    row = conn.execute('SELECT * FROM jobs WHERE id=?', (job_id,)).fetchone()
+    return dict(row) if row else None
+
+def list_jobs(limit=20):
+    limit = max(1, min(int(limit), ADMIN_PAGE_MAX))
+    conn = get_db()
+    rows = conn.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+    return [dict(r) for r in rows]
+
+def request_job_cancel(job_id):
+    """Queued jobs are cancelled on the spot; running ones are flagged for their runner to stop"""
+    conn = get_db()
+    now = datetime.now().isoformat()
+    conn.execute("UPDATE jobs SET status='cancelled', finished_at=? WHERE id=? AND status='queued'", (now, job_id))
+    conn.execute("UPDATE jobs SET cancel_requested=1 WHERE id=? AND status='running'", (job_id,))
+    conn.commit()
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2 and sys.argv[1] == 'migrate':
+        migrate()
+        print(f"[OK] Schema version {schema_version()}")
+    elif len(sys.argv) == 2 and sys.argv[1] == 'rebuild-aggregates':
+        migrate()
+        print(f"[OK] Rebuilt aggregates ({rebuild_aggregates()} entries had drifted)")
+    else:
+        print(__doc__)
@@ -0,0 +1,224 @@
+"""Preprocessed training-set cache - decode dataset/ once, train from a uint8 memmap.
+
+    .dataset_cache/
+        pixels.npy      (N, 128, 128, 3) uint8, opened with mmap_mode='r'
+        labels.npy      (N,) int32 class index
+        manifest.json   class names + one entry per image: path, size, mtime_ns
+
+Images are decoded exactly the way the app decodes uploads (imaging.model_input), so
+training and serving see the same pixels. Rebuilding compares every file's
+(path, size, mtime_ns) with the manifest and re-decodes only new or changed
+files; unchanged rows are copied from the previous pixels.npy. Consumers
+convert to float32 one batch at a time (data_pipeline.py), never the whole set.
+
+Usage:
+    python dataset_cache.py              # build/refresh the cache for dataset/
+    python dataset_cache.py --rebuild    # decode everything again
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from imaging import MODEL_SIZE, model_input
+
+DATASET_DIR = 'dataset'
+CACHE_DIR = os.environ.get('DATASET_CACHE_DIR', '.dataset_cache')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+FORMAT_VERSION = 1
+DECODE_WORKERS = int(os.environ.get('DATASET_WORKERS', 0))   # 0 = one per CPU
+DECODE_CHUNK = 32
+
+def scan(dataset_dir=DATASET_DIR, limit=None):
+    """-> class_names, [(path, label)] in deterministic class/file order"""
+    class_names, files = [], []
+    for folder in sorted(Path(dataset_dir).iterdir()):
+        if not folder.is_dir():
+            continue
+        class_names.append(folder.name)
+        images = sorted(p for p in folder.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        files.extend((str(p), len(class_names) - 1) for p in images[:limit])
+    return class_names, files
+
+def decode_file(path):
+    """One dataset image -> (128, 128, 3) uint8, or None when it cannot be decoded"""
+    try:
+        return model_input(path)
+    except Exception:
+        return None
+
+def _decode_chunk(paths):
+    return [decode_file(p) for p in paths]
+
+def decode_files(paths, workers=None, chunk=DECODE_CHUNK):
+    """Decode `paths` on a process pool; yields arrays (or None) in the order of `paths`.
+
+    Work is handed out in chunks of `chunk` files so per-task pickling overhead
+    stays small next to the decode itself. workers <= 1 decodes in-process.
+    """
+    workers = workers or DECODE_WORKERS or os.cpu_count() or 1
+    if workers <= 1 or len(paths) <= chunk:
+        yield from map(decode_file, paths)
+        return
+    chunks = [paths[i:i + chunk] for i in range(0, len(paths), chunk)]
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+        # Executor.map returns results in submission order - deterministic rows and splits
+        for results in pool.map(_decode_chunk, chunks):
+            yield from results
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != FORMAT_VERSION or manifest.get('img_size') != MODEL_SIZE:
+        return None
+    return manifest
+
+class DatasetCache:
+    """Read-only view of a built cache: pixels (memmap), labels, class_names, paths"""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        manifest = _read_manifest(cache_dir)
+        if manifest is None:
+            raise FileNotFoundError(f'No dataset cache at {cache_dir}/ - run: python dataset_cache.py')
+        self.cache_dir = cache_dir
+        self.class_names = manifest['class_names']
+        self.paths = [e['path'] for e in manifest['entries']]
+        self.pixels = np.load(os.path.join(cache_dir, 'pixels.npy'), mmap_mode='r')
+        self.labels = np.load(os.path.join(cache_dir, 'labels.npy'))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def first_per_class(self, limit):
+        """Row indices of the first `limit` images of every class (rows are in class/file order)"""
+        if limit is None:
+            return np.arange(len(self.labels))
+        rank = np.arange(len(self.labels)) - np.searchsorted(self.labels, self.labels)
+        return np.flatnonzero(rank < limit)
+
+class Rows:
+    """A subset of a memmapped array's rows that still reads lazily: slicing it
+    copies only the rows in that slice (features.extract reads 256 at a time)"""
+
+    def __init__(self, array, rows):
+        self.array, self.rows = array, rows
+        self.shape = (len(rows),) + array.shape[1:]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        return self.array[self.rows[key]]
+
+def build(dataset_dir=DATASET_DIR, cache_dir=CACHE_DIR, limit=None, rebuild=False, workers=None, progress=None):
+    """Create or refresh the cache for dataset_dir; returns a DatasetCache.
+    progress(done, total) is called every few hundred images."""
+    started = time.perf_counter()
+    class_names, files = scan(dataset_dir, limit)
+    previous = None if rebuild else _read_manifest(cache_dir)
+    known = {}
+    if previous:
+        known = {e['path']: e for e in previous['entries']}
+        known.update({e['path']: dict(e, row=None) for e in previous.get('failed', [])})
+
+    entries, reused, todo, still_failed = [], 0, [], []
+    for path, label in files:
+        st = os.stat(path)
+        old = known.get(path)
+        if old and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns:
+            if old['row'] is None:
+                # Unchanged file that failed to decode last time: remembered, not retried
+                still_failed.append({'path': path, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'label': label})
+                continue
+            reused += 1
+        else:
+            old = None
+            todo.append(len(entries))
+        entries.append({'path': path, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                        'label': label, 'row': old['row'] if old else None})
+
+    if previous and not todo and previous['class_names'] == class_names and \
+            [(e['path'], e['row']) for e in previous['entries']] == [(e['path'], i) for i, e in enumerate(entries)]:
+        print(f'[OK] Dataset cache up to date: {len(entries)} images in {cache_dir}/')
+        return DatasetCache(cache_dir)
+
+    old_pixels = np.load(os.path.join(cache_dir, 'pixels.npy'), mmap_mode='r') if previous and reused else None
+    base = cache_dir.rstrip('/\\')
+    tmp_dir = f'{base}.tmp{os.getpid()}'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    pixels_path = os.path.join(tmp_dir, 'pixels.npy')
+
+    # Rows are written in entry order as decoded chunks arrive, so memory holds
+    # one chunk per worker however large the dataset is
+    decode_started = time.perf_counter()
+    pixels = np.lib.format.open_memmap(pixels_path, mode='w+', dtype=np.uint8,
+                                       shape=(len(entries), MODEL_SIZE, MODEL_SIZE, 3))
+    decoded = decode_files([entries[i]['path'] for i in todo], workers)
+    kept, failed = [], []
+    for i, entry in enumerate(entries):
+        img = next(decoded) if entry['row'] is None else old_pixels[entry['row']]
+        if img is None:
+            failed.append(entry)
+            continue
+        pixels[len(kept)] = img
+        kept.append(i)
+        if progress and len(kept) % 256 == 0:
+            progress(len(kept), len(entries))
+    decode_s = time.perf_counter() - decode_started
+    pixels.flush()
+    if len(kept) < len(entries):
+        # Unreadable files leave unused rows at the end - rewrite at the exact size
+        final = np.lib.format.open_memmap(pixels_path + '.tmp', mode='w+', dtype=np.uint8,
+                                          shape=(len(kept), MODEL_SIZE, MODEL_SIZE, 3))
+        final[:] = pixels[:len(kept)]
+        final.flush()
+        del final, pixels
+        os.replace(pixels_path + '.tmp', pixels_path)
+    else:
+        del pixels
+    del old_pixels
+    np.save(os.path.join(tmp_dir, 'labels.npy'), np.array([entries[i]['label'] for i in kept], dtype=np.int32))
+    manifest = {
+        'format': FORMAT_VERSION, 'img_size': MODEL_SIZE, 'dataset': dataset_dir, 'class_names': class_names,
+        'entries': [{k: entries[i][k] for k in ('path', 'size', 'mtime_ns', 'label')} | {'row': row}
+                    for row, i in enumerate(kept)],
+        'failed': still_failed + [{k: e[k] for k in ('path', 'size', 'mtime_ns', 'label')} for e in failed],
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+    old_dir = f'{base}.old{os.getpid()}'
+    if os.path.exists(cache_dir):
+        os.replace(cache_dir, old_dir)
+    os.replace(tmp_dir, cache_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - started
+    rate = f', {len(todo) / decode_s:.0f} images/s' if todo and decode_s > 0 else ''
+    print(f'[OK] Dataset cache: {len(kept)} images ({len(todo) - len(failed)} decoded{rate}, {reused} reused, '
+          f'{len(failed) + len(still_failed)} unreadable) in {elapsed:.1f}s -> {cache_dir}/')
+    return DatasetCache(cache_dir)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default=DATASET_DIR)
+    parser.add_argument('--cache', default=CACHE_DIR)
+    parser.add_argument('--limit', type=int, help='max images per breed')
+    parser.add_argument('--rebuild', action='store_true', help='ignore the manifest and decode every file')
+    parser.add_argument('--workers', type=int, help='decode processes (default: one per CPU)')
+    args = parser.parse_args()
+    if not os.path.exists(args.dataset):
+        print(f'[ERROR] Dataset not found at {args.dataset}/')
+        return
+    cache = build(args.dataset, args.cache, args.limit, args.rebuild, args.workers)
+    print(f'[INFO] {len(cache)} images, {len(cache.class_names)} breeds, {cache.pixels.nbytes / 1e6:.1f} MB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Streaming export encoders - rows in, text chunks out, nothing buffered beyond one chunk.
+
+Each encoder takes an iterable of row dicts (database.iter_history / iter_feedback
+fetch them a chunk at a time) and yields strings of about CHUNK_ROWS rows, so a
+Flask Response can send an export of any size in constant memory. gzip_stream()
+compresses such a stream on the fly.
+"""
+import csv
+import io
+import json
+import zlib
+from html import escape
+from itertools import islice
+
+CHUNK_ROWS = 500
+
+def _chunks(rows, size=CHUNK_ROWS):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def csv_stream(rows, columns, header=None):
+    """CSV with one column per entry of columns - a key of the row dict or a function of it"""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerow(header or columns)
+    for chunk in _chunks(rows):
+        for row in chunk:
+            writer.writerow([c(row) if callable(c) else row.get(c) for c in columns])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+def ndjson_stream(rows):
+    for chunk in _chunks(rows):
+        yield ''.join(json.dumps(row) + '\n' for row in chunk)
+
+def json_stream(rows, key, **fields):
+    """One JSON object: fields, then key holding every row as an array"""
+    head = json.dumps(fields)
+    yield head[:-1] + (', ' if fields else '') + json.dumps(key) + ': ['
+    first = True
+    for chunk in _chunks(rows):
+        body = ', '.join(json.dumps(row) for row in chunk)
+        yield body if first else ', ' + body
+        first = False
+    yield ']}'
+
+def html_table_stream(rows, columns, header, title, preamble=''):
+    """A standalone HTML report: preamble (already escaped) then a table of rows"""
+    yield (f'<html><head><meta charset="utf-8"><title>{escape(title)}</title><style>body{{font-family:Arial;padding:20px}}'
+           'table{width:100%;border-collapse:collapse}th,td{border:1px solid #ddd;padding:8px;text-align:left}'
+           'th{background:#667eea;color:white}h1{color:#667eea}</style></head>'
+           f'<body>{preamble}<table><tr>' + ''.join(f'<th>{escape(h)}</th>' for h in header) + '</tr>')
+    for chunk in _chunks(rows):
+        yield ''.join('<tr>' + ''.join(f'<td>{escape(str(c(row) if callable(c) else row.get(c)))}</td>' for c in columns)
+                      + '</tr>' for row in chunk)
+    yield '</table></body></html>'
+
+def gzip_stream(chunks, level=6):
+    """gzip-compress a stream of str chunks incrementally"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)   # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
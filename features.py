@@ -0,0 +1,117 @@
+"""Shared preprocessing - turns 128x128 RGB uint8 images into model feature vectors.
+
+Used identically by train_simple.py (training), app.py predict() and
+batch_predict() (serving). The feature set a model was trained on is stored
+in its registry metrics, so serving always applies the matching transform.
+
+'raw'     - the original 49,152 flattened pixels scaled to [0, 1]
+'compact' - 896 float32 features:
+              128  joint HSV colour histogram (8 hue x 4 sat x 4 value)
+              576  gradient-orientation histograms (HOG-style, 8x8 cells x 9 bins)
+              192  8x8 average-pooled CIE Lab image
+'image'   - the image itself as float32 in [0, 1], for the CNN
+"""
+import numpy as np
+
+DEFAULT_FEATURES = 'compact'
+
+HSV_BINS  = (8, 4, 4)
+HOG_CELLS = 8        # cells per side -> 16x16 px cells at 128x128
+HOG_BINS  = 9        # unsigned orientations over 0..180 degrees
+LAB_GRID  = 8
+
+def _rgb_to_hsv(rgb):
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    delta = maxc - minc
+    safe = np.where(delta > 0, delta, 1.0)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    h = np.where(maxc == r, (g - b) / safe, np.where(maxc == g, 2.0 + (b - r) / safe, 4.0 + (r - g) / safe))
+    h = np.where(delta > 0, (h / 6.0) % 1.0, 0.0)
+    s = np.where(maxc > 0, delta / np.where(maxc > 0, maxc, 1.0), 0.0)
+    return h, s, maxc
+
+def _build_hsv_lut(bits=6):
+    # RGB quantised to `bits` per channel -> joint HSV bin, so per-pixel work is one table lookup
+    levels = (np.arange(1 << bits, dtype=np.float32) + 0.5) / (1 << bits)
+    r, g, b = np.meshgrid(levels, levels, levels, indexing='ij')
+    h, s, v = _rgb_to_hsv(np.stack([r, g, b], axis=-1))
+    hb, sb, vb = HSV_BINS
+    lut = (np.minimum((h * hb).astype(np.int64), hb - 1) * sb + np.minimum((s * sb).astype(np.int64), sb - 1)) * vb \
+        + np.minimum((v * vb).astype(np.int64), vb - 1)
+    return lut.astype(np.uint8).ravel()
+
+_HSV_LUT = _build_hsv_lut()
+
+def _hsv_histogram(pixels):
+    n = len(pixels)
+    q = (pixels >> 2).astype(np.int32)
+    idx = _HSV_LUT[(q[..., 0] << 12) | (q[..., 1] << 6) | q[..., 2]].reshape(n, -1).astype(np.int64)
+    bins = HSV_BINS[0] * HSV_BINS[1] * HSV_BINS[2]
+    idx += np.arange(n)[:, None] * bins
+    hist = np.bincount(idx.ravel(), minlength=n * bins).reshape(n, bins).astype(np.float32)
+    return hist / hist.sum(axis=1, keepdims=True)
+
+def _gradient_histograms(rgb):
+    n, height, width, _ = rgb.shape
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, :, 1:-1] = gray[:, :, 2:] - gray[:, :, :-2]
+    gy[:, 1:-1, :] = gray[:, 2:, :] - gray[:, :-2, :]
+    magnitude = np.hypot(gx, gy)
+    angle = np.arctan2(gy, gx) % np.pi
+    orient = np.minimum((angle / np.pi * HOG_BINS).astype(np.int64), HOG_BINS - 1)
+    cell_h, cell_w = height // HOG_CELLS, width // HOG_CELLS
+    cell = (np.arange(height)[:, None] // cell_h) * HOG_CELLS + np.arange(width)[None, :] // cell_w
+    per_image = HOG_CELLS * HOG_CELLS * HOG_BINS
+    idx = (cell[None] * HOG_BINS + orient) + np.arange(n)[:, None, None] * per_image
+    hist = np.bincount(idx.ravel(), weights=magnitude.ravel(), minlength=n * per_image)
+    hist = hist.reshape(n, HOG_CELLS * HOG_CELLS, HOG_BINS).astype(np.float32)
+    hist /= np.sqrt((hist ** 2).sum(axis=2, keepdims=True)) + 1e-6
+    return hist.reshape(n, -1)
+
+def _lab_patches(rgb):
+    n, height, width, _ = rgb.shape
+    # Average-pool in sRGB first (cheap), then convert the 8x8 grid to Lab
+    pooled = rgb.reshape(n, LAB_GRID, height // LAB_GRID, LAB_GRID, width // LAB_GRID, 3).mean(axis=(2, 4))
+    linear = np.where(pooled <= 0.04045, pooled / 12.92, ((pooled + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ np.array([[0.4124, 0.2126, 0.0193],
+                             [0.3576, 0.7152, 0.1192],
+                             [0.1805, 0.0722, 0.9505]], dtype=np.float32)
+    xyz /= np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16.0 / 116.0)
+    lab = np.stack([(116.0 * f[..., 1] - 16.0) / 100.0,
+                    500.0 * (f[..., 0] - f[..., 1]) / 128.0,
+                    200.0 * (f[..., 1] - f[..., 2]) / 128.0], axis=-1)
+    return lab.reshape(n, -1).astype(np.float32)
+
+def compact_features(pixels):
+    """(N, 128, 128, 3) uint8 -> (N, 896) float32"""
+    pixels = np.asarray(pixels, dtype=np.uint8)
+    rgb = pixels.astype(np.float32) / 255.0
+    return np.hstack([_hsv_histogram(pixels), _gradient_histograms(rgb), _lab_patches(rgb)])
+
+def raw_features(pixels):
+    """(N, 128, 128, 3) uint8 -> (N, 49152) flattened pixels in [0, 1] (the original pipeline)"""
+    # float32, not float64: the forest compares in float32 anyway, and it halves the memory
+    pixels = np.asarray(pixels)
+    return pixels.reshape(len(pixels), -1).astype(np.float32) / 255.0
+
+def image_input(pixels):
+    """(N, 128, 128, 3) uint8 -> same shape float32 in [0, 1], the input of the CNN (cnn_runtime.py)"""
+    return np.asarray(pixels, dtype=np.float32) / 255.0
+
+FEATURE_SETS = {'raw': raw_features, 'compact': compact_features, 'image': image_input}
+
+def get_transform(name):
+    if name not in FEATURE_SETS:
+        raise ValueError(f'Unknown feature set: {name}')
+    return FEATURE_SETS[name]
+
+def extract(pixels, name=DEFAULT_FEATURES, chunk=256):
+    """Transform a large uint8 stack in chunks so the float intermediates stay small"""
+    transform = get_transform(name)
+    if len(pixels) == 0:
+        return transform(np.zeros((1,) + pixels.shape[1:], dtype=np.uint8))[:0]
+    return np.vstack([transform(pixels[i:i + chunk]) for i in range(0, len(pixels), chunk)])
@@ -0,0 +1,48 @@
+"""In-memory image ingestion - one decode per upload, no temp files"""
+import base64
+import zlib
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+MODEL_SIZE = 128   # model input is MODEL_SIZE x MODEL_SIZE RGB
+THUMB_SIZE = 400   # preview sent back to the browser
+
+def decode_upload(file, max_side=THUMB_SIZE):
+    """Decode an uploaded FileStorage (or any file object or path) exactly once.
+
+    JPEGs are opened in draft mode so libjpeg's DCT scaling decodes at the
+    smallest 1/2, 1/4 or 1/8 scale that is still >= max_side on both axes -
+    a fraction of the work of a full-resolution decode. Other formats decode
+    normally. The DCT scale changes the pixels, so model input always comes
+    from model_input(), never from a decode made for the thumbnail.
+    """
+    stream = getattr(file, 'stream', file)
+    img = Image.open(stream)
+    img.draft('RGB', (max_side, max_side))
+    return img.convert('RGB')
+
+def model_pixels(img):
+    """MODEL_SIZE x MODEL_SIZE x 3 uint8 array - small enough to hold hundreds in memory"""
+    return np.asarray(img.resize((MODEL_SIZE, MODEL_SIZE)), dtype=np.uint8)
+
+def model_input(file):
+    """The model's MODEL_SIZE input for an upload or dataset file. /predict, /batch-predict,
+    stored samples and the training cache all decode through here (a MODEL_SIZE draft),
+    so the same file always gives the model the same pixels"""
+    return model_pixels(decode_upload(file, max_side=MODEL_SIZE))
+
+def pack_pixels(pixels):
+    """model_pixels array -> zlib-compressed bytes, what the samples table stores"""
+    return zlib.compress(np.ascontiguousarray(pixels, dtype=np.uint8).tobytes(), 6)
+
+def unpack_pixels(blob):
+    return np.frombuffer(zlib.decompress(blob), dtype=np.uint8).reshape(MODEL_SIZE, MODEL_SIZE, 3)
+
+def thumbnail_b64(img, size=THUMB_SIZE):
+    """Base64 JPEG preview of an already decoded image"""
+    thumb = img.copy()
+    thumb.thumbnail((size, size))
+    buffered = BytesIO()
+    thumb.save(buffered, format='JPEG')
+    return base64.b64encode(buffered.getvalue()).decode()
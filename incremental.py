@@ -0,0 +1,120 @@
+"""
+Incremental model updates from user feedback - seconds instead of a full train_simple.py run.
+
+Every /predict keeps its 128x128 input in the samples table and returns its
+sample_id; /submit-feedback links the user's verdict to it. An update takes
+the labelled samples that arrived since the active version was built
+(confirmed predictions and corrected breeds), fits a small batch of new trees
+on them - mixed with a random replay of the dataset cache, so the new trees
+still see every breed - and adds them to a copy of the active forest, or
+swaps them in for its oldest trees (--replace). The result is registered as
+a new version; nothing is retrained from dataset/.
+
+Usage:
+    python incremental.py                       # register an updated version
+    python incremental.py --replace --promote   # replace the oldest trees and serve it
+"""
+import argparse
+import os
+import time
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from database import get_labelled_samples
+from features import extract
+from imaging import MODEL_SIZE, unpack_pixels
+from jobs import report
+from model_registry import REGISTRY_DIR, LoadedVersion, active_version, promote, register
+from model_store import extend_forest
+
+UPDATE_TREES = int(os.environ.get('UPDATE_TREES', 20))
+MIN_SAMPLES  = int(os.environ.get('UPDATE_MIN_SAMPLES', 10))
+REPLAY_RATIO = 3      # dataset-cache images mixed in per feedback sample
+
+def _replay(index, n, seed):
+    """Up to n random (pixels, label) pairs from the dataset cache, labels mapped through index"""
+    from dataset_cache import DatasetCache
+    try:
+        cache = DatasetCache()
+    except FileNotFoundError:
+        return np.zeros((0, MODEL_SIZE, MODEL_SIZE, 3), dtype=np.uint8), np.zeros(0, dtype=np.int64)
+    mapping = np.array([index.get(name, -1) for name in cache.class_names], dtype=np.int64)
+    usable = np.flatnonzero(mapping[cache.labels] >= 0)
+    rows = np.sort(np.random.default_rng(seed).choice(usable, size=min(n, len(usable)), replace=False))
+    return np.asarray(cache.pixels[rows]), mapping[cache.labels[rows]]
+
+def update(n_trees=UPDATE_TREES, replace=False, promote_it=False, min_samples=MIN_SAMPLES,
+           replay_ratio=REPLAY_RATIO, registry_dir=REGISTRY_DIR):
+    """Build a new version from the active forest plus feedback; returns (version, metrics)"""
+    started = time.perf_counter()
+    parent = active_version(registry_dir)
+    if parent is None:
+        raise ValueError('No active model to update - run train_simple.py first')
+    base = LoadedVersion(parent, registry_dir)
+    if base.metrics.get('kind', 'random_forest') != 'random_forest':
+        raise ValueError(f'{parent} is a {base.metrics["kind"]} model - incremental updates need a RandomForest')
+
+    forest = base.model.get()
+    since = int(base.metrics.get('feedback_through', 0))
+    # New trees can only vote for classes the forest already has
+    index = {name: i for i, name in enumerate(base.class_names) if i in set(forest.meta['classes'])}
+    rows = [r for r in get_labelled_samples(since) if r['label'] in index]
+    if len(rows) < min_samples:
+        raise ValueError(f'Only {len(rows)} new labelled samples since {parent} (need {min_samples})')
+    feedback_through = rows[-1]['feedback_id']
+    pixels = np.stack([unpack_pixels(r['pixels']) for r in rows])
+    y = np.array([index[r['label']] for r in rows])
+
+    features = base.metrics.get('features', 'raw')
+    X = extract(pixels, features)
+    # How the parent did on these samples, before they influence anything
+    before = float((forest.classes_[np.argmax(forest.predict_proba(X), axis=1)] == y).mean())
+
+    replay_pixels, replay_y = _replay(index, replay_ratio * len(rows), seed=feedback_through)
+    if len(replay_y):
+        X = np.vstack([X, extract(replay_pixels, features)])
+        y = np.concatenate([y, replay_y])
+
+    model = RandomForestClassifier(n_estimators=n_trees, max_depth=forest.meta['max_depth'] or None,
+                                   random_state=feedback_through, n_jobs=-1)
+    model.fit(X, y)
+    base_forest = os.path.join(registry_dir, parent, 'model.forest')
+    metrics = {
+        'features': features,
+        'parent': parent,
+        'update': 'replace' if replace else 'append',
+        'trees_added': n_trees,
+        'trees_replaced': n_trees if replace else 0,
+        'feedback_samples': len(rows),
+        'replay_samples': int(len(replay_y)),
+        'feedback_through': int(feedback_through),
+        'parent_feedback_accuracy': round(before, 4),
+        'script': 'incremental.py',
+    }
+    version = register(None, base.class_names, metrics, registry_dir, write_artifact=lambda d: extend_forest(
+        base_forest, model, os.path.join(d, 'model.forest'), drop_oldest=n_trees if replace else 0))
+    if promote_it:
+        promote(version, registry_dir)
+    metrics['seconds'] = round(time.perf_counter() - started, 2)
+    return version, metrics
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trees', type=int, default=UPDATE_TREES, help='trees fitted on the new samples (default: %(default)s)')
+    parser.add_argument('--replace', action='store_true', help='drop as many of the oldest trees instead of growing the forest')
+    parser.add_argument('--promote', action='store_true', help='serve the new version right away')
+    parser.add_argument('--min-samples', type=int, default=MIN_SAMPLES)
+    args = parser.parse_args()
+    try:
+        version, metrics = update(args.trees, args.replace, args.promote, args.min_samples)
+    except ValueError as e:
+        print(f'[ERROR] {e}')
+        return
+    report(stage='done', version=version, feedback_samples=metrics['feedback_samples'], seconds=metrics['seconds'])
+    print(f"[OK] {version}{' (promoted)' if args.promote else ''} from {metrics['parent']}: "
+          f"{metrics['feedback_samples']} feedback + {metrics['replay_samples']} replay samples, "
+          f"{metrics['update']} {metrics['trees_added']} trees in {metrics['seconds']}s")
+    if not args.promote:
+        print(f'[INFO] To serve it: python model_registry.py promote {version}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Dynamic micro-batching - concurrent /predict calls share one predict_proba"""
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+
+MAX_BATCH   = int(os.environ.get('INFERENCE_MAX_BATCH', 16))
+MAX_WAIT_MS = float(os.environ.get('INFERENCE_MAX_WAIT_MS', 10))
+
+class _Pending:
+    __slots__ = ('x', 'model', 'enqueued', 'done', 'result', 'error')
+
+    def __init__(self, x, model):
+        self.x = x
+        self.model = model
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class BatchScheduler:
+    """Collects single-sample requests and runs them through predict_fn together.
+
+    The first request to arrive opens a window of max_wait_ms; everything that
+    lands in the queue before it closes (up to max_batch samples) is stacked
+    into one array and scored with a single predict_fn call, then each
+    caller gets its own row back. Callers may instead pass the model to score
+    with (anything with predict_proba); a batch spanning a model hot-swap is
+    split so every request is answered by the model it was submitted with.
+    """
+
+    def __init__(self, predict_fn=None, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._samples = 0
+        self._sizes = {}
+        self._wait_total = 0.0
+        self._infer_total = 0.0
+
+    def submit(self, x, model=None):
+        """Score one feature vector; blocks until its batch has run and returns its proba row"""
+        item = _Pending(x, model)
+        with self._cond:
+            self._ensure_worker()
+            self._queue.append(item)
+            self._cond.notify()
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _ensure_worker(self):
+        # Started lazily and re-started after fork: gunicorn workers don't inherit threads
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = self._queue[0].enqueued + self.max_wait
+            while len(self._queue) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self._queue), self.max_batch)
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            groups = {}
+            for item in batch:
+                groups.setdefault(id(item.model), []).append(item)
+            for group in groups.values():
+                model = group[0].model
+                predict_fn = model.predict_proba if model is not None else self.predict_fn
+                try:
+                    proba = predict_fn(np.stack([item.x for item in group]))
+                    for item, row in zip(group, proba):
+                        item.result = row
+                except Exception as e:
+                    for item in group:
+                        item.error = e
+            finished = time.perf_counter()
+            with self._cond:
+                self._batches += 1
+                self._samples += len(batch)
+                self._sizes[len(batch)] = self._sizes.get(len(batch), 0) + 1
+                self._wait_total += sum(started - item.enqueued for item in batch)
+                self._infer_total += finished - started
+            for item in batch:
+                item.done.set()
+
+    def stats(self):
+        with self._cond:
+            batches = self._batches or 1
+            samples = self._samples or 1
+            return {
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'queue_depth': len(self._queue),
+                'batches': self._batches,
+                'samples': self._samples,
+                'avg_batch_size': round(self._samples / batches, 2),
+                'batch_sizes': {str(k): v for k, v in sorted(self._sizes.items())},
+                'avg_queue_wait_ms': round(self._wait_total / samples * 1000.0, 3),
+                'avg_inference_ms': round(self._infer_total / batches * 1000.0, 3),
+            }
+
+    def configure(self, max_batch=None, max_wait_ms=None, reset_stats=False):
+        """Retune the knobs at runtime (takes effect from the next batch)"""
+        with self._cond:
+            if max_batch is not None:
+                self.max_batch = max(1, int(max_batch))
+            if max_wait_ms is not None:
+                self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+            if reset_stats:
+                self._reset_stats()
+            self._cond.notify()
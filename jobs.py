@@ -0,0 +1,202 @@
+"""Background training jobs - one at a time, niced, thread-limited, cancellable, recorded in the DB.
+
+Admin requests only enqueue a row in the jobs table. A runner thread in the
+web worker that enqueued (or polled) claims the oldest queued job - the claim
+is a single IMMEDIATE transaction, so across all gunicorn workers at most one
+job runs - and starts the training script as a child process:
+
+    nice -n JOB_NICE   lower CPU priority than the web workers
+    JOB_THREADS        caps BLAS/OpenMP/joblib/TensorFlow threads and decode workers
+
+Training scripts report progress by printing `[PROGRESS] {json}` lines
+(report() below); the runner folds them into the job's progress column,
+keeps the last lines of output, heartbeats updated_at and polls the
+cancel flag. A job whose runner disappears is failed once its heartbeat is
+JOB_STALE_SECONDS old, and its process group - which outlives the runner -
+is killed first, so a new claim never runs alongside it.
+"""
+import json
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from database import claim_next_job, create_job, get_job, list_jobs, request_job_cancel, update_job
+
+JOB_NICE          = int(os.environ.get('JOB_NICE', 10))
+JOB_THREADS       = int(os.environ.get('JOB_THREADS', 2))
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 60))
+HEARTBEAT_SECONDS = 2.0
+LOG_LINES         = 20
+PROGRESS_PREFIX   = '[PROGRESS] '
+
+# kind -> (script, {param: (argparse flag, type)}); only these can be launched
+JOB_KINDS = {
+    'train_simple': ('train_simple.py', {'features': ('--features', str)}),
+    'train_cnn':    ('train_cnn.py', {}),
+    'incremental':  ('incremental.py', {'trees': ('--trees', int), 'replace': ('--replace', bool),
+                                        'promote': ('--promote', bool)}),
+}
+
+def report(**fields):
+    """Called by training scripts: one progress update for the job runner (harmless on a terminal)"""
+    print(PROGRESS_PREFIX + json.dumps(fields), flush=True)
+
+def _command(kind, params):
+    script, allowed = JOB_KINDS[kind]
+    # nice(1) rather than a preexec_fn, which isn't safe to run in a threaded web worker
+    argv = (['nice', '-n', str(JOB_NICE)] if os.name == 'posix' else []) + [sys.executable, '-u', script]
+    for name, value in params.items():
+        flag, kind_type = allowed[name]
+        if kind_type is bool:
+            if value:
+                argv.append(flag)
+        else:
+            argv += [flag, str(kind_type(value))]
+    return argv
+
+def _child_env():
+    env = dict(os.environ)
+    threads = str(JOB_THREADS)
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS',
+                'LOKY_MAX_CPU_COUNT', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS', 'DATASET_WORKERS'):
+        env[var] = threads
+    return env
+
+class JobManager:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runner = None
+
+    def submit(self, kind, params=None, requested_by=None):
+        """Queue a job; returns its id. Raises ValueError for unknown kinds or parameters."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f'Unknown job kind: {kind}')
+        params = params or {}
+        unknown = set(params) - set(JOB_KINDS[kind][1])
+        if unknown:
+            raise ValueError(f'Unknown parameters for {kind}: {", ".join(sorted(unknown))}')
+        _command(kind, params)   # type-check the values now rather than in the runner
+        # Repeated clicks don't pile up identical trainings behind each other
+        for job in list_jobs(50):
+            if job['status'] == 'queued' and job['kind'] == kind and json.loads(job['params'] or '{}') == params:
+                self.poke()
+                return job['id']
+        job_id = create_job(kind, json.dumps(params), requested_by)
+        self.poke()
+        return job_id
+
+    def cancel(self, job_id):
+        request_job_cancel(job_id)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        job = get_job(job_id)
+        return _public(job) if job else None
+
+    def list(self, limit=20):
+        self.poke()   # a worker that died mid-queue leaves work behind; any poll picks it up
+        return [_public(j) for j in list_jobs(limit)]
+
+    def poke(self):
+        """Make sure this process has a runner draining the queue"""
+        with self._lock:
+            if self._runner is None or not self._runner.is_alive():
+                self._runner = threading.Thread(target=self._drain, daemon=True, name='job-runner')
+                self._runner.start()
+
+    def _drain(self):
+        while True:
+            stale = (datetime.now() - timedelta(seconds=JOB_STALE_SECONDS)).isoformat()
+            job = claim_next_job(stale, reap=_kill_orphan)
+            if job is None:
+                return   # nothing queued, or another worker's runner holds the slot
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job['id']
+        try:
+            proc = subprocess.Popen(_command(job['kind'], json.loads(job['params'] or '{}')),
+                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+                                    env=_child_env(), start_new_session=True)   # own process group: cancel also stops its children
+        except (OSError, ValueError, KeyError) as e:
+            update_job(job_id, status='failed', error=str(e), finished_at=datetime.now().isoformat())
+            return
+        update_job(job_id, pid=proc.pid)   # also its process group id (start_new_session)
+
+        lines = queue.Queue()
+        threading.Thread(target=_pump, args=(proc.stdout, lines), daemon=True).start()
+        progress, tail = {}, deque(maxlen=LOG_LINES)
+        cancelled, last_beat, eof = False, 0.0, False
+        while not eof:
+            try:
+                line = lines.get(timeout=HEARTBEAT_SECONDS)
+                while True:   # drain whatever else is buffered
+                    if line is None:
+                        eof = True
+                        break
+                    line = line.rstrip()
+                    if line.startswith(PROGRESS_PREFIX):
+                        try:
+                            progress.update(json.loads(line[len(PROGRESS_PREFIX):]))
+                        except ValueError:
+                            pass
+                    elif line:
+                        tail.append(line)
+                    line = lines.get_nowait()
+            except queue.Empty:
+                pass
+            # At most one write per interval, however chatty the script is
+            if time.monotonic() - last_beat >= HEARTBEAT_SECONDS:
+                update_job(job_id, progress=json.dumps(progress), log_tail='\n'.join(tail))
+                last_beat = time.monotonic()
+                if not cancelled and (get_job(job_id) or {}).get('cancel_requested'):
+                    cancelled = True
+                    _terminate(proc)
+        code = proc.wait()
+
+        if cancelled:
+            status, error = 'cancelled', None
+        elif code == 0 and not any(l.startswith('[ERROR]') for l in tail):
+            status, error = 'done', None
+        else:
+            status = 'failed'
+            error = next((l for l in reversed(tail) if l.startswith('[ERROR]')), None) or f'Exit code {code}'
+        update_job(job_id, status=status, error=error, progress=json.dumps(progress), log_tail='\n'.join(tail),
+                   finished_at=datetime.now().isoformat())
+
+def _pump(stream, lines):
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+def _terminate(proc, grace=5.0):
+    def kill(sig):
+        try:
+            os.killpg(proc.pid, sig) if os.name == 'posix' else proc.send_signal(sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+    kill(signal.SIGTERM)
+    threading.Timer(grace, lambda: proc.poll() is None and kill(signal.SIGKILL)).start()
+
+def _kill_orphan(pgid):
+    # A stale job's runner died, but the child is in its own session and may still be
+    # training; stop it before the slot is handed to the next job
+    if os.name != 'posix':
+        return
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+        print(f'[INFO] Killed orphaned training process group {pgid}')
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def _public(job):
+    job = dict(job)
+    job['params'] = json.loads(job['params'] or '{}')
+    job['progress'] = json.loads(job['progress'] or '{}')
+    job['cancel_requested'] = bool(job['cancel_requested'])
+    return job
@@ -0,0 +1,238 @@
+"""Versioned model registry with atomic promotion and in-process hot-swap.
+
+Layout:
+    models/
+        v0001/  model.forest/  class_names.txt  metrics.json
+        v0002/  model.npz      class_names.txt  metrics.json   (kind: cnn, see cnn_export.py)
+        ...
+        ACTIVE              <- name of the promoted version, replaced atomically
+
+Training registers a new version (built in a staging dir, then renamed into
+place) and promotes it by rewriting ACTIVE with os.replace. Running workers
+notice the new ACTIVE within CHECK_INTERVAL seconds, map the new version
+and swap one reference: requests already in flight keep the snapshot they
+started with, new requests get the new one.
+
+Usage:
+    python model_registry.py list
+    python model_registry.py promote v0003
+"""
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+from features import get_transform
+from model_store import LazyModel, export_forest
+from prediction_cache import model_version
+
+REGISTRY_DIR   = os.environ.get('MODEL_REGISTRY_DIR', 'models')
+CHECK_INTERVAL = float(os.environ.get('MODEL_CHECK_INTERVAL', 2.0))
+ACTIVE_FILE    = 'ACTIVE'
+
+def _version_dirs(registry_dir):
+    if not os.path.isdir(registry_dir):
+        return []
+    return sorted(d for d in os.listdir(registry_dir)
+                  if d.startswith('v') and d[1:].isdigit() and os.path.isdir(os.path.join(registry_dir, d)))
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    active = active_version(registry_dir)
+    versions = []
+    for name in _version_dirs(registry_dir):
+        versions.append(dict(read_metrics(name, registry_dir), version=name, active=name == active))
+    return versions
+
+def read_metrics(version, registry_dir=REGISTRY_DIR):
+    try:
+        with open(os.path.join(registry_dir, version, 'metrics.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def active_version(registry_dir=REGISTRY_DIR):
+    try:
+        with open(os.path.join(registry_dir, ACTIVE_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def register(model, class_names, metrics=None, registry_dir=REGISTRY_DIR, write_artifact=None):
+    """Store a trained model as the next version; returns its name. Does not promote it.
+
+    write_artifact(version_dir) can replace the default RandomForest export for
+    other model kinds.
+    """
+    os.makedirs(registry_dir, exist_ok=True)
+    staging = os.path.join(registry_dir, f'.staging-{os.getpid()}-{time.time_ns()}')
+    os.makedirs(staging)
+    try:
+        if write_artifact is not None:
+            write_artifact(staging)
+        else:
+            export_forest(model, os.path.join(staging, 'model.forest'))
+        with open(os.path.join(staging, 'class_names.txt'), 'w') as f:
+            f.write('\n'.join(class_names))
+        metrics = dict({'kind': 'random_forest'}, **(metrics or {}))
+        metrics.setdefault('created_at', datetime.now().isoformat())
+        metrics['classes'] = len(class_names)
+        with open(os.path.join(staging, 'metrics.json'), 'w') as f:
+            json.dump(metrics, f, indent=2)
+        # Claim the next free version number; a concurrent registration just bumps to the next one
+        while True:
+            existing = _version_dirs(registry_dir)
+            version = 'v%04d' % (int(existing[-1][1:]) + 1 if existing else 1)
+            try:
+                os.rename(staging, os.path.join(registry_dir, version))
+                return version
+            except OSError:
+                if not os.path.exists(staging):
+                    raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def promote(version, registry_dir=REGISTRY_DIR):
+    """Atomically make version the one every worker serves"""
+    if version not in _version_dirs(registry_dir):
+        raise ValueError(f'Unknown model version: {version}')
+    tmp = os.path.join(registry_dir, f'{ACTIVE_FILE}.tmp{os.getpid()}')
+    with open(tmp, 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(registry_dir, ACTIVE_FILE))
+
+def import_legacy(pkl_path, classes_path, registry_dir=REGISTRY_DIR):
+    """Register (and promote) a cattle_model.pkl + class_names.txt dropped in the project root.
+
+    Guarded by a lock file and keyed by the files' fingerprint, so with several
+    workers starting at once the pair is imported exactly once.
+    """
+    fingerprint = model_version(pkl_path, classes_path)
+    os.makedirs(registry_dir, exist_ok=True)
+    lock = os.path.join(registry_dir, '.import.lock')
+    try:
+        if time.time() - os.path.getmtime(lock) > 600:
+            os.remove(lock)   # left behind by a crashed worker
+    except OSError:
+        pass
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    try:
+        for v in list_versions(registry_dir):
+            if v.get('source_fingerprint') == fingerprint:
+                return None
+        import pickle
+        with open(pkl_path, 'rb') as f:
+            model = pickle.load(f)
+        with open(classes_path) as f:
+            class_names = [line.strip() for line in f]
+        version = register(model, class_names, {'source': pkl_path, 'source_fingerprint': fingerprint}, registry_dir)
+        promote(version, registry_dir)
+        return version
+    finally:
+        os.close(fd)
+        os.remove(lock)
+
+class LoadedVersion:
+    """One immutable snapshot of a served model - grab it once per request"""
+
+    def __init__(self, version, registry_dir):
+        path = os.path.join(registry_dir, version)
+        self.version = version
+        self.metrics = read_metrics(version, registry_dir)
+        with open(os.path.join(path, 'class_names.txt')) as f:
+            self.class_names = [line.strip() for line in f]
+        if self.metrics.get('kind') == 'cnn':
+            from cnn_runtime import CNNModel
+            self.model = LazyModel(os.path.join(path, 'model.npz'), loader=CNNModel)
+        else:
+            self.model = LazyModel(os.path.join(path, 'model.forest'))
+        # Versions that predate features.py were trained on raw pixels
+        self.transform = get_transform(self.metrics.get('features', 'raw'))
+        self.loaded_at = datetime.now().isoformat()
+
+class ActiveModel:
+    """Tracks models/ACTIVE and swaps the served model when it changes"""
+
+    def __init__(self, registry_dir=REGISTRY_DIR, legacy_model=None, legacy_classes=None,
+                 check_interval=CHECK_INTERVAL, preload=False):
+        self.registry_dir = registry_dir
+        self.legacy = (legacy_model, legacy_classes)
+        self.check_interval = check_interval
+        self.preload = preload
+        self._lock = threading.Lock()
+        self._current = None
+        self._checked = 0.0
+        self._legacy_seen = None
+        self.swaps = 0
+        self.last_swap_ms = None
+        self._check()
+
+    def current(self):
+        """The snapshot to serve this request with, or None in demo mode"""
+        if time.monotonic() - self._checked >= self.check_interval and self._lock.acquire(blocking=False):
+            # One thread checks; the others keep serving the current snapshot meanwhile
+            try:
+                self._check()
+            finally:
+                self._lock.release()
+        return self._current
+
+    def _check(self):
+        self._checked = time.monotonic()
+        legacy_model, legacy_classes = self.legacy
+        if legacy_model and os.path.exists(legacy_model) and os.path.exists(legacy_classes):
+            fingerprint = model_version(legacy_model, legacy_classes)
+            if fingerprint != self._legacy_seen:
+                version = import_legacy(legacy_model, legacy_classes, self.registry_dir)
+                if version:
+                    print(f"[INFO] Imported {legacy_model} into the model registry as {version}")
+                self._legacy_seen = fingerprint
+        version = active_version(self.registry_dir)
+        if version and (self._current is None or self._current.version != version):
+            self._swap(version)
+
+    def _swap(self, version):
+        started = time.perf_counter()
+        try:
+            loaded = LoadedVersion(version, self.registry_dir)
+            if self.preload or self._current is not None:
+                # Map a hot-swapped version before publishing it so no request pays for it
+                loaded.model.preload()
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] Could not load model {version}: {e} - still serving "
+                  f"{self._current.version if self._current else 'demo mode'}")
+            return
+        previous = self._current
+        self._current = loaded
+        self.last_swap_ms = round((time.perf_counter() - started) * 1000.0, 2)
+        if previous is not None:
+            self.swaps += 1
+            print(f"[OK] Hot-swapped model {previous.version} -> {version} in {self.last_swap_ms} ms")
+        else:
+            print(f"[OK] Serving model {version} with {len(loaded.class_names)} breeds")
+
+    def stats(self):
+        current = self._current
+        if current is None:
+            return {'active_version': None, 'demo_mode': True}
+        return dict(current.model.stats(),
+            active_version=current.version, loaded_at=current.loaded_at,
+            swap_ms=self.last_swap_ms, swaps=self.swaps,
+            classes=len(current.class_names), metrics=current.metrics)
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'list':
+        for v in list_versions():
+            print(f"{'*' if v['active'] else ' '} {v['version']}  {v.get('created_at', '')[:19]}  "
+                  f"accuracy={v.get('accuracy', 'n/a')}  classes={v.get('classes', '?')}")
+    elif len(sys.argv) == 3 and sys.argv[1] == 'promote':
+        promote(sys.argv[2])
+        print(f"[OK] Promoted {sys.argv[2]}")
+    else:
+        print(__doc__)
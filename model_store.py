@@ -0,0 +1,205 @@
+"""Memory-mapped RandomForest artifacts - N workers share one physical copy of the trees.
+
+A trained sklearn forest is flattened into a directory of .npy node tables
+(feature, threshold, left/right child, per-leaf class probabilities) plus a
+meta.json. Workers open the tables with np.load(mmap_mode='r'), so the OS
+page cache holds a single read-only copy no matter how many gunicorn workers
+serve predictions, and nothing is unpickled at boot.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+
+FORMAT_VERSION = 1
+ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+
+def flatten_forest(model, classes=None):
+    """Node tables + meta for a fitted RandomForestClassifier.
+
+    classes: class labels the value columns should line up with (default:
+    model.classes_) - lets trees fitted on a subset of labels join a forest.
+    """
+    classes = [int(c) for c in (model.classes_ if classes is None else classes)]
+    column = {c: i for i, c in enumerate(classes)}
+    cols = [column[int(c)] for c in model.classes_]
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset, max_depth = 0, 0
+    for est in model.estimators_:
+        tree = est.tree_
+        leaf = tree.children_left == -1
+        roots.append(offset)
+        features.append(np.where(leaf, -1, tree.feature).astype(np.int32))
+        thresholds.append(tree.threshold.astype(np.float64))
+        lefts.append(np.where(leaf, -1, tree.children_left + offset).astype(np.int32))
+        rights.append(np.where(leaf, -1, tree.children_right + offset).astype(np.int32))
+        # Leaf class distribution, normalised the way DecisionTreeClassifier.predict_proba does
+        value = tree.value[:, 0, :].astype(np.float64)
+        totals = value.sum(axis=1, keepdims=True)
+        value = np.divide(value, totals, out=np.zeros_like(value), where=totals > 0)
+        full = np.zeros((len(value), len(classes)), dtype=np.float64)
+        full[:, cols] = value
+        values.append(full)
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    tables = {
+        'feature': np.concatenate(features), 'threshold': np.concatenate(thresholds),
+        'left': np.concatenate(lefts), 'right': np.concatenate(rights),
+        'value': np.concatenate(values), 'roots': np.asarray(roots, dtype=np.int32),
+    }
+    meta = {
+        'format': FORMAT_VERSION, 'kind': 'random_forest',
+        'n_features': int(model.n_features_in_), 'n_trees': len(roots), 'n_nodes': int(offset),
+        'max_depth': int(max_depth), 'classes': classes,
+    }
+    return tables, meta
+
+def write_forest(out_dir, tables, meta):
+    """Write node tables + meta.json as an artifact directory (atomically replaced)"""
+    base = out_dir.rstrip('/\\')
+    tmp_dir = f'{base}.tmp{os.getpid()}'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, arr in tables.items():
+        np.save(os.path.join(tmp_dir, name + '.npy'), arr)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    # Readers only ever see a complete artifact: swap the whole directory in by rename.
+    # Open mmaps of the old files stay valid after they are unlinked.
+    old_dir = f'{base}.old{os.getpid()}'
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    try:
+        os.replace(tmp_dir, out_dir)
+    except OSError:
+        # Another worker installed the same artifact first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return meta
+
+def export_forest(model, out_dir):
+    """Write a fitted RandomForestClassifier as a mmap-able artifact directory (atomically replaced)"""
+    tables, meta = flatten_forest(model)
+    return write_forest(out_dir, tables, meta)
+
+def extend_forest(base_path, model, out_dir, drop_oldest=0):
+    """Artifact at out_dir = the forest at base_path minus its `drop_oldest` first trees,
+    plus the trees of `model` (fitted on labels drawn from the base forest's classes)"""
+    base = Forest(base_path, mmap=False)
+    if model.n_features_in_ != base.n_features_in_:
+        raise ValueError(f'Feature count mismatch: {model.n_features_in_} != {base.n_features_in_}')
+    drop_oldest = min(drop_oldest, base.meta['n_trees'] - 1)
+    roots = np.asarray(base.roots, dtype=np.int64)
+    start = int(roots[drop_oldest]) if drop_oldest else 0
+    kept = {name: np.asarray(getattr(base, name))[start:] for name in ('feature', 'threshold', 'value')}
+    for name in ('left', 'right'):
+        links = np.asarray(getattr(base, name))[start:]
+        kept[name] = np.where(links >= 0, links - start, -1).astype(np.int32)
+
+    new, new_meta = flatten_forest(model, classes=base.meta['classes'])
+    shift = len(kept['feature'])
+    for name in ('left', 'right'):
+        new[name] = np.where(new[name] >= 0, new[name] + shift, -1).astype(np.int32)
+    tables = {name: np.concatenate([kept[name], new[name]]) for name in ('feature', 'threshold', 'left', 'right', 'value')}
+    tables['roots'] = np.concatenate([roots[drop_oldest:] - start, new['roots'] + shift]).astype(np.int32)
+    meta = dict(base.meta, n_trees=len(tables['roots']), n_nodes=len(tables['feature']),
+                max_depth=max(base.meta['max_depth'], new_meta['max_depth']))
+    return write_forest(out_dir, tables, meta)
+
+class Forest:
+    """predict_proba over the flattened node tables; every tree is walked level by level in NumPy"""
+
+    def __init__(self, path, mmap=True):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        mode = 'r' if mmap else None
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, name + '.npy'), mmap_mode=mode))
+        self.classes_ = np.asarray(self.meta['classes'])
+        self.n_features_in_ = self.meta['n_features']
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    def predict_proba(self, X):
+        # sklearn compares float32 inputs against float64 thresholds - do the same
+        X = np.asarray(X, dtype=np.float32)
+        n = len(X)
+        nodes = np.repeat(np.asarray(self.roots)[None, :], n, axis=0)   # (samples, trees)
+        rows = np.arange(n)[:, None]
+        for _ in range(self.meta['max_depth']):
+            feat = self.feature[nodes]
+            internal = feat >= 0
+            if not internal.any():
+                break
+            go_left = X[rows, np.where(internal, feat, 0)] <= self.threshold[nodes]
+            nodes = np.where(internal, np.where(go_left, self.left[nodes], self.right[nodes]), nodes)
+        return self.value[nodes].sum(axis=1) / self.meta['n_trees']
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class LazyModel:
+    """Stand-in for the sklearn model that maps the artifact on first use (or on preload()).
+
+    loader builds the model from the artifact path - Forest by default, or any
+    class with predict_proba, .meta and .nbytes (e.g. cnn_runtime.CNNModel).
+    """
+
+    def __init__(self, path, loader=Forest):
+        self.path = path
+        self.loader = loader
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_ms = None
+        self.rss_delta = None
+
+    def get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    rss_before = _rss_bytes()
+                    started = time.perf_counter()
+                    model = self.loader(self.path)
+                    self.load_ms = round((time.perf_counter() - started) * 1000.0, 2)
+                    rss_after = _rss_bytes()
+                    if rss_before is not None and rss_after is not None:
+                        self.rss_delta = rss_after - rss_before
+                    self._model = model
+        return self._model
+
+    preload = get
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def predict_proba(self, X):
+        return self.get().predict_proba(X)
+
+    def predict(self, X):
+        return self.get().predict(X)
+
+    def stats(self):
+        model = self._model
+        return {
+            'artifact': self.path,
+            'loaded': model is not None,
+            'load_ms': self.load_ms,
+            'trees': model.meta.get('n_trees') if model else None,
+            'nodes': model.meta.get('n_nodes') if model else None,
+            'mapped_bytes': model.nbytes if model else None,
+            'rss_delta_bytes': self.rss_delta,
+            'process_rss_bytes': _rss_bytes(),
+        }
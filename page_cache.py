@@ -0,0 +1,68 @@
+"""Rendered-page cache for content-only templates (encyclopedia, health, search, ...).
+
+These pages come out the same for every user with the same language, so each
+is rendered once per (template, language, catalog version, vary) and served
+as a string afterwards - no Jinja, no inject_globals. The only per-user bit
+base.html shows, the name in the navbar, is rendered as a placeholder and
+filled in (escaped) on every hit. Entries live until invalidate() or until the
+catalog version changes.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from html import escape
+from flask import render_template
+
+PAGE_CACHE      = os.environ.get('PAGE_CACHE', '1') == '1'
+PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 256))
+USER_NAME       = '\x00user-name\x00'   # survives autoescaping unchanged, never appears in real content
+
+class PageCache:
+    def __init__(self, enabled=PAGE_CACHE, max_entries=PAGE_CACHE_SIZE):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()   # (template, lang, version, vary) -> html with USER_NAME placeholders
+        self._renders = {}            # template -> [renders, total seconds]
+        self.hits = self.misses = 0
+
+    def render(self, template, lang, user_name, version='', vary=(), **context):
+        """render_template(template, **context) for a user of this language, from cache when possible"""
+        key = (template, lang, version, tuple(vary))
+        if self.enabled:
+            with self._lock:
+                html = self._pages.get(key)
+                if html is not None:
+                    self._pages.move_to_end(key)
+                    self.hits += 1
+                    return html.replace(USER_NAME, escape(user_name))
+                self.misses += 1
+        start = time.perf_counter()
+        html = render_template(template, user_name=USER_NAME, **context)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            totals = self._renders.setdefault(template, [0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed
+            if self.enabled:
+                self._pages[key] = html
+                while len(self._pages) > self.max_entries:
+                    self._pages.popitem(last=False)
+        return html.replace(USER_NAME, escape(user_name))
+
+    def invalidate(self, template=None):
+        """Drop every cached page, or every language/version of one template; returns how many"""
+        with self._lock:
+            keys = [k for k in self._pages if template is None or k[0] == template]
+            for k in keys:
+                del self._pages[k]
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'enabled': self.enabled, 'entries': len(self._pages), 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                    'renders': {t: {'count': n, 'avg_ms': round(total / n * 1000, 3)}
+                                for t, (n, total) in self._renders.items()}}
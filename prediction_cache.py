@@ -0,0 +1,138 @@
+"""Content-addressed prediction cache - in-process LRU/TTL plus an optional SQLite tier shared by all workers"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+CACHE_MAX_ENTRIES = int(os.environ.get('PREDICTION_CACHE_SIZE', 512))
+CACHE_TTL         = float(os.environ.get('PREDICTION_CACHE_TTL', 24 * 3600))
+CACHE_SHARED_DB   = os.environ.get('PREDICTION_CACHE_DB', '')   # e.g. prediction_cache.db; empty = in-process only
+CACHE_USE_PHASH   = os.environ.get('PREDICTION_CACHE_PHASH', '0') == '1'
+
+def model_version(*paths):
+    """Cheap fingerprint of the model files on disk - changes whenever any of them is rewritten"""
+    parts = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            parts.append(f'{st.st_size}:{st.st_mtime_ns}')
+        except OSError:
+            parts.append('missing')
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:16]
+
+def content_key(data):
+    """Key for the exact uploaded bytes"""
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+def perceptual_key(pixels):
+    """64-bit difference hash of the model input, so re-encoded copies of one photo share a key"""
+    gray = pixels.astype(np.float32).mean(axis=2)
+    h, w = gray.shape
+    # 8 rows x 9 cols of block means, then compare horizontal neighbours
+    small = gray[:h // 8 * 8, :w // 9 * 9].reshape(8, h // 8, 9, w // 9).mean(axis=(1, 3))
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return 'dhash:' + '%016x' % int(''.join('1' if b else '0' for b in bits), 2)
+
+class PredictionCache:
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, shared_db=CACHE_SHARED_DB):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared_db = shared_db
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._version = None
+        self.hits = self.shared_hits = self.misses = self.evictions = 0
+        if shared_db:
+            conn = self._shared()
+            conn.execute('''CREATE TABLE IF NOT EXISTS prediction_cache (
+                key TEXT NOT NULL, version TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL,
+                PRIMARY KEY (key, version))''')
+            conn.commit(); conn.close()
+
+    def _shared(self):
+        conn = sqlite3.connect(self.shared_db, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _check_version(self, version):
+        # A new model makes this worker's cached results stale - drop them instead of waiting for the TTL.
+        # Shared rows are keyed by version, so other versions' rows are never read here; they are left
+        # to expire, since during a rolling promote other workers may still be serving that version
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+            if self.shared_db:
+                conn = self._shared()
+                conn.execute('DELETE FROM prediction_cache WHERE expires < ?', (time.time(),))
+                conn.commit(); conn.close()
+
+    def get(self, key, version):
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+        if self.shared_db:
+            conn = self._shared()
+            row = conn.execute('SELECT value, expires FROM prediction_cache WHERE key=? AND version=?', (key, version)).fetchone()
+            conn.close()
+            if row and row[1] > now:
+                value = json.loads(row[0])
+                with self._lock:
+                    self.shared_hits += 1
+                    self._store(key, value, row[1])
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, version, value):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._check_version(version)
+            self._store(key, value, expires)
+        if self.shared_db:
+            conn = self._shared()
+            conn.execute('INSERT OR REPLACE INTO prediction_cache VALUES (?,?,?,?)', (key, version, json.dumps(value), expires))
+            conn.commit(); conn.close()
+
+    def _store(self, key, value, expires):
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.shared_db:
+            conn = self._shared()
+            conn.execute('DELETE FROM prediction_cache')
+            conn.commit(); conn.close()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'shared_tier': bool(self.shared_db),
+                'perceptual_hash': CACHE_USE_PHASH,
+                'model_version': self._version,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            }
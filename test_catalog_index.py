@@ -0,0 +1,61 @@
+"""
+CatalogIndex filters and autocomplete search, on a small fixture catalog.
+
+Usage:
+    python test_catalog_index.py      (or: python -m pytest test_catalog_index.py)
+"""
+from catalog_index import CatalogIndex
+
+BREEDS = {
+    'Gir':               {'type': 'Dairy',        'origin': 'Gujarat'},
+    'Sahiwal':           {'type': 'Dairy',        'origin': 'Punjab'},
+    'Hariana':           {'type': 'Dual Purpose', 'origin': 'Haryana'},
+    'Hallikar':          {'type': 'Draught',      'origin': 'Karnataka'},
+    'Holstein_Friesian': {'type': 'Dairy',        'origin': 'Netherlands'},
+    'Red_Sindhi':        {'type': 'Dairy',        'origin': 'Sindh'},
+}
+STATE_BREEDS = {'Punjab': ['Sahiwal', 'Holstein_Friesian'], 'Gujarat': ['Gir', 'Unknown']}
+
+def _names(results):
+    return [r['breed'] for r in results]
+
+def test_inverted_indexes():
+    ix = CatalogIndex(BREEDS, STATE_BREEDS)
+    assert ix.filter('dairy') == ['Gir', 'Sahiwal', 'Holstein_Friesian', 'Red_Sindhi']
+    assert ix.filter('all', 'PUN') == ['Sahiwal']
+    assert ix.filter('draught', 'gujarat') == []
+    assert ix.by_state['Gujarat'] == ['Gir']   # unknown breeds are dropped
+    assert ix.similar('Sahiwal') == ['Gir', 'Holstein_Friesian', 'Red_Sindhi']
+
+def test_prefix_search():
+    ix = CatalogIndex(BREEDS, STATE_BREEDS)
+    assert _names(ix.search('ha')) == ['Hariana', 'Hallikar']
+    assert _names(ix.search('fries')) == ['Holstein_Friesian']
+    assert ix.search('GIR')[0] == {'breed': 'Gir', 'score': 2.0, 'match': 'prefix'}
+    assert ix.search('') == ix.search('  ') == []
+
+def test_infix_search():
+    ix = CatalogIndex(BREEDS, STATE_BREEDS)
+    assert [(r['breed'], r['match']) for r in ix.search('al')] == [('Sahiwal', 'infix'), ('Hallikar', 'infix')]
+    # Shorter names (more of the name matched) first
+    assert _names(ix.search('ar')) == ['Hariana', 'Hallikar']
+
+def test_typo_tolerance():
+    ix = CatalogIndex(BREEDS, STATE_BREEDS)
+    assert _names(ix.search('sahiwl'))[0] == 'Sahiwal'
+    assert _names(ix.search('holstien'))[0] == 'Holstein_Friesian'
+    assert _names(ix.search('red sindi'))[0] == 'Red_Sindhi'
+    assert ix.search('zzzz') == []
+
+def test_search_ranking_and_filters():
+    ix = CatalogIndex(BREEDS, STATE_BREEDS)
+    # Origin and state matches weigh the same; ties keep catalog order
+    assert _names(ix.search('punjab')) == ['Sahiwal', 'Holstein_Friesian']
+    assert _names(ix.search('punjab', breed_type='dual purpose')) == []
+    assert _names(ix.search('h', limit=2)) == ['Hariana', 'Hallikar']
+
+if __name__ == '__main__':
+    for name, fn in list(globals().items()):
+        if name.startswith('test_'):
+            fn()
+            print(f'[OK] {name}')
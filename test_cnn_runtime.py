@@ -0,0 +1,79 @@
+"""
+Numerical parity of cnn_runtime.py (NumPy) against Keras for the train_cnn.py model.
+The Keras check needs TensorFlow and is skipped without it.
+
+Usage:
+    python test_cnn_runtime.py      (or: python -m pytest test_cnn_runtime.py)
+"""
+import os
+import tempfile
+import numpy as np
+from cnn_runtime import CNNModel, conv2d
+from cnn_export import export_keras
+
+def _naive_conv(x, kernel, bias, stride, padding):
+    kh, kw, _, cout = kernel.shape
+    n, h, w, _ = x.shape
+    if padding == 'same':
+        ho, wo = -(-h // stride), -(-w // stride)
+        ph, pw = max((ho - 1) * stride + kh - h, 0), max((wo - 1) * stride + kw - w, 0)
+        x = np.pad(x, ((0, 0), (ph // 2, ph - ph // 2), (pw // 2, pw - pw // 2), (0, 0)))
+    else:
+        ho, wo = (h - kh) // stride + 1, (w - kw) // stride + 1
+    out = np.zeros((n, ho, wo, cout), dtype=np.float64)
+    for r in range(ho):
+        for c in range(wo):
+            patch = x[:, r * stride:r * stride + kh, c * stride:c * stride + kw, :]
+            out[:, r, c, :] = np.tensordot(patch, kernel, axes=([1, 2, 3], [0, 1, 2])) + bias
+    return out
+
+def test_conv2d_matches_naive():
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((2, 9, 7, 3)).astype(np.float32)
+    kernel = rng.standard_normal((3, 3, 3, 4)).astype(np.float32)
+    bias = rng.standard_normal(4).astype(np.float32)
+    for stride in (1, 2):
+        for padding in ('same', 'valid'):
+            got = conv2d(x, kernel, bias, stride, padding)
+            want = _naive_conv(x, kernel, bias, stride, padding)
+            assert got.shape == want.shape, (stride, padding)
+            assert np.allclose(got, want, atol=1e-4), (stride, padding)
+
+def test_keras_parity():
+    try:
+        import tensorflow as tf
+    except ImportError:
+        try:
+            import pytest
+            pytest.skip('TensorFlow not installed')
+        except ImportError:
+            print('[SKIP] test_keras_parity: TensorFlow not installed')
+            return
+    from train_cnn import build_model
+    rng = np.random.default_rng(1)
+    model = build_model(num_classes=7)
+    # Non-trivial BatchNorm statistics, otherwise folding bugs would hide behind identity BNs
+    for layer in model.layers:
+        if layer.__class__.__name__ == 'BatchNormalization':
+            gamma, beta, mean, var = layer.get_weights()
+            layer.set_weights([rng.uniform(0.5, 1.5, gamma.shape), rng.normal(0, 0.2, beta.shape),
+                               rng.normal(0, 0.2, mean.shape), rng.uniform(0.5, 1.5, var.shape)])
+
+    tmp = tempfile.mkdtemp()
+    h5, npz = os.path.join(tmp, 'model.h5'), os.path.join(tmp, 'model.npz')
+    model.save(h5)
+    export_keras(h5, npz)
+    runtime = CNNModel(npz)
+
+    x = rng.uniform(0, 1, (8, 128, 128, 3)).astype(np.float32)
+    want = model.predict(x, verbose=0)
+    got = runtime.predict_proba(x)
+    assert got.shape == want.shape
+    assert np.allclose(got, want, atol=1e-5), np.abs(got - want).max()
+    assert (got.argmax(axis=1) == want.argmax(axis=1)).all()
+
+if __name__ == '__main__':
+    test_conv2d_matches_naive()
+    print('[OK] test_conv2d_matches_naive')
+    test_keras_parity()
+    print('[OK] test_keras_parity')
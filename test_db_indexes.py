@@ -0,0 +1,130 @@
+"""
+The hot per-user queries in database.py must be index lookups, not table scans.
+
+Runs the real functions against a throwaway database, captures the SQL they
+execute and checks EXPLAIN QUERY PLAN for each statement.
+
+Usage:
+    python test_db_indexes.py      (or: python -m pytest test_db_indexes.py)
+"""
+import os
+import tempfile
+import database
+
+def _setup(analyze=True):
+    tmp = tempfile.mkdtemp()
+    database.DB_FILE = os.path.join(tmp, 'test.db')
+    database.close_db()
+    database.migrate()
+    for i in range(30):
+        database.add_prediction(f'user{i % 3}@example.com', 'Gir', 90.0, 'cow.jpg')
+        database.add_feedback(f'user{i % 3}@example.com', 'Gir', i % 2 == 0)
+    if analyze:
+        database.get_db().execute('ANALYZE')
+    return database.get_db()
+
+def _plans(conn, call):
+    """EXPLAIN QUERY PLAN detail lines of every statement run by call(), keyed by SQL"""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    plans = {}
+    for sql in statements:
+        if sql.split()[0].upper() in ('SELECT', 'WITH', 'DELETE', 'UPDATE'):
+            plans[sql] = [r['detail'] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+    assert plans, 'nothing was traced'
+    return plans
+
+def _assert_indexed(plans, table, index):
+    """No statement scans table, and at least one goes through index"""
+    used = False
+    for sql, details in plans.items():
+        for detail in details:
+            if detail.split()[1:2] == [table]:
+                assert detail.startswith('SEARCH'), f'{sql}\n  -> {detail}'
+                assert index in detail or 'PRIMARY KEY' in detail, f'{sql}\n  -> {detail}'
+                used = used or index in detail
+    assert used, f'{index} not used: {plans}'
+
+def test_migrations_are_versioned():
+    conn = _setup()
+    assert database.schema_version(conn) == database.MIGRATIONS[-1][0]
+    assert database.migrate() == []   # second run is a no-op
+
+def test_history_queries_use_index():
+    conn = _setup()
+    user = 'user1@example.com'
+    _assert_indexed(_plans(conn, lambda: database.get_user_history(user)), 'history', 'idx_history_user')
+    stats_plans = _plans(conn, lambda: database.get_user_stats(user))
+    _assert_indexed(stats_plans, 'history', 'idx_history_user')
+    _assert_indexed(stats_plans, 'feedback', 'idx_feedback_user')
+    # The retention prune add_prediction runs once a user is over the limit
+    _assert_indexed(_plans(conn, lambda: database._prune_history(conn, user)), 'history', 'idx_history_user')
+    _assert_indexed(_plans(conn, lambda: database.clear_user_history(user)), 'history', 'idx_history_user')
+
+def test_feedback_queries_use_index():
+    conn = _setup()
+    _assert_indexed(_plans(conn, lambda: database.get_user_feedback('user2@example.com')),
+                    'feedback', 'idx_feedback_user')
+    plan = [r['detail'] for r in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT correct, COUNT(*) FROM feedback WHERE predicted=? GROUP BY correct", ('Gir',))]
+    assert any('idx_feedback_predicted' in d for d in plan), plan
+
+def test_leaderboard_reads_aggregates():
+    # ORDER BY count DESC LIMIT n walks the count index and stops - no sort of the whole table.
+    # Without statistics, as a freshly migrated database has; with a handful of rows
+    # ANALYZE rightly prefers sorting them.
+    conn = _setup(analyze=False)
+    for call, index in ((lambda: database.get_top_breeds(10), 'idx_breed_counts_count'),
+                        (lambda: database.get_top_users(10), 'idx_history_counts_rows')):
+        for sql, details in _plans(conn, call).items():
+            assert any(index in d for d in details), f'{sql}\n  -> {details}'
+            assert not any('TEMP B-TREE' in d for d in details), f'{sql}\n  -> {details}'
+
+def test_aggregates_follow_history():
+    _setup()
+    database.add_predictions('user0@example.com', [('Sahiwal', 80.0, 'a.jpg')] * 40)   # forces a prune
+    database.write_events([('prediction', ('user3@example.com', 'Gir', 70.0, 'b.jpg', '2024-01-01T00:00:00'))])
+    database.clear_user_history('user1@example.com')
+    database.delete_user('user2@example.com')
+    assert database.rebuild_aggregates() == 0
+    history = database.get_all_history()
+    assert database.get_totals()['users'] == len(history) == 2
+    assert dict(database.get_top_users()) == {email: len(rows) for email, rows in history.items()}
+
+def test_admin_listings_use_index():
+    conn = _setup()
+    page = database.list_history(limit=5, user='user1@example.com')
+    _assert_indexed(_plans(conn, lambda: database.list_history(page['next'], 5, user='user1@example.com')),
+                    'history', 'idx_history_user')
+    _assert_indexed(_plans(conn, lambda: database.list_history(limit=5, breed='Gir')), 'history', 'idx_history_breed')
+    _assert_indexed(_plans(conn, lambda: database.list_feedback(limit=5, user='user2@example.com')),
+                    'feedback', 'idx_feedback_user')
+
+def test_streak_survives_pruning():
+    _setup()
+    user = 'streak@example.com'
+    days = ['2024-03-01', '2024-03-02', '2024-03-04', '2024-03-05', '2024-03-06']
+    events = [('prediction', (user, 'Gir', 90.0, 'x.jpg', f'{day}T10:00:{i:02d}'))
+              for day in days for i in range(database.HISTORY_LIMIT)]
+    database.write_events(events)   # each day's rows prune the previous day's
+    assert {h['timestamp'][:10] for h in database.get_user_history(user)} == {'2024-03-06'}
+    assert database.get_user_streak(user) == {'streak': 3, 'total_days': 5}
+    assert database.rebuild_aggregates() == 0
+    database.clear_user_history(user)
+    assert database.get_user_streak(user) == {'streak': 0, 'total_days': 0}
+
+def test_job_claim_uses_index():
+    conn = _setup()
+    database.create_job('train_simple', '{}', None)
+    plans = _plans(conn, lambda: database.claim_next_job('2000-01-01T00:00:00'))
+    _assert_indexed(plans, 'jobs', 'idx_jobs_status')
+
+if __name__ == '__main__':
+    for name, fn in list(globals().items()):
+        if name.startswith('test_'):
+            fn()
+            print(f'[OK] {name}')
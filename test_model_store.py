@@ -0,0 +1,55 @@
+"""
+Numerical parity of model_store.Forest (flattened, memory-mapped node tables) against
+the sklearn RandomForestClassifier it was exported from.
+
+Usage:
+    python test_model_store.py      (or: python -m pytest test_model_store.py)
+"""
+import os
+import tempfile
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from model_store import Forest, export_forest, extend_forest
+
+def _data(seed, n=300, classes=(0, 1, 2, 3)):
+    rng = np.random.default_rng(seed)
+    y = rng.choice(classes, n)
+    X = rng.standard_normal((n, 12)).astype(np.float32) + y[:, None] * 0.5
+    return X, y
+
+def test_forest_parity():
+    X, y = _data(0)
+    model = RandomForestClassifier(n_estimators=15, max_depth=8, random_state=0).fit(X, y)
+    path = os.path.join(tempfile.mkdtemp(), 'forest')
+    export_forest(model, path)
+    X_test, _ = _data(1, n=100)
+    want = model.predict_proba(X_test)
+    for mmap in (True, False):
+        forest = Forest(path, mmap=mmap)
+        got = forest.predict_proba(X_test)
+        assert got.shape == want.shape
+        assert np.allclose(got, want), np.abs(got - want).max()
+        assert (forest.predict(X_test) == model.predict(X_test)).all()
+
+def test_extend_forest_parity():
+    # Trees fitted on a subset of the labels join the base forest with aligned columns
+    X, y = _data(2)
+    base = RandomForestClassifier(n_estimators=10, max_depth=6, random_state=0).fit(X, y)
+    X_new, y_new = _data(3, n=120, classes=(1, 3))
+    extra = RandomForestClassifier(n_estimators=4, max_depth=6, random_state=1).fit(X_new, y_new)
+    tmp = tempfile.mkdtemp()
+    export_forest(base, os.path.join(tmp, 'base'))
+    extend_forest(os.path.join(tmp, 'base'), extra, os.path.join(tmp, 'extended'))
+
+    X_test, _ = _data(4, n=100)
+    extra_proba = np.zeros((len(X_test), 4))
+    extra_proba[:, [1, 3]] = extra.predict_proba(X_test)
+    want = (base.predict_proba(X_test) * 10 + extra_proba * 4) / 14
+    got = Forest(os.path.join(tmp, 'extended')).predict_proba(X_test)
+    assert np.allclose(got, want), np.abs(got - want).max()
+
+if __name__ == '__main__':
+    for name, fn in list(globals().items()):
+        if name.startswith('test_'):
+            fn()
+            print(f'[OK] {name}')
@@ -4,59 +4,34 @@ Run on Google Colab or Python 3.11/3.12 with GPU for best results.
 Expected accuracy: 85-95% vs 14% for Random Forest.
 
 Usage:
-    python train_cnn.py
+    python train_cnn.py              # streams batches from the dataset cache (.dataset_cache/)
+    python train_cnn.py --no-cache   # streams and decodes straight from dataset/
 """
-import os
-import pickle
-import numpy as np
-from pathlib import Path
+import argparse
+import math
 
 DATASET_DIR = 'dataset'
 IMG_SIZE    = 128
 BATCH_SIZE  = 32
 EPOCHS      = 30
 
-def load_data():
-    from PIL import Image
-    X, y, class_names = [], [], []
-    for folder in sorted(Path(DATASET_DIR).iterdir()):
-        if not folder.is_dir(): continue
-        class_names.append(folder.name)
-        idx = len(class_names) - 1
-        images = list(folder.glob('*.jpg')) + list(folder.glob('*.jpeg')) + list(folder.glob('*.png'))
-        for img_path in images[:150]:
-            try:
-                img = Image.open(img_path).convert('RGB').resize((IMG_SIZE, IMG_SIZE))
-                X.append(np.array(img) / 255.0)
-                y.append(idx)
-            except: continue
-    return np.array(X), np.array(y), class_names
-
-def train():
-    try:
-        import tensorflow as tf
-        from tensorflow.keras import layers, models
-        from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
-        from sklearn.model_selection import train_test_split
-    except ImportError:
-        print('[ERROR] TensorFlow not installed. Run: pip install tensorflow==2.13.0')
-        print('[INFO]  Requires Python 3.11 or 3.12')
-        return
-
-    print('='*60)
-    print('CNN TRAINING - CATTLE BREED RECOGNITION')
-    print('='*60)
-
-    print('[1/4] Loading dataset...')
-    X, y, class_names = load_data()
-    print(f'      {len(X)} images, {len(class_names)} breeds')
-
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-
-    y_train_cat = tf.keras.utils.to_categorical(y_train, len(class_names))
-    y_test_cat  = tf.keras.utils.to_categorical(y_test,  len(class_names))
-
-    print('[2/4] Building CNN model...')
+def load_data(use_cache=True, rebuild=False, workers=None):
+    """-> class_names, train source, validation source (data_pipeline.py) - nothing decoded up front
+    beyond the dataset cache, which lives on disk"""
+    from dataset_cache import build as build_cache, scan
+    from jobs import report
+    from data_pipeline import CacheSource, DiskSource, split_files
+    class_names, files = scan(DATASET_DIR)
+    train_files, test_files = split_files(files, test_size=0.2, seed=42)
+    if not use_cache:
+        return class_names, DiskSource(train_files, workers or 4), DiskSource(test_files, workers or 4)
+    cache = build_cache(DATASET_DIR, rebuild=rebuild, workers=workers,
+                        progress=lambda done, total: report(stage='loading', images=done, total=total))
+    return class_names, CacheSource(cache, train_files), CacheSource(cache, test_files)
+
+def build_model(num_classes):
+    """The Sequential CNN - also rebuilt by test_cnn_runtime.py for the NumPy parity check"""
+    from tensorflow.keras import layers, models
     model = models.Sequential([
         # Data augmentation
         layers.RandomFlip('horizontal', input_shape=(IMG_SIZE, IMG_SIZE, 3)),
@@ -95,45 +70,88 @@ def train():
         layers.Dense(512, activation='relu'),
         layers.BatchNormalization(),
         layers.Dropout(0.5),
-        layers.Dense(len(class_names), activation='softmax')
+        layers.Dense(num_classes, activation='softmax')
     ])
+    return model
+
+def train(use_cache=True, rebuild_cache=False, workers=None):
+    try:
+        import tensorflow as tf
+        from tensorflow.keras.callbacks import EarlyStopping, LambdaCallback, ReduceLROnPlateau
+        from data_pipeline import stream
+        from jobs import report
+    except ImportError:
+        print('[ERROR] TensorFlow not installed. Run: pip install tensorflow==2.13.0')
+        print('[INFO]  Requires Python 3.11 or 3.12')
+        return
+
+    print('='*60)
+    print('CNN TRAINING - CATTLE BREED RECOGNITION')
+    print('='*60)
+
+    print('[1/4] Loading dataset...')
+    class_names, train_source, test_source = load_data(use_cache, rebuild_cache, workers)
+    print(f'      {len(train_source) + len(test_source)} images, {len(class_names)} breeds')
+    report(stage='loaded', images=len(train_source) + len(test_source), breeds=len(class_names))
+    train_steps = math.ceil(len(train_source) / BATCH_SIZE)
+    test_steps  = math.ceil(len(test_source) / BATCH_SIZE)
+
+    print('[2/4] Building CNN model...')
+    model = build_model(len(class_names))
 
     model.compile(
         optimizer=tf.keras.optimizers.Adam(learning_rate=0.001),
-        loss='categorical_crossentropy',
+        loss='sparse_categorical_crossentropy',
         metrics=['accuracy']
     )
     model.summary()
 
     callbacks = [
         EarlyStopping(patience=5, restore_best_weights=True, verbose=1),
-        ReduceLROnPlateau(factor=0.5, patience=3, verbose=1)
+        ReduceLROnPlateau(factor=0.5, patience=3, verbose=1),
+        LambdaCallback(on_epoch_end=lambda epoch, logs: report(
+            stage='fitting', epoch=epoch + 1, epochs=EPOCHS,
+            accuracy=round(float(logs.get('accuracy', 0)), 4), val_accuracy=round(float(logs.get('val_accuracy', 0)), 4)))
     ]
 
     print('[3/4] Training...')
     history = model.fit(
-        X_train, y_train_cat,
-        validation_data=(X_test, y_test_cat),
+        stream(train_source, BATCH_SIZE, shuffle=True),
+        steps_per_epoch=train_steps,
+        validation_data=stream(test_source, BATCH_SIZE),
+        validation_steps=test_steps,
         epochs=EPOCHS,
-        batch_size=BATCH_SIZE,
         callbacks=callbacks
     )
 
-    loss, acc = model.evaluate(X_test, y_test_cat, verbose=0)
+    loss, acc = model.evaluate(stream(test_source, BATCH_SIZE, epochs=1), steps=test_steps, verbose=0)
     print(f'\n[4/4] Test Accuracy: {acc*100:.1f}%')
+    report(stage='evaluated', accuracy=round(float(acc), 4))
 
     # Save model in both formats
     model.save('cattle_cnn_model.h5')
     print('[OK] Saved: cattle_cnn_model.h5')
 
-    with open('class_names.txt', 'w') as f:
+    # Own class list: class_names.txt in the root belongs to the RandomForest model
+    with open('cattle_cnn_classes.txt', 'w') as f:
         f.write('\n'.join(class_names))
-    print('[OK] Saved: class_names.txt')
+    print('[OK] Saved: cattle_cnn_classes.txt')
+
+    # NumPy export for the web app - it serves the CNN without TensorFlow
+    from cnn_export import export_keras, register_cnn
+    export_keras('cattle_cnn_model.h5', 'cattle_cnn_model.npz')
+    version = register_cnn('cattle_cnn_model.npz', class_names, {'accuracy': round(float(acc), 4), 'script': 'train_cnn.py'})
+    print(f'[OK] Exported cattle_cnn_model.npz, registered as {version}')
+    report(stage='done', version=version)
 
-    # Also save as sklearn-compatible wrapper for app.py compatibility
     print('\n[DONE] CNN training complete!')
     print(f'       Accuracy: {acc*100:.1f}%')
-    print('       To use in app.py, set USE_CNN=True in app.py')
+    print(f'       To serve it from app.py: python model_registry.py promote {version}')
 
 if __name__ == '__main__':
-    train()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--no-cache', action='store_true', help='stream and decode images from dataset/ every epoch')
+    parser.add_argument('--rebuild-cache', action='store_true', help='decode every image again instead of reusing .dataset_cache/')
+    parser.add_argument('--workers', type=int, help='image decode processes (threads with --no-cache)')
+    args = parser.parse_args()
+    train(not args.no_cache, args.rebuild_cache, args.workers)
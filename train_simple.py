@@ -2,47 +2,38 @@
 Simple ML Model for Cattle Breed Recognition
 Uses scikit-learn (works with Python 3.14)
 """
+import argparse
 import os
 import numpy as np
-from PIL import Image
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
-import pickle
-from pathlib import Path
+from features import DEFAULT_FEATURES, FEATURE_SETS, extract
+from dataset_cache import Rows, build as build_cache
+from jobs import report
+from model_registry import register, promote
 
 IMG_SIZE = 128
 DATASET_DIR = "dataset"
+N_TREES = 100
+TREE_STEP = 10
 
-def load_images():
-    """Load and preprocess images"""
+def load_images(limit=150, rebuild=False, workers=None):
+    """(N, 128, 128, 3) uint8 rows of the dataset cache, decoded the way the app decodes uploads,
+    at most `limit` per breed (150 keeps training fast)"""
     print("[INFO] Loading images...")
-    X, y, class_names = [], [], []
-    
-    for breed_folder in sorted(Path(DATASET_DIR).iterdir()):
-        if not breed_folder.is_dir():
-            continue
-        
-        breed_name = breed_folder.name
-        class_names.append(breed_name)
-        class_idx = len(class_names) - 1
-        
-        images = list(breed_folder.glob("*.jpg")) + list(breed_folder.glob("*.jpeg")) + list(breed_folder.glob("*.png"))
-        print(f"  - {breed_name}: {len(images)} images")
-        
-        for img_path in images[:150]:  # Limit to 150 per breed for speed
-            try:
-                img = Image.open(img_path).convert('RGB')
-                img = img.resize((IMG_SIZE, IMG_SIZE))
-                img_array = np.array(img).flatten() / 255.0
-                X.append(img_array)
-                y.append(class_idx)
-            except:
-                continue
-    
-    return np.array(X), np.array(y), class_names
+    # The cache always covers the whole dataset - train_cnn.py shares it - and the limit is
+    # applied when picking rows, so neither trainer makes the other re-decode
+    cache = build_cache(DATASET_DIR, rebuild=rebuild, workers=workers,
+                        progress=lambda done, total: report(stage='loading', images=done, total=total))
+    rows = cache.first_per_class(limit)
+    labels = cache.labels[rows]
+    counts = np.bincount(labels, minlength=len(cache.class_names))
+    for breed_name, count in zip(cache.class_names, counts):
+        print(f"  - {breed_name}: {count} images")
+    return Rows(cache.pixels, rows), labels, cache.class_names
 
-def train_model():
+def train_model(feature_set=DEFAULT_FEATURES, rebuild_cache=False, workers=None):
     print("="*60)
     print("TRAINING - CATTLE BREED RECOGNITION")
     print("="*60)
@@ -52,8 +43,11 @@ def train_model():
         return
     
     # Load data
-    X, y, class_names = load_images()
-    print(f"\n[OK] Loaded {len(X)} images from {len(class_names)} breeds")
+    pixels, y, class_names = load_images(rebuild=rebuild_cache, workers=workers)
+    print(f"\n[OK] Loaded {len(pixels)} images from {len(class_names)} breeds")
+    report(stage='features', images=len(pixels), total=len(pixels), breeds=len(class_names))
+    X = extract(pixels, feature_set)
+    print(f"[INFO] Features: {feature_set} ({X.shape[1]} per image)")
     
     # Split data
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
@@ -61,27 +55,42 @@ def train_model():
     
     # Train model
     print("\n[INFO] Training Random Forest model...")
-    model = RandomForestClassifier(n_estimators=100, max_depth=20, random_state=42, n_jobs=-1)
-    model.fit(X_train, y_train)
+    # Grown in steps with warm_start (same trees as one fit) so progress can be reported
+    model = RandomForestClassifier(n_estimators=0, max_depth=20, random_state=42, n_jobs=-1, warm_start=True)
+    for trees in range(TREE_STEP, N_TREES + 1, TREE_STEP):
+        model.set_params(n_estimators=trees)
+        model.fit(X_train, y_train)
+        report(stage='fitting', trees_fitted=trees, trees_total=N_TREES)
     
     # Evaluate
     y_pred = model.predict(X_test)
     accuracy = accuracy_score(y_test, y_pred)
     print(f"\n[OK] Accuracy: {accuracy*100:.2f}%")
+    report(stage='evaluated', accuracy=round(float(accuracy), 4))
     
-    # Save model
-    with open('cattle_model.pkl', 'wb') as f:
-        pickle.dump(model, f)
-    
-    with open('class_names.txt', 'w') as f:
-        f.write('\n'.join(class_names))
+    # Register in the model registry and promote - running app workers hot-swap to it
+    version = register(model, class_names, {
+        'accuracy': round(float(accuracy), 4),
+        'train_samples': int(len(X_train)),
+        'test_samples': int(len(X_test)),
+        'features': feature_set,
+        'script': 'train_simple.py',
+    })
+    promote(version)
+    report(stage='done', version=version)
     
     print("\n" + "="*60)
     print("TRAINING COMPLETE!")
     print("="*60)
-    print(f"\nModel saved: cattle_model.pkl")
+    print(f"\nModel saved: models/{version}/ (promoted)")
     print(f"Accuracy: {accuracy*100:.2f}%")
     print(f"Classes: {len(class_names)} breeds")
 
 if __name__ == "__main__":
-    train_model()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--features', choices=sorted(FEATURE_SETS), default=DEFAULT_FEATURES,
+                        help='feature set from features.py (default: %(default)s)')
+    parser.add_argument('--rebuild-cache', action='store_true', help='decode every image again instead of reusing .dataset_cache/')
+    parser.add_argument('--workers', type=int, help='image decode processes (default: one per CPU)')
+    args = parser.parse_args()
+    train_model(args.features, args.rebuild_cache, args.workers)
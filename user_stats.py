@@ -0,0 +1,59 @@
+"""Per-user dashboard statistics - one grouped query (database.get_user_stats) behind a short TTL cache.
+
+/api/stats runs on every page through base.html, so most calls are served from
+memory. Entries are dropped as soon as this worker writes something that
+changes them (predictions, feedback, favorites, cleared history); writes made by
+other gunicorn workers show up within USER_STATS_TTL seconds.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from database import get_user_stats
+
+USER_STATS_TTL  = float(os.environ.get('USER_STATS_TTL', 30))
+USER_STATS_SIZE = int(os.environ.get('USER_STATS_SIZE', 10000))
+
+class UserStats:
+    def __init__(self, ttl=USER_STATS_TTL, max_entries=USER_STATS_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # email -> (expires_at, generation, stats)
+        self._generation = {}           # email -> bumped on invalidate, so a slow read can't re-cache stale stats
+        self.hits = self.misses = 0
+
+    def get(self, user_email):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_email)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_email)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            generation = self._generation.get(user_email, 0)
+        stats = get_user_stats(user_email)
+        with self._lock:
+            if self._generation.get(user_email, 0) == generation:
+                self._entries[user_email] = (now + self.ttl, generation, stats)
+                self._entries.move_to_end(user_email)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return stats
+
+    def invalidate(self, user_email):
+        with self._lock:
+            self._entries.pop(user_email, None)
+            self._generation[user_email] = self._generation.get(user_email, 0) + 1
+
+    def invalidate_events(self, events):
+        """WriteBehind on_write hook: every event kind that touches user stats carries the email first"""
+        for email in {args[0] for kind, args in events if kind in ('prediction', 'feedback')}:
+            self.invalidate(email)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._entries), 'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0}
@@ -0,0 +1,230 @@
+"""Write-behind buffer for append-only analytics writes (searches, history, feedback).
+
+Request handlers enqueue an event and return; a background thread writes
+whatever has accumulated in one transaction (database.write_events) once
+WRITE_BEHIND_BATCH events are waiting or the oldest has waited
+WRITE_BEHIND_MS, so the commit's fsync stays off the request path.
+
+Memory is bounded: with WRITE_BEHIND_MAX events pending, callers block until
+the flusher catches up. close() - registered with atexit - drains the buffer on
+shutdown. Events are only durable once flushed, so a hard kill loses at most
+the last WRITE_BEHIND_MS of them, and a user's own history can lag by as much.
+WRITE_BEHIND=0 writes synchronously instead.
+"""
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from database import write_events
+
+WRITE_BEHIND       = os.environ.get('WRITE_BEHIND', '1') == '1'
+WRITE_BEHIND_BATCH = int(os.environ.get('WRITE_BEHIND_BATCH', 200))
+WRITE_BEHIND_MS    = float(os.environ.get('WRITE_BEHIND_MS', 250))
+WRITE_BEHIND_MAX   = int(os.environ.get('WRITE_BEHIND_MAX', 10000))
+MAX_ATTEMPTS       = 3   # a batch that keeps failing is retried event by event; events that still fail are dropped
+
+def _text(value):
+    # Events share a batch with other users' writes, so anything SQLite can't bind is refused up front
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError(f'Expected text, got {type(value).__name__}')
+
+def _id(value):
+    if value is None or isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise ValueError(f'Expected an integer id, got {type(value).__name__}')
+
+class WriteBehind:
+    def __init__(self, write_fn=write_events, enabled=WRITE_BEHIND, max_batch=WRITE_BEHIND_BATCH,
+                 max_wait_ms=WRITE_BEHIND_MS, max_pending=WRITE_BEHIND_MAX, on_write=None):
+        self.write_fn = write_fn
+        self.on_write = on_write       # called with each batch once it is committed (cache invalidation)
+        self.enabled = enabled
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_pending = max(self.max_batch, int(max_pending))
+        self._queue = deque()          # (enqueued_at, kind, args)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._urgent = 0               # flush() callers waiting: skip the batching window
+        self._enqueued = 0             # sequence numbers, for flush()
+        self._settled = 0
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._written = 0
+        self._dropped = 0
+        self._errors = 0
+        self._blocked = 0
+        self._max_depth = 0
+        self._flush_total = 0.0
+        self._flush_max = 0.0
+        self._lag_max = 0.0
+
+    # Same arguments as the database functions they stand in for; ValueError if one can't be stored
+    def log_search(self, breed):
+        self._put('search', (_text(breed),))
+
+    def add_prediction(self, user_email, breed, confidence, image_name):
+        self._put('prediction', (_text(user_email), _text(breed), round(float(confidence), 2), _text(image_name),
+                                 datetime.now().isoformat()))
+
+    def add_feedback(self, user_email, predicted, correct, actual='', sample_id=None):
+        self._put('feedback', (_text(user_email), _text(predicted), 1 if correct else 0, _text(actual),
+                               datetime.now().isoformat(), _id(sample_id)))
+
+    def _put(self, kind, args):
+        with self._cond:
+            direct = not self.enabled or self._closed
+            if not direct:
+                self._ensure_worker()
+                if len(self._queue) >= self.max_pending:
+                    self._blocked += 1
+                    self._cond.notify_all()
+                    while len(self._queue) >= self.max_pending:
+                        self._cond.wait()
+                self._queue.append((time.perf_counter(), kind, args))
+                self._enqueued += 1
+                self._max_depth = max(self._max_depth, len(self._queue))
+                if len(self._queue) == 1 or len(self._queue) >= self.max_batch:
+                    self._cond.notify_all()
+        if direct:
+            self._write([(kind, args)])
+
+    def _write(self, events):
+        self.write_fn(events)
+        if self.on_write is not None:
+            self.on_write(events)
+
+    def _ensure_worker(self):
+        # Started lazily and re-started after fork: gunicorn workers don't inherit threads,
+        # and events buffered before the fork belong to the parent's flusher
+        if self._pid != os.getpid():
+            self._queue.clear()
+            self._enqueued = self._settled = 0
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = self._queue[0][0] + self.max_wait
+            while len(self._queue) < self.max_batch and not self._urgent:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self._queue), self.max_batch)
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            events = [(kind, args) for _, kind, args in batch]
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                started = time.perf_counter()
+                try:
+                    self.write_fn(events)
+                    error = None
+                    break
+                except Exception as e:
+                    error = e
+                    with self._cond:
+                        self._errors += 1
+                    time.sleep(0.1 * attempt)
+            written, dropped = (events, []) if error is None else self._write_each(events)
+            finished = time.perf_counter()
+            if dropped:
+                print(f'[ERROR] Write-behind dropped {len(dropped)} events: {error}')
+            if written and self.on_write is not None:
+                try:
+                    self.on_write(written)
+                except Exception as e:
+                    print(f'[ERROR] Write-behind on_write hook failed: {e}')
+            with self._cond:
+                if written:
+                    self._batches += 1
+                    self._written += len(written)
+                    self._flush_total += finished - started
+                    self._flush_max = max(self._flush_max, finished - started)
+                    self._lag_max = max(self._lag_max, finished - batch[0][0])
+                self._dropped += len(dropped)
+                self._settled += len(events)
+                self._cond.notify_all()
+
+    def _write_each(self, events):
+        # A batch that keeps failing is usually one bad event: write the rest one by one
+        # so only that event is lost, not everyone else's writes queued alongside it
+        written, dropped = [], []
+        for event in events:
+            try:
+                self.write_fn([event])
+                written.append(event)
+            except Exception:
+                dropped.append(event)
+        return written, dropped
+
+    def flush(self, timeout=None):
+        """Block until everything enqueued so far has been written (or dropped); False on timeout"""
+        with self._cond:
+            if self._pid != os.getpid() or not self._queue and self._settled >= self._enqueued:
+                return True
+            target = self._enqueued
+            self._ensure_worker()
+            self._urgent += 1
+            self._cond.notify_all()
+            try:
+                return self._cond.wait_for(lambda: self._settled >= target, timeout)
+            finally:
+                self._urgent -= 1
+
+    def close(self, timeout=10.0):
+        """Drain the buffer and write synchronously from now on (atexit / shutdown)"""
+        with self._cond:
+            self._closed = True   # new events bypass the buffer while it drains
+        flushed = self.flush(timeout)
+        if not flushed:
+            print(f'[ERROR] Write-behind closed with {len(self._queue)} events unwritten')
+        return flushed
+
+    def stats(self):
+        with self._cond:
+            batches = self._batches or 1
+            return {
+                'enabled': self.enabled,
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'max_pending': self.max_pending,
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self._max_depth,
+                'enqueued': self._enqueued,
+                'written': self._written,
+                'batches': self._batches,
+                'avg_batch_size': round(self._written / batches, 2),
+                'avg_flush_ms': round(self._flush_total / batches * 1000.0, 3),
+                'max_flush_ms': round(self._flush_max * 1000.0, 3),
+                'max_lag_ms': round(self._lag_max * 1000.0, 3),
+                'errors': self._errors,
+                'dropped': self._dropped,
+                'blocked_puts': self._blocked,
+            }
+
+    def configure(self, max_batch=None, max_wait_ms=None, reset_stats=False):
+        """Retune the knobs at runtime (takes effect from the next batch)"""
+        with self._cond:
+            if max_batch is not None:
+                self.max_batch = max(1, int(max_batch))
+            if max_wait_ms is not None:
+                self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+            if reset_stats:
+                self._reset_stats()
+            self._cond.notify_all()